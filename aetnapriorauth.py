@@ -1,10 +1,6 @@
 import time
 import os
 import logging
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
@@ -12,33 +8,28 @@ from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.action_chains import ActionChains
 import traceback
 from datetime import datetime
-import platform
 import sys
 import json
 from dotenv import load_dotenv
+from availity_session import (
+    release_driver, is_logged_in,
+    save_session, restore_session, open_mfa_session, check_mfa_code, generate_totp_code,
+    AVAILITY_WWW_URL, AVAILITY_LOGIN_URL, MFA_WAIT_SECONDS, MFA_RETRY_SECONDS
+)
+from driver_factory import create_driver
+from rpa_result import (
+    ResultRecorder, BotError, recording, timed, STEP_PATTERN, note_step, result_file_from_args, write_result_file,
+    RESULT_SUCCESS, RESULT_PARTIAL, RESULT_FAILED, RESULT_ERROR, ERROR_DRIVER, ERROR_LOGIN, ERROR_STEP
+)
+from rpa_waits import settle, wait_for_ready, wait_for_network_idle, wait_for_frames, wait_for_url_change
+from rpa_forms import fill_field
+from rpa_select2 import find_select2, select2_choose
+from rpa_screenshots import capture_screenshot, wait_for_writes
+from locator_registry import locate
 
 # Load environment variables
 load_dotenv()
 
-# Get data from command line arguments (passed from app.py)
-if len(sys.argv) > 1:
-    data = json.loads(sys.argv[1])
-    member_id = data.get('member_id', '')
-    patient_dob = data.get('date_of_birth', '')
-    patient_name = data.get('patient_name', '')
-    provider_name = data.get('provider_name', '')
-    provider_npi = data.get('npi_number', '')
-    procedure_code = data.get('procedure_code', '')
-    diagnosis_code = data.get('diagnosis_code', '')
-    from_date = data.get('from_date', '')
-    to_date = data.get('to_date', '')
-    primary_insurance = data.get('primary_insurance', '')
-   
-    print(f"Received data - Member ID: {member_id}, DOB: {patient_dob}")
-else:
-    print("No input data provided.")
-    sys.exit(1)
-
 # ===============================
 # ENVIRONMENT VARIABLES
 # ===============================
@@ -50,30 +41,22 @@ PROCEDURE_QUANTITY = os.getenv('PROCEDURE_QUANTITY', '1')
 PROCEDURE_QUANTITY_TYPE = os.getenv('PROCEDURE_QUANTITY_TYPE', 'Days')
 
 # MFA Integration Settings
-FLASK_BASE_URL = "http://localhost:5000"  # Adjust if Flask runs on different port
+FLASK_BASE_URL = os.getenv('FLASK_BASE_URL', 'http://localhost:5000')
 mfa_session_id = None
 
 def request_mfa_session():
     """Request a new MFA session from Flask backend"""
     global mfa_session_id
     try:
-        response = requests.post(f"{FLASK_BASE_URL}/mfa-request", 
-                               json={"script_type": "aetna_prior_auth"}, 
-                               timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            mfa_session_id = data.get('session_id')
-            logger.info(f"MFA session requested: {mfa_session_id}")
-            return True
-        else:
-            logger.error(f"Failed to request MFA session: {response.status_code}")
-            return False
+        mfa_session_id = open_mfa_session(FLASK_BASE_URL, "aetna_prior_auth")
+        logger.info(f"MFA session requested: {mfa_session_id}")
+        return bool(mfa_session_id)
     except Exception as e:
         logger.error(f"Error requesting MFA session: {str(e)}")
         return False
 
 def wait_for_mfa_code(timeout=300):
-    """Poll Flask backend for MFA code"""
+    """Long-poll Flask backend for MFA code; returns as soon as it is entered"""
     global mfa_session_id
     if not mfa_session_id:
         logger.error("No MFA session ID available")
@@ -81,43 +64,47 @@ def wait_for_mfa_code(timeout=300):
         
     start_time = time.time()
     while time.time() - start_time < timeout:
+        polled = time.time()
         try:
-            response = requests.get(f"{FLASK_BASE_URL}/mfa-check/{mfa_session_id}", 
-                                  timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('status') == 'completed':
-                    mfa_code = data.get('code')
-                    logger.info(f"Received MFA code: {mfa_code}")
-                    return mfa_code
-                elif data.get('status') == 'expired':
-                    logger.error("MFA session expired")
-                    return None
-                    
-            # Wait before next poll
-            time.sleep(3)
+            wait = min(MFA_WAIT_SECONDS, max(1, int(timeout - (polled - start_time))))
+            data = check_mfa_code(FLASK_BASE_URL, mfa_session_id, wait=wait)
+            if data.get('status') == 'completed':
+                mfa_code = data.get('code')
+                logger.info("Received MFA code")
+                return mfa_code
+            elif data.get('status') in ('expired', 'unknown', 'unauthorized'):
+                logger.error(f"MFA session {data.get('status')}")
+                return None
+
+            # A backend that answers without holding the request is not polled in a tight loop
+            time.sleep(max(0, 1 - (time.time() - polled)))
             
         except Exception as e:
             logger.error(f"Error checking MFA code: {str(e)}")
-            time.sleep(3)
+            time.sleep(MFA_RETRY_SECONDS)
             
     logger.error("Timeout waiting for MFA code")
     return None
 
 def handle_mfa_challenge(driver):
-    """Handle MFA challenge by requesting session and waiting for code"""
-    logger.info("MFA challenge detected, requesting user input...")
-    
-    # Request MFA session
-    if not request_mfa_session():
-        logger.error("Failed to request MFA session")
-        return False
+    """Handle MFA challenge with a generated authenticator code, or by requesting session and waiting for code"""
+    # Opt-in: the account's authenticator secret is configured (see availity_session)
+    mfa_code = generate_totp_code()
+    if mfa_code:
+        logger.info("MFA challenge detected, using generated authenticator code")
+    else:
+        logger.info("MFA challenge detected, requesting user input...")
         
-    # Wait for user to enter code
-    mfa_code = wait_for_mfa_code()
-    if not mfa_code:
-        logger.error("Failed to get MFA code")
-        return False
+        # Request MFA session
+        if not request_mfa_session():
+            logger.error("Failed to request MFA session")
+            return False
+            
+        # Wait for user to enter code
+        mfa_code = wait_for_mfa_code()
+        if not mfa_code:
+            logger.error("Failed to get MFA code")
+            return False
         
     # Enter the code
     try:
@@ -143,20 +130,23 @@ def handle_mfa_challenge(driver):
 # ===============================
 # SETUP LOGGING
 # ===============================
-os.makedirs("logs", exist_ok=True)
+# Importing the module leaves logging alone so a long-lived worker keeps its
+# own configuration; the CLI calls configure_logging()
 os.makedirs("screenshots", exist_ok=True)
-
-log_filename = f"logs/availity_bot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_filename),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger("availity_bot")
 
+def configure_logging():
+    os.makedirs("logs", exist_ok=True)
+    log_filename = f"logs/availity_bot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_filename),
+            logging.StreamHandler()
+        ]
+    )
+
 # ===============================
 # CONFIGURATION
 # ===============================
@@ -166,7 +156,7 @@ VERY_LONG_TIMEOUT = 120
 
 # Element locators
 LOCATORS = {
-    "login_link": (By.CSS_SELECTOR, "a[href='https://apps.availity.com/web/onboarding/availity-fr-ui/']"),
+    "login_link": (By.CSS_SELECTOR, f"a[href='{AVAILITY_LOGIN_URL}']"),
     "username_input": (By.ID, "userId"),
     "password_input": (By.ID, "password"),
     "sign_in_button": (By.XPATH, "//button[contains(text(), 'Sign In')]"),
@@ -184,6 +174,126 @@ LOCATORS = {
     "final_new_request_button": (By.XPATH, "//button[contains(@class, 'btn-primary') and contains(text(), 'New Request')]"),
 }
 
+# Last-resort finders for the form fields whose ids and attributes drift;
+# locate() only runs them when the learned locator stops matching
+FIND_MEMBER_ID_JS = """
+var inputs = document.querySelectorAll('input[type="text"]');
+for (let input of inputs) {
+    // An error message about Member ID next to the input
+    let parentDiv = input.closest('div');
+    if (parentDiv) {
+        let errorMsg = parentDiv.querySelector('.invalid-feedback');
+        if (errorMsg && errorMsg.textContent.includes('Member ID')) {
+            return input;
+        }
+    }
+    let nearbyText = input.parentElement.textContent || '';
+    if (nearbyText.includes('Member ID')) {
+        return input;
+    }
+    if (input.id.includes('memberId') ||
+        input.name.includes('memberId') ||
+        input.getAttribute('aria-label')?.includes('Member ID')) {
+        return input;
+    }
+}
+return null;
+"""
+
+FIND_DOB_JS = """
+var inputs = document.querySelectorAll('input[type="text"]');
+for (let input of inputs) {
+    if (input.placeholder && input.placeholder.includes('mm/dd/yyyy')) {
+        return input;
+    }
+    let nearbyText = input.parentElement.textContent || '';
+    if (nearbyText.includes('Date of Birth') || nearbyText.includes('DOB')) {
+        return input;
+    }
+    if (input.id.includes('birthDate') ||
+        input.name.includes('birthDate') ||
+        input.getAttribute('aria-label')?.includes('Date of Birth')) {
+        return input;
+    }
+}
+return null;
+"""
+
+FIND_CALENDAR_BUTTON_JS = """
+var buttons = document.querySelectorAll('button');
+for (var i = 0; i < buttons.length; i++) {
+    var btn = buttons[i];
+    if (btn.getAttribute('ng-click') &&
+        btn.getAttribute('ng-click').includes('dateFocus')) {
+        return btn;
+    }
+    if (btn.getAttribute('aria-label') === 'Calendar' ||
+        btn.className.includes('calendar') ||
+        btn.innerHTML.includes('calendar')) {
+        return btn;
+    }
+    // Button right after a date input
+    var previous = btn.previousElementSibling;
+    if (previous && previous.tagName === 'INPUT' &&
+        (previous.placeholder.includes('__/__/____') ||
+         previous.id.includes('fromDate'))) {
+        return btn;
+    }
+}
+return null;
+"""
+
+FROM_DATE_SELECTORS = [
+    "input[id*='fromDate']",
+    "input[id*='FromDate']",
+    "input[name*='fromDate']",
+    "input[placeholder*='__/__/____']",
+    "input.hasDatepicker",
+    "input[ng-model*='fromDate']"
+]
+
+FIND_FROM_DATE_JS = """
+var inputs = document.querySelectorAll('input[type="text"]');
+for (var i = 0; i < inputs.length; i++) {
+    var input = inputs[i];
+    if ((input.id && input.id.toLowerCase().includes('fromdate')) ||
+        (input.name && input.name.toLowerCase().includes('fromdate'))) {
+        return input;
+    }
+    if (input.placeholder && input.placeholder.includes('__/__/____')) {
+        return input;
+    }
+    // Inside the form group of the "From Date" label
+    var labels = document.querySelectorAll('label');
+    for (var j = 0; j < labels.length; j++) {
+        if (labels[j].textContent.includes('From Date')) {
+            var container = labels[j].closest('.form-group');
+            if (container && container.contains(input)) {
+                return input;
+            }
+        }
+    }
+}
+return null;
+"""
+
+FIND_QUANTITY_JS = """
+var labels = document.querySelectorAll('label');
+for (let label of labels) {
+    if (label.textContent.includes('Quantity') || label.textContent.includes('Service Quantity')) {
+        let input = label.closest('.form-group').querySelector('input[type="text"]');
+        if (input) return input;
+    }
+}
+var inputs = document.querySelectorAll('input[type="text"]');
+for (let input of inputs) {
+    if (input.id && (input.id.includes('quantity') || input.id.includes('Quantity'))) {
+        return input;
+    }
+}
+return null;
+"""
+
 def format_date_for_form(date_str):
     """Format date string to MM/DD/YYYY format for form input"""
     if not date_str:
@@ -203,73 +313,24 @@ def format_date_for_form(date_str):
         return date_str
 
 def setup_chrome_driver():
-    """Setup Chrome driver with automatic detection for Flask"""
+    """Start Chrome with the shared bot profile; None when no ChromeDriver works"""
     logger.info("🔧 Setting up Chrome driver...")
-   
-    system = platform.system()
-    machine = platform.machine()
-    logger.info(f"🖥️ Detected system: {system} {machine}")
-   
-    options = Options()
-    # Removed headless mode - browser will be visible
-    options.add_argument("--start-maximized")
-    options.add_argument("--disable-extensions")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-   
-    driver = None
-   
-    # Try using webdriver-manager first
-    try:
-        from webdriver_manager.chrome import ChromeDriverManager
-        logger.info("Using webdriver-manager...")
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=options)
-        logger.info("Chrome driver initialized successfully")
-        return driver
-    except ImportError:
-        logger.warning("webdriver-manager not installed")
-    except Exception as e:
-        logger.warning(f"webdriver-manager failed: {str(e)}")
-   
-    # Try system ChromeDriver
     try:
-        logger.info("Trying system ChromeDriver...")
-        driver = webdriver.Chrome(options=options)
-        logger.info("Chrome driver initialized successfully")
-        return driver
+        driver = create_driver("availity")
     except Exception as e:
-        logger.warning(f"System ChromeDriver failed: {str(e)}")
-   
-    # Try local chromedriver
-    try:
-        logger.info("Trying local chromedriver...")
-        service = Service("./chromedriver")
-        driver = webdriver.Chrome(service=service, options=options)
-        logger.info("Chrome driver initialized successfully")
-        return driver
-    except Exception as e:
-        logger.warning(f"Local chromedriver failed: {str(e)}")
-   
-    if not driver:
-        logger.error("Failed to initialize Chrome driver")
+        logger.error(f"Failed to initialize Chrome driver: {str(e)}")
         return None
-   
+    logger.info("Chrome driver initialized successfully")
     return driver
 
 # ===============================
 # HELPER FUNCTIONS
 # ===============================
 def take_screenshot(driver, name):
-    """Take a screenshot with a timestamp and organize in folders"""
-    timestamp = time.strftime("%Y%m%d-%H%M%S")
-    filename = f"screenshots/{name}_{timestamp}.png"
-    try:
-        driver.save_screenshot(filename)
+    """Capture a screenshot under the run's screenshot policy; returns its path if it is written"""
+    filename = capture_screenshot(driver, name)
+    if filename:
         logger.info(f"Saved screenshot: {filename}")
-    except Exception as e:
-        logger.error(f"Failed to take screenshot: {str(e)}")
     return filename
 
 def wait_for_page_load(driver, timeout=TIMEOUT):
@@ -285,8 +346,8 @@ def wait_for_page_load(driver, timeout=TIMEOUT):
     except Exception as e:
         logger.warning(f"Timed out waiting for readyState: {str(e)}")
 
-    # Additional buffer time
-    time.sleep(2)
+    # Wait for the XHR calls that render the page instead of a fixed buffer
+    wait_for_network_idle(driver)
     logger.info(f"Total page load wait: {time.time() - start_time:.2f} seconds")
 
 def safe_click(driver, element, description="element", max_attempts=3):
@@ -295,8 +356,7 @@ def safe_click(driver, element, description="element", max_attempts=3):
 
     # First scroll to the element and wait for it to be clickable
     try:
-        driver.execute_script("arguments[0].scrollIntoView({block: 'center', behavior: 'smooth'});", element)
-        time.sleep(1)  # Wait for scroll to complete
+        driver.execute_script("arguments[0].scrollIntoView({block: 'center', behavior: 'instant'});", element)
     except Exception as e:
         logger.warning(f"Failed to scroll to {description}: {str(e)}")
 
@@ -311,7 +371,7 @@ def safe_click(driver, element, description="element", max_attempts=3):
             try:
                 method["action"]()
                 logger.info(f"{method['name']} on {description} successful (attempt {attempt+1})")
-                time.sleep(1)  # Wait for click to take effect
+                settle(driver)  # Let the requests the click started finish
                 return True
             except Exception as e:
                 logger.debug(f" {method['name']} failed on attempt {attempt+1}: {str(e)}")
@@ -348,406 +408,32 @@ def navigate_to_url(driver, url, description="page"):
         take_screenshot(driver, f"navigation_failed_{description.replace(' ', '_')}")
         return False
 
+# ===============================
+# SELECT2 DROPDOWNS
+# ===============================
 def handle_select2_field(driver, field_label, value_to_select):
-    """
-    Handle Select2 dropdown fields by properly targeting the search input that appears
-    after clicking the dropdown
-    """
-    logger.info(f" Handling Select2 field for {field_label}...")
-   
+    """Search the Select2 field labelled field_label for value_to_select and pick the best match"""
+    logger.info(f" Handling Select2 field for {field_label} with value: {value_to_select}")
+    slug = field_label.replace(' ', '_').lower()
     try:
-        # Find all select2-chosen elements (the dropdown triggers)
-        select2_elements = driver.find_elements(By.CSS_SELECTOR, "span.select2-chosen")
-        logger.info(f" Found {len(select2_elements)} select2-chosen elements")
-       
-        take_screenshot(driver, f"all_select2_elements_for_{field_label.replace(' ', '_').lower()}")
-       
-        # Find the dropdown for our field based on parent text
-        field_element = None
-        for i, element in enumerate(select2_elements):
-            try:
-                parent_text = driver.execute_script("return arguments[0].parentElement.parentElement.textContent || '';", element)
-                logger.info(f" Element {i} parent text: {parent_text}")
-               
-                if field_label in parent_text:
-                    field_element = element
-                    logger.info(f" Found {field_label} dropdown with parent text: {parent_text}")
-                    break
-            except:
-                logger.info(f" Couldn't get parent text for element {i}")
-       
-        # If we couldn't find it by parent text, try using JavaScript
-        if not field_element:
-            logger.info(f" Trying JavaScript to find {field_label} dropdown")
-            field_element = driver.execute_script(f"""
-                var labels = document.querySelectorAll('label');
-                for (let label of labels) {{
-                    if (label.textContent.includes('{field_label}')) {{
-                        let container = label.closest('div').querySelector('.select2-container');
-                        if (container) {{
-                            return container.querySelector('span.select2-chosen') || container;
-                        }}
-                    }}
-                }}
-                return null;
-            """)
-       
-        if not field_element:
+        container = find_select2(driver, field_label)
+        if not container:
             logger.error(f" Could not find dropdown for {field_label}")
-            take_screenshot(driver, f"{field_label.replace(' ', '_').lower()}_dropdown_not_found")
+            take_screenshot(driver, f"{slug}_dropdown_not_found")
             return False
-       
-        # Click the dropdown to open it
-        safe_click(driver, field_element, f"{field_label} dropdown")
-        logger.info(f" Clicked {field_label} dropdown")
-        time.sleep(1)
-        take_screenshot(driver, f"after_{field_label.replace(' ', '_').lower()}_dropdown_click")
-       
-        # Look for any visible search input
-        try:
-            logger.info(" Looking for any visible search input")
-            search_inputs = driver.find_elements(By.CSS_SELECTOR, "input.select2-input, div.select2-search input")
-           
-            search_input = None
-            for input_elem in search_inputs:
-                if input_elem.is_displayed():
-                    search_input = input_elem
-                    logger.info(" Found visible search input")
-                    break
-        except Exception as e:
-            logger.info(f" Could not find any visible search input: {str(e)}")
-       
-        # If we found the search input, type into it and press Enter
-        if search_input:
-            # Click to focus the input
-            ActionChains(driver).move_to_element(search_input).click().perform()
-            logger.info(" Clicked search input")
-            time.sleep(0.5)
-           
-            # Clear any existing value
-            search_input.clear()
-           
-            # Type the value with a delay between characters
-            logger.info(f" Typing '{value_to_select}' in search field")
-            for char in value_to_select:
-                search_input.send_keys(char)
-                time.sleep(0.2)  # Slower typing to ensure stability
-           
-            time.sleep(1)  # Wait for search results
-            take_screenshot(driver, f"after_typing_{field_label.replace(' ', '_').lower()}")
-           
-            # Press Enter to select the first matching option
-            search_input.send_keys(Keys.ENTER)
-            logger.info(" Pressed Enter to select option")
-            time.sleep(1)
-            take_screenshot(driver, f"after_{field_label.replace(' ', '_').lower()}_selection")
-            return True
-        else:
-            logger.error(f" Could not find search input for {field_label}")
-            return False
-           
+        chosen = select2_choose(driver, container, value_to_select, description=field_label)
     except Exception as e:
         logger.error(f" Error handling Select2 field for {field_label}: {str(e)}")
-        take_screenshot(driver, f"{field_label.replace(' ', '_').lower()}_error")
+        take_screenshot(driver, f"{slug}_error")
         return False
 
-# ===============================
-# IMPROVED DROPDOWN SELECTION FUNCTIONS
-# ===============================
-def handle_select2_dropdown_with_selection(driver, field_label, value_to_select):
-    """
-    Improved function to handle Select2 dropdown fields with proper selection confirmation
-    """
-    logger.info(f" Handling Select2 dropdown for {field_label} with value: {value_to_select}")
-   
-    try:
-        # Find the dropdown container
-        dropdown_container = None
-       
-        # Method 1: Find by label text
-        try:
-            dropdown_container = driver.execute_script(f"""
-                var labels = document.querySelectorAll('label');
-                for (let label of labels) {{
-                    if (label.textContent.includes('{field_label}')) {{
-                        let container = label.closest('.form-group').querySelector('.select2-container');
-                        if (container) return container;
-                    }}
-                }}
-                return null;
-            """)
-            if dropdown_container:
-                logger.info(f" Found {field_label} dropdown by label")
-        except Exception as e:
-            logger.info(f" Method 1 failed: {str(e)}")
-       
-        # Method 2: Find by ID pattern if Method 1 failed
-        if not dropdown_container:
-            try:
-                field_id_pattern = field_label.lower().replace(" ", "").replace("code", "Code")
-                dropdown_container = driver.find_element(By.CSS_SELECTOR, f"div.select2-container[id*='{field_id_pattern}']")
-                logger.info(f" Found {field_label} dropdown by ID pattern")
-            except Exception as e:
-                logger.info(f" Method 2 failed: {str(e)}")
-       
-        if not dropdown_container:
-            logger.error(f" Could not find dropdown container for {field_label}")
-            return False
-       
-        # Step 1: Click to open the dropdown
-        logger.info(f" Clicking {field_label} dropdown to open it")
-        safe_click(driver, dropdown_container, f"{field_label} dropdown")
-        time.sleep(2)  # Wait for dropdown to open
-        take_screenshot(driver, f"after_{field_label.lower().replace(' ', '_')}_dropdown_click")
-       
-        # Step 2: Find the search input that appears after clicking
-        search_input = None
-        search_attempts = 0
-        max_search_attempts = 3
-       
-        while not search_input and search_attempts < max_search_attempts:
-            try:
-                # Look for visible search inputs
-                search_inputs = driver.find_elements(By.CSS_SELECTOR, "input.select2-input")
-                for input_elem in search_inputs:
-                    if input_elem.is_displayed() and input_elem.is_enabled():
-                        search_input = input_elem
-                        logger.info(f" Found visible search input for {field_label}")
-                        break
-               
-                if not search_input:
-                    # Try alternative selectors
-                    alt_selectors = [
-                        "div.select2-search input",
-                        ".select2-dropdown input",
-                        "input[class*='select2']"
-                    ]
-                   
-                    for selector in alt_selectors:
-                        try:
-                            inputs = driver.find_elements(By.CSS_SELECTOR, selector)
-                            for input_elem in inputs:
-                                if input_elem.is_displayed() and input_elem.is_enabled():
-                                    search_input = input_elem
-                                    logger.info(f" Found search input using selector: {selector}")
-                                    break
-                            if search_input:
-                                break
-                        except:
-                            continue
-               
-                if not search_input:
-                    search_attempts += 1
-                    logger.info(f" Search input not found, attempt {search_attempts}/{max_search_attempts}")
-                    time.sleep(1)
-                   
-            except Exception as e:
-                logger.info(f" Error finding search input: {str(e)}")
-                search_attempts += 1
-                time.sleep(1)
-       
-        if not search_input:
-            logger.error(f" Could not find search input for {field_label} after {max_search_attempts} attempts")
-            return False
-       
-        # Step 3: Clear and type the value
-        logger.info(f" Typing '{value_to_select}' into search field")
-        try:
-            # Focus on the input
-            ActionChains(driver).move_to_element(search_input).click().perform()
-            time.sleep(0.5)
-           
-            # Clear any existing value
-            search_input.clear()
-            time.sleep(0.5)
-           
-            # Type the value character by character for better reliability
-            for char in value_to_select:
-                search_input.send_keys(char)
-                time.sleep(0.1)  # Small delay between characters
-           
-            logger.info(f" Successfully typed '{value_to_select}'")
-            time.sleep(2)  # Wait for search results to appear
-            take_screenshot(driver, f"after_typing_{field_label.lower().replace(' ', '_')}")
-           
-        except Exception as e:
-            logger.error(f" Error typing into search field: {str(e)}")
-            return False
-       
-        # Step 4: Wait for and select the matching option
-        logger.info(f" Looking for matching option containing '{value_to_select}'")
-       
-        selection_successful = False
-        selection_methods = [
-            # Method 1: Press Enter to select first match
-            {
-                "name": "Press Enter",
-                "action": lambda: search_input.send_keys(Keys.ENTER)
-            },
-            # Method 2: Press Down Arrow then Enter
-            {
-                "name": "Arrow Down + Enter",
-                "action": lambda: (
-                    search_input.send_keys(Keys.ARROW_DOWN),
-                    time.sleep(0.5),
-                    search_input.send_keys(Keys.ENTER)
-                )
-            },
-            # Method 3: Click on the first visible result
-            {
-                "name": "Click first result",
-                "action": lambda: click_first_dropdown_result(driver, value_to_select)
-            }
-        ]
-       
-        for method in selection_methods:
-            try:
-                logger.info(f" Trying selection method: {method['name']}")
-                method["action"]()
-                time.sleep(2)  # Wait for selection to register
-               
-                # Verify selection was successful
-                if verify_dropdown_selection(driver, field_label, value_to_select):
-                    logger.info(f" Selection successful using method: {method['name']}")
-                    selection_successful = True
-                    break
-                else:
-                    logger.info(f" Method {method['name']} did not result in successful selection")
-                   
-            except Exception as e:
-                logger.info(f" Method {method['name']} failed: {str(e)}")
-                continue
-       
-        if selection_successful:
-            take_screenshot(driver, f"after_{field_label.lower().replace(' ', '_')}_selection_success")
-            return True
-        else:
-            logger.error(f" All selection methods failed for {field_label}")
-            take_screenshot(driver, f"{field_label.lower().replace(' ', '_')}_selection_failed")
-            return False
-           
-    except Exception as e:
-        logger.error(f" Error handling Select2 dropdown for {field_label}: {str(e)}")
-        take_screenshot(driver, f"{field_label.lower().replace(' ', '_')}_error")
-        return False
-
-def click_first_dropdown_result(driver, expected_value):
-    """Click on the first dropdown result that matches or contains the expected value"""
-    try:
-        # Look for dropdown results
-        result_selectors = [
-            ".select2-results li",
-            ".select2-results div",
-            ".select2-result",
-            "[class*='select2-result']"
-        ]
-       
-        for selector in result_selectors:
-            try:
-                results = driver.find_elements(By.CSS_SELECTOR, selector)
-                for result in results:
-                    if result.is_displayed() and result.text.strip():
-                        result_text = result.text.strip()
-                        if expected_value.lower() in result_text.lower() or result_text.lower() in expected_value.lower():
-                            logger.info(f" Found matching result: {result_text}")
-                            ActionChains(driver).move_to_element(result).click().perform()
-                            return True
-                       
-                # If no exact match, click the first visible result
-                if results and results[0].is_displayed():
-                    first_result_text = results[0].text.strip()
-                    logger.info(f" No exact match found, clicking first result: {first_result_text}")
-                    ActionChains(driver).move_to_element(results[0]).click().perform()
-                    return True
-                   
-            except Exception as e:
-                logger.debug(f" Selector {selector} failed: {str(e)}")
-                continue
-       
-        return False
-       
-    except Exception as e:
-        logger.error(f" Error clicking dropdown result: {str(e)}")
-        return False
-
-def verify_dropdown_selection(driver, field_label, expected_value):
-    """Verify that the dropdown selection was successful"""
-    try:
-        # Wait a moment for the selection to register
-        time.sleep(1)
-       
-        # Check if the dropdown now shows the selected value
-        verification_methods = [
-            # Method 1: Check the select2-chosen span text
-            lambda: driver.execute_script(f"""
-                var labels = document.querySelectorAll('label');
-                for (let label of labels) {{
-                    if (label.textContent.includes('{field_label}')) {{
-                        let container = label.closest('.form-group').querySelector('.select2-container');
-                        if (container) {{
-                            let chosen = container.querySelector('.select2-chosen');
-                            return chosen ? chosen.textContent.trim() : '';
-                        }}
-                    }}
-                }}
-                return '';
-            """),
-           
-            # Method 2: Check for any element containing the expected value
-            lambda: driver.execute_script(f"""
-                var elements = document.querySelectorAll('.select2-chosen, .select2-selection__rendered');
-                for (let elem of elements) {{
-                    if (elem.textContent.includes('{expected_value}')) {{
-                        return elem.textContent.trim();
-                    }}
-                }}
-                return '';
-            """)
-        ]
-       
-        for i, method in enumerate(verification_methods):
-            try:
-                selected_text = method()
-                if selected_text and (expected_value.lower() in selected_text.lower() or
-                                    selected_text.lower() in expected_value.lower()):
-                    logger.info(f" Verification method {i+1} confirmed selection: {selected_text}")
-                    return True
-                elif selected_text:
-                    logger.info(f" Verification method {i+1} found text but no match: {selected_text}")
-            except Exception as e:
-                logger.debug(f" Verification method {i+1} failed: {str(e)}")
-       
-        # Final check: see if the dropdown is no longer showing placeholder text
-        try:
-            placeholder_indicators = ["Select", "Choose", "Pick", "Search"]
-            current_text = driver.execute_script(f"""
-                var labels = document.querySelectorAll('label');
-                for (let label of labels) {{
-                    if (label.textContent.includes('{field_label}')) {{
-                        let container = label.closest('.form-group').querySelector('.select2-container');
-                        if (container) {{
-                            let chosen = container.querySelector('.select2-chosen');
-                            return chosen ? chosen.textContent.trim() : '';
-                        }}
-                    }}
-                }}
-                return '';
-            """)
-           
-            if current_text and not any(indicator.lower() in current_text.lower() for indicator in placeholder_indicators):
-                logger.info(f" Selection appears successful - dropdown shows: {current_text}")
-                return True
-               
-        except Exception as e:
-            logger.debug(f" Final verification check failed: {str(e)}")
-       
-        logger.warning(f" Could not verify selection for {field_label}")
-        return False
-       
-    except Exception as e:
-        logger.error(f" Error verifying dropdown selection: {str(e)}")
+    if not chosen:
+        take_screenshot(driver, f"{slug}_selection_failed")
         return False
+    take_screenshot(driver, f"after_{slug}_selection")
+    return True
 
+@timed()
 def click_authorization_request(driver):
     """Click on the Authorization Request link after navigating to Auth & Referrals page"""
     logger.info(" Looking for Authorization Request link...")
@@ -790,6 +476,7 @@ def click_authorization_request(driver):
        
     return False
 
+@timed()
 def fill_authorization_form(driver):
     """Fill out the Authorization Request form with Aetna as payer and Outpatient Authorization as request type"""
     logger.info(" Starting to fill Authorization Request form...")
@@ -802,8 +489,8 @@ def fill_authorization_form(driver):
     except Exception as e:
         logger.warning(f" Error switching to default content: {str(e)}")
 
-    # Wait for the form to be fully loaded
-    time.sleep(3)
+    # Wait for the form iframes to be attached and loaded
+    wait_for_frames(driver, 2)
 
     # Switch to iframe 2 as per screenshots
     frames = driver.find_elements(By.TAG_NAME, "iframe")
@@ -849,46 +536,12 @@ def fill_authorization_form(driver):
                     take_screenshot(driver, "payer_dropdown_not_found")
                     return False
                
-                # Click the Payer dropdown to open it
-                safe_click(driver, payer_element, "Payer dropdown")
-                logger.info(" Clicked Payer dropdown")
-                time.sleep(1)
-                take_screenshot(driver, "after_payer_dropdown_click")
-               
-                # DIRECT SELECTION: Now that the dropdown is open, directly select AETNA
-                try:
-                    logger.info(" Looking for AETNA option in dropdown")
-                    # Try to find the AETNA option directly
-                    aetna_option = WebDriverWait(driver, 5).until(
-                        EC.element_to_be_clickable((By.XPATH, "//div[contains(text(), 'AETNA (COMMERCIAL & MEDICARE)')]"))
-                    )
-                   
-                    # Click the AETNA option
-                    safe_click(driver, aetna_option, "AETNA option")
-                    logger.info(" Selected AETNA (COMMERCIAL & MEDICARE)")
-                    time.sleep(2)  # Wait for selection to register
-                    take_screenshot(driver, "after_aetna_selection")
-                except Exception as e:
-                    logger.error(f" Failed to select AETNA option: {str(e)}")
-                   
-                    # Fallback: Try using JavaScript to select AETNA
-                    try:
-                        logger.info(" Trying JavaScript to select AETNA")
-                        driver.execute_script("""
-                            var options = document.querySelectorAll('.select2-results div');
-                            for (var i = 0; i < options.length; i++) {
-                                if (options[i].textContent.includes('AETNA')) {
-                                    options[i].click();
-                                    break;
-                                }
-                            }
-                        """)
-                        logger.info(" Selected AETNA using JavaScript")
-                        time.sleep(2)
-                        take_screenshot(driver, "after_aetna_selection_js")
-                    except Exception as e:
-                        logger.error(f" JavaScript selection failed: {str(e)}")
-                        return False
+                # Open the dropdown and pick AETNA from its list
+                if not select2_choose(driver, payer_element, "AETNA (COMMERCIAL & MEDICARE)", search=False, description="Payer"):
+                    take_screenshot(driver, "payer_selection_failed")
+                    return False
+                logger.info(" Selected AETNA (COMMERCIAL & MEDICARE)")
+                take_screenshot(driver, "after_aetna_selection")
                
             except Exception as e:
                 logger.error(f" Error selecting Payer: {str(e)}")
@@ -926,46 +579,12 @@ def fill_authorization_form(driver):
                     take_screenshot(driver, "request_type_dropdown_not_found")
                     return False
                
-                # Click the Request Type dropdown
-                safe_click(driver, request_type_element, "Request Type dropdown")
-                logger.info(" Clicked Request Type dropdown")
-                time.sleep(1)
-                take_screenshot(driver, "after_request_type_dropdown_click")
-               
-                # DIRECT SELECTION: Now that the dropdown is open, directly select Outpatient Authorization
-                try:
-                    logger.info(" Looking for Outpatient Authorization option in dropdown")
-                    # Try to find the Outpatient Authorization option directly
-                    outpatient_option = WebDriverWait(driver, 5).until(
-                        EC.element_to_be_clickable((By.XPATH, "//div[contains(text(), 'Outpatient Authorization')]"))
-                    )
-                   
-                    # Click the Outpatient Authorization option
-                    safe_click(driver, outpatient_option, "Outpatient Authorization option")
-                    logger.info(" Selected Outpatient Authorization")
-                    time.sleep(2)  # Wait for selection to register
-                    take_screenshot(driver, "after_outpatient_selection")
-                except Exception as e:
-                    logger.error(f" Failed to select Outpatient Authorization option: {str(e)}")
-                   
-                    # Fallback: Try using JavaScript to select Outpatient Authorization
-                    try:
-                        logger.info(" Trying JavaScript to select Outpatient Authorization")
-                        driver.execute_script("""
-                            var options = document.querySelectorAll('.select2-results div');
-                            for (var i = 0; i < options.length; i++) {
-                                if (options[i].textContent.includes('Outpatient')) {
-                                    options[i].click();
-                                    break;
-                                }
-                            }
-                        """)
-                        logger.info(" Selected Outpatient Authorization using JavaScript")
-                        time.sleep(2)
-                        take_screenshot(driver, "after_outpatient_selection_js")
-                    except Exception as e:
-                        logger.error(f" JavaScript selection failed: {str(e)}")
-                        return False
+                # Open the dropdown and pick Outpatient Authorization from its list
+                if not select2_choose(driver, request_type_element, "Outpatient Authorization", search=False, description="Request Type"):
+                    take_screenshot(driver, "request_type_selection_failed")
+                    return False
+                logger.info(" Selected Outpatient Authorization")
+                take_screenshot(driver, "after_outpatient_selection")
                
             except Exception as e:
                 logger.error(f" Error selecting Request Type: {str(e)}")
@@ -998,7 +617,6 @@ def handle_chrome_save_password_popup(driver):
         # Click the "No" button
         safe_click(driver, save_password_no_button, "Chrome save password 'No' button")
         logger.info(" Clicked 'No' on Chrome save password popup")
-        time.sleep(1)
         take_screenshot(driver, "after_chrome_popup_no_click")
         return True
     except Exception as e:
@@ -1013,6 +631,7 @@ def fill_place_of_service(driver):
     # Using the handle_select2_field function from aetnapriorauthcopy1.py
     return handle_select2_field(driver, "Place of Service", PLACE_OF_SERVICE)
 
+@timed()
 def fill_patient_info_form(driver, patient_data):
     """Fill out the Patient Information form with Member ID, DOB, and Provider"""
     member_id = patient_data.get("Member ID", "")
@@ -1029,8 +648,8 @@ def fill_patient_info_form(driver, patient_data):
     except Exception as e:
         logger.warning(f" Error switching to default content: {str(e)}")
 
-    # Wait for the form to be fully loaded
-    time.sleep(3)
+    # Wait for the form iframes to be attached and loaded
+    wait_for_frames(driver, 2)
 
     # Switch to iframe 2 as per instructions
     frames = driver.find_elements(By.TAG_NAME, "iframe")
@@ -1046,77 +665,20 @@ def fill_patient_info_form(driver, patient_data):
             try:
                 logger.info(" Looking for Member ID field...")
                
-                # Try to find the Member ID input field
-                member_id_field = None
-               
-                # Try different approaches to find the Member ID field
-                try:
-                    member_id_field = driver.find_element(By.CSS_SELECTOR, "input#subscriber\\.memberId")
-                    logger.info(" Found Member ID field by ID")
-                except:
-                    logger.info(" Could not find Member ID field by ID, trying other methods")
-               
-                if not member_id_field:
-                    try:
-                        member_id_field = driver.find_element(By.XPATH, "//input[contains(@aria-labelledby, 'subscriber.memberId')]")
-                        logger.info(" Found Member ID field by aria-labelledby")
-                    except:
-                        logger.info(" Could not find Member ID field by aria-labelledby")
-               
-                # If still not found, use JavaScript to find by nearby text or attributes
-                if not member_id_field:
-                    logger.info(" Using JavaScript to find Member ID field")
-                    member_id_field = driver.execute_script("""
-                        // Find all input fields
-                        var inputs = document.querySelectorAll('input[type="text"]');
-                       
-                        // Look for the input field that's near a label with "Member ID"
-                        for (let input of inputs) {
-                            // Check if this input has an error message about Member ID
-                            let parentDiv = input.closest('div');
-                            if (parentDiv) {
-                                let errorMsg = parentDiv.querySelector('.invalid-feedback');
-                                if (errorMsg && errorMsg.textContent.includes('Member ID')) {
-                                    return input;
-                                }
-                            }
-                           
-                            // Check if this input is near a label with "Member ID"
-                            let nearbyText = input.parentElement.textContent || '';
-                            if (nearbyText.includes('Member ID')) {
-                                return input;
-                            }
-                           
-                            // Check attributes
-                            if (input.id.includes('memberId') ||
-                                input.name.includes('memberId') ||
-                                input.getAttribute('aria-label')?.includes('Member ID')) {
-                                return input;
-                            }
-                        }
-                       
-                        return null;
-                    """)
+                member_id_field = locate(driver, "aetna.member_id", [
+                    ("id", (By.CSS_SELECTOR, "input#subscriber\\.memberId")),
+                    ("aria_labelledby", (By.XPATH, "//input[contains(@aria-labelledby, 'subscriber.memberId')]")),
+                    ("nearby_text", lambda d: d.execute_script(FIND_MEMBER_ID_JS)),
+                ])
                
                 if member_id_field:
                     logger.info(" Found Member ID field")
                    
                     # Highlight the field to confirm in screenshots
                     driver.execute_script("arguments[0].style.border='5px solid green'", member_id_field)
-                    time.sleep(1)
-                   
-                    # Clear field first
-                    member_id_field.clear()
-                    time.sleep(0.5)
-                   
-                    # Click to focus
-                    ActionChains(driver).move_to_element(member_id_field).click().perform()
-                    time.sleep(0.5)
                    
-                    # Send keys with delay
-                    for char in member_id:
-                        member_id_field.send_keys(char)
-                        time.sleep(0.1)
+                    # Set the value and fire the events the form listens to
+                    fill_field(driver, member_id_field, member_id, "member_id")
                    
                     logger.info(f" Filled Member ID: {member_id}")
                     take_screenshot(driver, "member_id_filled")
@@ -1132,73 +694,20 @@ def fill_patient_info_form(driver, patient_data):
             try:
                 logger.info(" Looking for Patient Date of Birth field...")
                
-                # Try to find the DOB input field
-                dob_field = None
-               
-                # Try different approaches to find the DOB field
-                try:
-                    dob_field = driver.find_element(By.CSS_SELECTOR, "input#patient\\.birthDate")
-                    logger.info(" Found Patient DOB field by ID")
-                except:
-                    logger.info(" Could not find Patient DOB field by ID, trying other methods")
-               
-                if not dob_field:
-                    try:
-                        dob_field = driver.find_element(By.XPATH, "//input[contains(@placeholder, 'mm/dd/yyyy')]")
-                        logger.info(" Found Patient DOB field by placeholder")
-                    except:
-                        logger.info(" Could not find Patient DOB field by placeholder")
-               
-                # If still not found, use JavaScript to find by nearby text or attributes
-                if not dob_field:
-                    logger.info(" Using JavaScript to find Patient DOB field")
-                    dob_field = driver.execute_script("""
-                        // Find all input fields
-                        var inputs = document.querySelectorAll('input[type="text"]');
-                       
-                        // Look for the input field that's near a label with "Date of Birth" or "DOB"
-                        for (let input of inputs) {
-                            // Check if this input has a date format placeholder
-                            if (input.placeholder && input.placeholder.includes('mm/dd/yyyy')) {
-                                return input;
-                            }
-                           
-                            // Check if this input is near a label with "Date of Birth" or "DOB"
-                            let nearbyText = input.parentElement.textContent || '';
-                            if (nearbyText.includes('Date of Birth') || nearbyText.includes('DOB')) {
-                                return input;
-                            }
-                           
-                            // Check attributes
-                            if (input.id.includes('birthDate') ||
-                                input.name.includes('birthDate') ||
-                                input.getAttribute('aria-label')?.includes('Date of Birth')) {
-                                return input;
-                            }
-                        }
-                       
-                        return null;
-                    """)
+                dob_field = locate(driver, "aetna.dob", [
+                    ("id", (By.CSS_SELECTOR, "input#patient\\.birthDate")),
+                    ("placeholder", (By.XPATH, "//input[contains(@placeholder, 'mm/dd/yyyy')]")),
+                    ("nearby_text", lambda d: d.execute_script(FIND_DOB_JS)),
+                ])
                
                 if dob_field:
                     logger.info(" Found Patient DOB field")
                    
                     # Highlight the field to confirm in screenshots
                     driver.execute_script("arguments[0].style.border='5px solid green'", dob_field)
-                    time.sleep(1)
-                   
-                    # Clear field first
-                    dob_field.clear()
-                    time.sleep(0.5)
                    
-                    # Click to focus
-                    ActionChains(driver).move_to_element(dob_field).click().perform()
-                    time.sleep(0.5)
-                   
-                    # Send keys with delay
-                    for char in dob:
-                        dob_field.send_keys(char)
-                        time.sleep(0.1)
+                    # Set the value and fire the events the form listens to
+                    fill_field(driver, dob_field, dob, "dob")
                    
                     # Press Tab to trigger any validation
                     dob_field.send_keys(Keys.TAB)
@@ -1255,114 +764,12 @@ def fill_patient_info_form(driver, patient_data):
                 if provider_dropdown:
                     logger.info(" Found Provider dropdown")
                    
-                    # Click the Provider dropdown to open it
-                    safe_click(driver, provider_dropdown, "Provider dropdown")
-                    logger.info(" Clicked Provider dropdown")
-                    time.sleep(2)  # Wait longer for dropdown to fully open
-                    take_screenshot(driver, "after_provider_dropdown_click")
-                   
-                    # Instead of typing, directly select one of the available options (KOLLIPARA or MOMOH)
+                    # Pick KOLLIPARA, else MOMOH, else the first provider listed
                     try:
-                        # First try to find KOLLIPARA option
-                        logger.info(" Looking for KOLLIPARA provider option")
-                        kollipara_option = None
-                       
-                        # Try different methods to find the KOLLIPARA option
-                        try:
-                            kollipara_option = WebDriverWait(driver, 5).until(
-                                EC.element_to_be_clickable((By.XPATH, "//div[contains(text(), 'KOLLIPARA')]"))
-                            )
-                            logger.info(" Found KOLLIPARA option by text")
-                        except:
-                            logger.info(" Could not find KOLLIPARA option by text, trying other methods")
-                       
-                        # If not found, try using JavaScript to find the option
-                        if not kollipara_option:
-                            logger.info(" Using JavaScript to find KOLLIPARA option")
-                            kollipara_option = driver.execute_script("""
-                                // Find all dropdown options
-                                var options = document.querySelectorAll('.select2-results div');
-                               
-                                // Look for the option containing KOLLIPARA
-                                for (let option of options) {
-                                    if (option.textContent.includes('KOLLIPARA')) {
-                                        return option;
-                                    }
-                                }
-                               
-                                return null;
-                            """)
-                       
-                        # If KOLLIPARA option is found, click it
-                        if kollipara_option:
-                            logger.info(" Found KOLLIPARA option, clicking it")
-                            safe_click(driver, kollipara_option, "KOLLIPARA option")
-                            logger.info(" Selected KOLLIPARA provider")
-                            time.sleep(2)  # Wait for selection to register
-                            take_screenshot(driver, "after_provider_selection")
-                        else:
-                            # If KOLLIPARA not found, try to find MOMOH option
-                            logger.info(" KOLLIPARA option not found, looking for MOMOH option")
-                            momoh_option = None
-                           
-                            try:
-                                momoh_option = WebDriverWait(driver, 5).until(
-                                    EC.element_to_be_clickable((By.XPATH, "//div[contains(text(), 'MOMOH')]"))
-                                )
-                                logger.info(" Found MOMOH option by text")
-                            except:
-                                logger.info(" Could not find MOMOH option by text, trying other methods")
-                           
-                            # If not found, try using JavaScript to find the option
-                            if not momoh_option:
-                                logger.info(" Using JavaScript to find MOMOH option")
-                                momoh_option = driver.execute_script("""
-                                    // Find all dropdown options
-                                    var options = document.querySelectorAll('.select2-results div');
-                                   
-                                    // Look for the option containing MOMOH
-                                    for (let option of options) {
-                                        if (option.textContent.includes('MOMOH')) {
-                                            return option;
-                                        }
-                                    }
-                                   
-                                    return null;
-                                """)
-                           
-                            # If MOMOH option is found, click it
-                            if momoh_option:
-                                logger.info(" Found MOMOH option, clicking it")
-                                safe_click(driver, momoh_option, "MOMOH option")
-                                logger.info(" Selected MOMOH provider")
-                                time.sleep(2)  # Wait for selection to register
-                                take_screenshot(driver, "after_provider_selection")
-                            else:
-                                # If neither option is found, try selecting the first option in the dropdown
-                                logger.info(" Neither KOLLIPARA nor MOMOH found, trying to select first available option")
-                                first_option = driver.execute_script("""
-                                    // Find all dropdown options
-                                    var options = document.querySelectorAll('.select2-results div');
-                                   
-                                    // Return the first option if available
-                                    return options.length > 0 ? options[0] : null;
-                                """)
-                               
-                                if first_option:
-                                    logger.info(" Found first available option, clicking it")
-                                    safe_click(driver, first_option, "First available option")
-                                    logger.info(" Selected first available provider")
-                                    time.sleep(2)  # Wait for selection to register
-                                    take_screenshot(driver, "after_provider_selection")
-                                else:
-                                    # Last resort: try using keyboard navigation
-                                    logger.info(" No options found, trying keyboard navigation")
-                                    ActionChains(driver).send_keys(Keys.ARROW_DOWN).perform()
-                                    time.sleep(1)
-                                    ActionChains(driver).send_keys(Keys.ENTER).perform()
-                                    time.sleep(2)
-                                    logger.info(" Used keyboard navigation to select provider")
-                                    take_screenshot(driver, "after_provider_selection_keyboard")
+                        if not select2_choose(driver, provider_dropdown, ["KOLLIPARA", "MOMOH"], search=False, description="Provider"):
+                            take_screenshot(driver, "provider_option_selection_error")
+                            return False
+                        take_screenshot(driver, "after_provider_selection")
                     except Exception as e:
                         logger.error(f" Error selecting provider option: {str(e)}")
                         take_screenshot(driver, "provider_option_selection_error")
@@ -1400,7 +807,6 @@ def fill_patient_info_form(driver, patient_data):
                        
                         # Highlight the Next button in screenshots
                         driver.execute_script("arguments[0].style.border='5px solid blue'", next_button)
-                        time.sleep(1)
                         take_screenshot(driver, "next_button_highlighted_in_iframe2")
                        
                         # Click the Next button
@@ -1408,7 +814,7 @@ def fill_patient_info_form(driver, patient_data):
                         logger.info(" Clicked Next button in iframe 2 after provider selection")
                        
                         # Wait for the next page to load
-                        time.sleep(3)
+                        wait_for_network_idle(driver, "next_page")
                         take_screenshot(driver, "after_first_next_button_click")
                        
                         # Handle Chrome save password popup that might appear after clicking Next
@@ -1450,6 +856,7 @@ def fill_patient_info_form(driver, patient_data):
 
     return False
 
+@timed()
 def fill_diagnosis_procedure_form(driver, patient_data):
     """Fill out the Diagnosis and Procedure form with improved dropdown handling"""
     diagnosis_code = patient_data.get("Diagnosis Code", "")
@@ -1458,7 +865,7 @@ def fill_diagnosis_procedure_form(driver, patient_data):
     logging.info(f" Procedure Code received: {procedure_code}")
     
     # Get from_date and format it properly to MM/DD/YYYY
-    raw_from_date = patient_data.get("from_date") or "2025-07-17"
+    raw_from_date = patient_data.get("From Date") or patient_data.get("from_date") or "2025-07-17"
     from_date = format_date_for_form(raw_from_date)  # This will convert to MM/DD/YYYY format
     
     procedure_quantity = "1"  # Hardcoded as per original script
@@ -1469,6 +876,8 @@ def fill_diagnosis_procedure_form(driver, patient_data):
     # Make sure we're in the correct iframe
     try:
         driver.switch_to.default_content()
+        # Wait for the form iframes to be attached and loaded; counted from the top document
+        wait_for_frames(driver, 2)
         frames = driver.find_elements(By.TAG_NAME, "iframe")
         if len(frames) >= 2:
             driver.switch_to.frame(frames[1])
@@ -1480,8 +889,6 @@ def fill_diagnosis_procedure_form(driver, patient_data):
         logger.error(f" Error switching to iframe: {str(e)}")
         return False
    
-    # Wait for the form to load
-    time.sleep(3)
     take_screenshot(driver, "diagnosis_procedure_form_loaded")
    
     # Track field completion status
@@ -1495,7 +902,7 @@ def fill_diagnosis_procedure_form(driver, patient_data):
     try:
         logger.info(" Looking for Diagnosis Code dropdown...")
        
-        if handle_select2_dropdown_with_selection(driver, "Diagnosis Code", diagnosis_code):
+        if handle_select2_field(driver, "Diagnosis Code", diagnosis_code):
             diagnosis_filled = True
             logger.info(f" Successfully filled and selected Diagnosis Code: {diagnosis_code}")
         else:
@@ -1509,7 +916,7 @@ def fill_diagnosis_procedure_form(driver, patient_data):
     try:
         logger.info(" Looking for Procedure Code dropdown...")
        
-        if handle_select2_dropdown_with_selection(driver, "Procedure Code", procedure_code):
+        if handle_select2_field(driver, "Procedure Code", procedure_code):
             procedure_filled = True
             logger.info(f" Successfully filled and selected Procedure Code: {procedure_code}")
         else:
@@ -1524,96 +931,27 @@ def fill_diagnosis_procedure_form(driver, patient_data):
         logger.info(f" Looking for From Date field to fill with formatted date: {from_date}")
         
         # Step 1: Find and click the calendar button to activate the date picker
-        logger.info(" Step 1: Looking for calendar button to activate date picker")
-        
-        calendar_button = None
-        
-        # Method 1: Find by the ng-click attribute seen in screenshot
-        try:
-            calendar_button = driver.find_element(
-                By.CSS_SELECTOR, 
-                "button[ng-click='dfc.dateFocus()']"
-            )
-            logger.info(" Found calendar button by ng-click attribute")
-        except:
-            logger.info(" Could not find calendar button by ng-click attribute")
-        
-        # Method 2: Find by icon class or calendar-related attributes
-        if not calendar_button:
-            try:
-                calendar_button = driver.find_element(
-                    By.CSS_SELECTOR,
-                    "button[aria-label='Calendar'], button.btn-default[type='button']"
-                )
-                logger.info(" Found calendar button by aria-label or class")
-            except:
-                logger.info(" Could not find calendar button by aria-label or class")
-        
-        # Method 3: Find calendar button near the from_date field
-        if not calendar_button:
-            try:
-                # Find the from_date input field first
-                from_date_field = driver.find_element(
-                    By.CSS_SELECTOR,
-                    "input[id*='fromDate'], input[placeholder*='__/__/____']"
-                )
-                
-                # Look for a button in the same parent container
-                parent_container = from_date_field.find_element(By.XPATH, "./..")
-                calendar_button = parent_container.find_element(
-                    By.CSS_SELECTOR,
-                    "button"
-                )
-                logger.info(" Found calendar button near from_date field")
-            except:
-                logger.info(" Could not find calendar button near from_date field")
+        logger.info(" Step 1: Looking for calendar button to activate date picker")
         
-        # Method 4: JavaScript approach to find the button
-        if not calendar_button:
-            logger.info(" Using JavaScript to find calendar button")
-            calendar_button = driver.execute_script("""
-                // Look for button with calendar-related attributes
-                var buttons = document.querySelectorAll('button');
-                for (var i = 0; i < buttons.length; i++) {
-                    var btn = buttons[i];
-                    
-                    // Check for ng-click with dateFocus
-                    if (btn.getAttribute('ng-click') && 
-                        btn.getAttribute('ng-click').includes('dateFocus')) {
-                        return btn;
-                    }
-                    
-                    // Check for calendar icon or aria-label
-                    if (btn.getAttribute('aria-label') === 'Calendar' ||
-                        btn.className.includes('calendar') ||
-                        btn.innerHTML.includes('calendar')) {
-                        return btn;
-                    }
-                    
-                    // Check if button is next to a date input
-                    var nextSibling = btn.previousElementSibling;
-                    if (nextSibling && nextSibling.tagName === 'INPUT' &&
-                        (nextSibling.placeholder.includes('__/__/____') ||
-                         nextSibling.id.includes('fromDate'))) {
-                        return btn;
-                    }
-                }
-                return null;
-            """)
+        calendar_button = locate(driver, "aetna.calendar_button", [
+            ("ng_click", (By.CSS_SELECTOR, "button[ng-click='dfc.dateFocus()']")),
+            ("aria_label", (By.CSS_SELECTOR, "button[aria-label='Calendar'], button.btn-default[type='button']")),
+            ("next_to_field", (By.XPATH, "//input[contains(@id, 'fromDate') or contains(@placeholder, '__/__/____')]/..//button")),
+            ("script", lambda d: d.execute_script(FIND_CALENDAR_BUTTON_JS)),
+        ])
         
         if calendar_button:
             logger.info(" Found calendar button, clicking to activate date picker")
             
             # Scroll to the button and click it
             driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", calendar_button)
-            time.sleep(1)
             
             # Click the calendar button using safe_click
             safe_click(driver, calendar_button, "Calendar button")
             logger.info(" Clicked calendar button successfully")
             
             # Wait for the date picker to activate
-            time.sleep(2)
+            settle(driver)
             take_screenshot(driver, "after_calendar_button_click")
             
         else:
@@ -1622,62 +960,11 @@ def fill_diagnosis_procedure_form(driver, patient_data):
         # Step 2: Now find and fill the from_date field
         logger.info(" Step 2: Looking for from_date field after calendar activation")
         
-        from_date_field = None
-        
-        # Try multiple approaches to find the field
-        field_selectors = [
-            "input[id*='fromDate']",
-            "input[id*='FromDate']", 
-            "input[name*='fromDate']",
-            "input[placeholder*='__/__/____']",
-            "input.hasDatepicker",
-            "input[ng-model*='fromDate']"
-        ]
-        
-        for selector in field_selectors:
-            try:
-                from_date_field = driver.find_element(By.CSS_SELECTOR, selector)
-                if from_date_field.is_displayed() and from_date_field.is_enabled():
-                    logger.info(f" Found from_date field using selector: {selector}")
-                    break
-            except:
-                continue
-        
-        # JavaScript fallback to find the field
-        if not from_date_field:
-            logger.info(" Using JavaScript to find from_date field")
-            from_date_field = driver.execute_script("""
-                // Look for input fields that could be the from_date field
-                var inputs = document.querySelectorAll('input[type="text"]');
-                
-                for (var i = 0; i < inputs.length; i++) {
-                    var input = inputs[i];
-                    
-                    // Check ID and name attributes
-                    if ((input.id && input.id.toLowerCase().includes('fromdate')) ||
-                        (input.name && input.name.toLowerCase().includes('fromdate'))) {
-                        return input;
-                    }
-                    
-                    // Check placeholder
-                    if (input.placeholder && input.placeholder.includes('__/__/____')) {
-                        return input;
-                    }
-                    
-                    // Check if it's near a label with "From Date"
-                    var labels = document.querySelectorAll('label');
-                    for (var j = 0; j < labels.length; j++) {
-                        if (labels[j].textContent.includes('From Date')) {
-                            var container = labels[j].closest('.form-group');
-                            if (container && container.contains(input)) {
-                                return input;
-                            }
-                        }
-                    }
-                }
-                
-                return null;
-            """)
+        from_date_field = locate(driver, "aetna.from_date", [
+            (selector, (By.CSS_SELECTOR, selector)) for selector in FROM_DATE_SELECTORS
+        ] + [
+            ("script", lambda d: d.execute_script(FIND_FROM_DATE_JS)),
+        ], accept=lambda field: field.is_displayed() and field.is_enabled())
         
         if from_date_field:
             logger.info(" Found from_date field, proceeding to fill it")
@@ -1692,56 +979,14 @@ def fill_diagnosis_procedure_form(driver, patient_data):
                 arguments[0].removeAttribute('disabled');
             """, from_date_field)
             
-            # Focus on the field
-            ActionChains(driver).move_to_element(from_date_field).click().perform()
-            time.sleep(0.5)
-            
-            # Clear the field completely
-            from_date_field.clear()
-            time.sleep(0.5)
-            
-            # Use Ctrl+A and Delete to ensure field is completely clear
-            from_date_field.send_keys(Keys.CONTROL + "a")
-            time.sleep(0.2)
-            from_date_field.send_keys(Keys.DELETE)
-            time.sleep(0.5)
-            
-            # Send the formatted date value character by character
-            logger.info(f" Typing formatted date: {from_date}")
-            for char in from_date:
-                from_date_field.send_keys(char)
-                time.sleep(0.15)  # Slightly slower typing for date fields
-            
-            # Trigger events to ensure the value is registered
-            driver.execute_script("""
-                var field = arguments[0];
-                var value = arguments[1];
-                
-                // Set the value directly
-                field.value = value;
-                
-                // Trigger all necessary events
-                field.dispatchEvent(new Event('input', { bubbles: true }));
-                field.dispatchEvent(new Event('change', { bubbles: true }));
-                field.dispatchEvent(new Event('keyup', { bubbles: true }));
-                field.dispatchEvent(new Event('blur', { bubbles: true }));
-                
-                // Trigger Angular-specific events if needed
-                if (window.angular) {
-                    var scope = angular.element(field).scope();
-                    if (scope) {
-                        scope.$apply();
-                    }
-                }
-                
-                // Trigger any custom date validation events
-                if (field.onchange) field.onchange();
-                if (field.oninput) field.oninput();
-            """, from_date_field, from_date)
+            # Set the formatted date in one call; the date picker mask takes
+            # the value from the input/change events
+            logger.info(f" Entering formatted date: {from_date}")
+            fill_field(driver, from_date_field, from_date, "from_date")
             
             # Press Tab to move to next field and trigger validation
             from_date_field.send_keys(Keys.TAB)
-            time.sleep(1)
+            settle(driver)
             
             logger.info(f" Successfully filled from_date field with formatted date: {from_date}")
             take_screenshot(driver, "from_date_filled_successfully")
@@ -1765,7 +1010,7 @@ def fill_diagnosis_procedure_form(driver, patient_data):
                     field.dispatchEvent(new Event('input', { bubbles: true }));
                     field.dispatchEvent(new Event('change', { bubbles: true }));
                 """, from_date_field, from_date)
-                time.sleep(1)
+                settle(driver)
                 
                 # Check again
                 field_value_retry = from_date_field.get_attribute('value')
@@ -1789,47 +1034,11 @@ def fill_diagnosis_procedure_form(driver, patient_data):
     try:
         logger.info(" Looking for Procedure Service Quantity field...")
        
-        # Try to find the Quantity field
-        quantity_field = None
-       
-        try:
-            quantity_field = driver.find_element(By.CSS_SELECTOR, "input[id*='serviceQuantity']")
-            logger.info(" Found Quantity field by ID pattern")
-        except:
-            logger.info(" Could not find Quantity field by ID pattern")
-       
-        if not quantity_field:
-            # Try by XPath with label
-            try:
-                quantity_field = driver.find_element(By.XPATH, "//label[contains(text(), 'Procedure Service Quantity')]/following::input[1]")
-                logger.info(" Found Quantity field by label XPath")
-            except:
-                logger.info(" Could not find Quantity field by label XPath")
-       
-        if not quantity_field:
-            # Try JavaScript to find it
-            logger.info(" Using JavaScript to find Procedure Service Quantity field")
-            quantity_field = driver.execute_script("""
-                // Try to find by label text
-                var labels = document.querySelectorAll('label');
-                for (let label of labels) {
-                    if (label.textContent.includes('Quantity') || label.textContent.includes('Service Quantity')) {
-                        // Find the closest input field
-                        let input = label.closest('.form-group').querySelector('input[type="text"]');
-                        if (input) return input;
-                    }
-                }
-               
-                // Try to find by ID pattern
-                var inputs = document.querySelectorAll('input[type="text"]');
-                for (let input of inputs) {
-                    if (input.id && (input.id.includes('quantity') || input.id.includes('Quantity'))) {
-                        return input;
-                    }
-                }
-               
-                return null;
-            """)
+        quantity_field = locate(driver, "aetna.quantity", [
+            ("id", (By.CSS_SELECTOR, "input[id*='serviceQuantity']")),
+            ("label", (By.XPATH, "//label[contains(text(), 'Procedure Service Quantity')]/following::input[1]")),
+            ("script", lambda d: d.execute_script(FIND_QUANTITY_JS)),
+        ])
        
         if quantity_field:
             # Clear and fill the field
@@ -1838,7 +1047,7 @@ def fill_diagnosis_procedure_form(driver, patient_data):
             # Press Tab to move to next field
             quantity_field.send_keys(Keys.TAB)
             logger.info(f" Entered Procedure Quantity: {procedure_quantity}")
-            time.sleep(1)
+            settle(driver)
             take_screenshot(driver, "after_quantity_entry")
             quantity_filled = True
         else:
@@ -1917,7 +1126,7 @@ def fill_diagnosis_procedure_form(driver, patient_data):
            
             if click_success:
                 logger.info(" Clicked Quantity Type dropdown")
-                time.sleep(2)
+                settle(driver)
                 take_screenshot(driver, "after_quantity_type_dropdown_click")
                
                 # Approach 2: Keyboard navigation (most reliable based on logs)
@@ -1925,11 +1134,10 @@ def fill_diagnosis_procedure_form(driver, patient_data):
                     logger.info(" Trying keyboard navigation to select Days")
                     # Press Down arrow to highlight first option, then Enter to select it
                     ActionChains(driver).send_keys(Keys.DOWN).perform()
-                    time.sleep(0.5)
                     ActionChains(driver).send_keys(Keys.ENTER).perform()
                     logger.info(" Used keyboard navigation to select first option (should be Days)")
                     days_selected = True
-                    time.sleep(1)
+                    settle(driver)
                     take_screenshot(driver, "after_quantity_type_selection_keyboard")
                 except Exception as e:
                     logger.info(f" Keyboard navigation failed: {str(e)}")
@@ -2007,7 +1215,7 @@ def fill_diagnosis_procedure_form(driver, patient_data):
                 select.select_by_visible_text(procedure_quantity_type)
                 logger.info(f" Selected Quantity Type: {procedure_quantity_type}")
                 days_selected = True
-                time.sleep(1)
+                settle(driver)
                 take_screenshot(driver, "after_quantity_type_selection_select")
             except Exception as e:
                 logger.error(f" Could not find or interact with Quantity Type dropdown: {str(e)}")
@@ -2156,13 +1364,12 @@ def fill_diagnosis_procedure_form(driver, patient_data):
             if next_button:
                 # Highlight the button in screenshots
                 driver.execute_script("arguments[0].style.border='5px solid blue'", next_button)
-                time.sleep(1)
                 take_screenshot(driver, "next_button_highlighted")
                
                 # Click the Next button
                 safe_click(driver, next_button, "Next button")
                 logger.info(" Clicked Next button")
-                time.sleep(3)
+                wait_for_network_idle(driver, "next_page")
                
                 # Switch back to default content
                 driver.switch_to.default_content()
@@ -2199,7 +1406,7 @@ def fill_diagnosis_procedure_form(driver, patient_data):
                         return false;
                     """)
                     logger.info(" Clicked Next button using JavaScript")
-                    time.sleep(3)
+                    wait_for_network_idle(driver, "next_page")
                    
                     # Switch back to default content
                     driver.switch_to.default_content()
@@ -2244,6 +1451,7 @@ def fill_diagnosis_procedure_form(driver, patient_data):
        
         return False
 
+@timed()
 def select_providers(driver):
     """Select providers using the most efficient approach based on terminal logs"""
     logger.info("\n Starting to select providers...")
@@ -2256,8 +1464,8 @@ def select_providers(driver):
     except Exception as e:
         logger.warning(f" Error switching to default content: {str(e)}")
 
-    # Wait for the form to be fully loaded
-    time.sleep(3)
+    # Wait for the form iframes to be attached and loaded
+    wait_for_frames(driver, 2)
    
     # Switch to iframe 2 as per previous pattern
     frames = driver.find_elements(By.TAG_NAME, "iframe")
@@ -2295,7 +1503,6 @@ def select_providers(driver):
                
                 # Highlight the Next button in screenshots
                 driver.execute_script("arguments[0].style.border='5px solid blue'", next_button)
-                time.sleep(1)
                 take_screenshot(driver, "next_button_highlighted")
                
                 # Click the Next button using JavaScript for reliability
@@ -2328,6 +1535,7 @@ def select_providers(driver):
         return False
 
 # New function to handle the Next Steps button (from michuaetna.py)
+@timed()
 def click_next_steps_button(driver):
     """Click the Next Steps button on the page after the final Next button"""
     logger.info("\n Starting to click Next Steps button...")
@@ -2340,8 +1548,8 @@ def click_next_steps_button(driver):
     except Exception as e:
         logger.warning(f" Error switching to default content: {str(e)}")
 
-    # Wait for the form to be fully loaded
-    time.sleep(3)
+    # Wait for the form iframes to be attached and loaded
+    wait_for_frames(driver, 2)
    
     # Switch to iframe 2 as per previous pattern
     frames = driver.find_elements(By.TAG_NAME, "iframe")
@@ -2362,7 +1570,6 @@ def click_next_steps_button(driver):
                
                 # Highlight the button in screenshots
                 driver.execute_script("arguments[0].style.border='5px solid blue'", next_steps_button)
-                time.sleep(1)
                 take_screenshot(driver, "next_steps_button_highlighted")
                
                 # Click the Next Steps button
@@ -2398,6 +1605,7 @@ def click_next_steps_button(driver):
         return False
 
 # New function to handle the second Next button (from michuaetna.py)
+@timed()
 def click_second_next_button(driver):
     """Click the Next button on the page after the Next Steps button"""
     logger.info("\n Starting to click second Next button...")
@@ -2410,8 +1618,8 @@ def click_second_next_button(driver):
     except Exception as e:
         logger.warning(f" Error switching to default content: {str(e)}")
 
-    # Wait for the form to be fully loaded
-    time.sleep(3)
+    # Wait for the form iframes to be attached and loaded
+    wait_for_frames(driver, 2)
    
     # Switch to iframe 2 as per previous pattern
     frames = driver.find_elements(By.TAG_NAME, "iframe")
@@ -2432,7 +1640,6 @@ def click_second_next_button(driver):
                
                 # Highlight the button in screenshots
                 driver.execute_script("arguments[0].style.border='5px solid blue'", next_button)
-                time.sleep(1)
                 take_screenshot(driver, "second_next_button_highlighted")
                
                 # Click the Next button
@@ -2468,6 +1675,7 @@ def click_second_next_button(driver):
         return False
 
 # New function to handle the final Submit button (from michuaetna.py)
+@timed()
 def click_submit_button(driver):
     """Click the Submit button on the final page"""
     logger.info("\n Starting to click Submit button...")
@@ -2480,8 +1688,8 @@ def click_submit_button(driver):
     except Exception as e:
         logger.warning(f" Error switching to default content: {str(e)}")
 
-    # Wait for the form to be fully loaded
-    time.sleep(3)
+    # Wait for the form iframes to be attached and loaded
+    wait_for_frames(driver, 2)
    
     # Switch to iframe 2 as per previous pattern
     frames = driver.find_elements(By.TAG_NAME, "iframe")
@@ -2502,7 +1710,6 @@ def click_submit_button(driver):
                
                 # Highlight the button in screenshots
                 driver.execute_script("arguments[0].style.border='5px solid blue'", submit_button)
-                time.sleep(1)
                 take_screenshot(driver, "submit_button_highlighted")
                
                 # Click the Submit button
@@ -2538,6 +1745,7 @@ def click_submit_button(driver):
         return False
 
 # New function to handle the final New Request button (from michuaetna.py)
+@timed()
 def click_final_new_request_button(driver):
     """Click the New Request button after submission is complete"""
     logger.info("\n Starting to click final New Request button...")
@@ -2563,8 +1771,8 @@ def click_final_new_request_button(driver):
             logger.info(f" Submission result message: {message_text}")
             take_screenshot(driver, "submission_result_message")
            
-            # Additional wait after seeing the result message
-            time.sleep(5)
+            # Let the confirmation finish loading before leaving the page
+            wait_for_network_idle(driver)
     except Exception as e:
         logger.warning(f" Error waiting for submission result message: {str(e)}")
         logger.warning(" Continuing anyway...")
@@ -2587,7 +1795,6 @@ def click_final_new_request_button(driver):
        
         # Highlight the button in screenshots
         driver.execute_script("arguments[0].style.border='5px solid blue'", new_request_button)
-        time.sleep(1)
         take_screenshot(driver, "final_new_request_button_highlighted")
        
         # Click the New Request button
@@ -2596,7 +1803,7 @@ def click_final_new_request_button(driver):
        
         # Wait for the form to reload
         wait_for_page_load(driver, TIMEOUT)
-        time.sleep(3)  # Additional wait to ensure form is fully loaded
+        wait_for_frames(driver, 2)
         take_screenshot(driver, "after_new_request_button_click")
        
         # Verify the form is cleared by checking for empty fields
@@ -2648,295 +1855,561 @@ def click_final_new_request_button(driver):
             logger.error(f" Direct refresh failed: {str(e)}")
             return False
 
-# ===============================
-# MAIN EXECUTION - FIXED FOR FLASK
-# ===============================
-def main():
-    logger.info("🚀 Starting Availity Authorization Workflow Script")
+@timed()
+def login_to_availity(driver):
+    """Steps 1-5: open Availity, sign in and complete 2FA/MFA"""
+    # Step 1: Navigate to Availity
+    logger.info("\n Step 1: Navigating to Availity")
+    if not navigate_to_url(driver, AVAILITY_WWW_URL, "Availity homepage"):
+        return False
+
+    # Handle cookie popup if present
+    try:
+        cookie_btn = WebDriverWait(driver, 5).until(
+            EC.element_to_be_clickable(LOCATORS["cookie_button"])
+        )
+        cookie_btn.click()
+        logger.info(" Accepted cookies")
+    except:
+        logger.info(" No cookie popup or already accepted")
+
+    # Step 2: Click on Login link
+    logger.info("\nStep 2: Clicking on Essentials Login")
+    driver.execute_script("window.scrollTo(0, 0);")
+    login_link = wait_for_and_find_element(driver, LOCATORS["login_link"], "login link")
+    if not login_link:
+        logger.error(" Could not find login link")
+        return False
+
+    if not safe_click(driver, login_link, "Essentials Login link"):
+        logger.error(" Failed to click login link")
+        return False
 
-    # Initialize Chrome webdriver with improved setup
-    driver = setup_chrome_driver()
-    if not driver:
-        logger.error("Failed to initialize Chrome driver. Please check the error messages above.")
-        return False  # Return False instead of just return
+    # Wait for login page to load
+    wait_for_page_load(driver)
+
+    # Step 3: Login with credentials
+    logger.info("\nStep 3: Entering login credentials")
+    username_field = wait_for_and_find_element(driver, LOCATORS["username_input"], "username field")
+    password_field = wait_for_and_find_element(driver, LOCATORS["password_input"], "password field")
+    sign_in_button = wait_for_and_find_element(driver, LOCATORS["sign_in_button"], "sign in button")
+
+    if not all([username_field, password_field, sign_in_button]):
+        logger.error(" Login form elements not found")
+        return False
 
     try:
-        # Step 1: Navigate to Availity
-        logger.info("\n Step 1: Navigating to Availity")
-        if not navigate_to_url(driver, "https://www.availity.com/", "Availity homepage"):
-            return False
-       
-        # Handle cookie popup if present
-        try:
-            cookie_btn = WebDriverWait(driver, 5).until(
-                EC.element_to_be_clickable(LOCATORS["cookie_button"])
-            )
-            cookie_btn.click()
-            logger.info(" Accepted cookies")
-        except:
-            logger.info(" No cookie popup or already accepted")
-       
-        # Step 2: Click on Login link
-        logger.info("\nStep 2: Clicking on Essentials Login")
-        driver.execute_script("window.scrollTo(0, 0);")
-        login_link = wait_for_and_find_element(driver, LOCATORS["login_link"], "login link")
-        if not login_link:
-            logger.error(" Could not find login link")
-            return False
-       
-        if not safe_click(driver, login_link, "Essentials Login link"):
-            logger.error(" Failed to click login link")
+        username_field.clear()
+        username_field.send_keys(EMAIL)
+        password_field.clear()
+        password_field.send_keys(PASSWORD)
+
+        if not safe_click(driver, sign_in_button, "Sign In button"):
+            logger.error(" Failed to click Sign In button")
             return False
-       
-        # Wait for login page to load
-        wait_for_page_load(driver)
-       
-        # Step 3: Login with credentials
-        logger.info("\nStep 3: Entering login credentials")
-        username_field = wait_for_and_find_element(driver, LOCATORS["username_input"], "username field")
-        password_field = wait_for_and_find_element(driver, LOCATORS["password_input"], "password field")
-        sign_in_button = wait_for_and_find_element(driver, LOCATORS["sign_in_button"], "sign in button")
-       
-        if not all([username_field, password_field, sign_in_button]):
-            logger.error(" Login form elements not found")
+
+        logger.info(" Login form submitted")
+    except Exception as e:
+        logger.error(f" Login failed: {str(e)}")
+        take_screenshot(driver, "login_failed")
+        return False
+
+    # Step 4: Handle 2FA selection
+    logger.info("\n📋 Step 4: Setting up 2FA")
+    try:
+        sms_option = WebDriverWait(driver, TIMEOUT).until(
+            EC.presence_of_element_located(LOCATORS["sms_option"])
+        )
+
+        if not safe_click(driver, sms_option, "SMS option"):
+            logger.warning(" Failed to click SMS option, trying to continue anyway")
+
+        continue_button = WebDriverWait(driver, TIMEOUT).until(
+            EC.element_to_be_clickable(LOCATORS["continue_button"])
+        )
+
+        if not safe_click(driver, continue_button, "Continue button"):
+            logger.error(" Failed to click Continue button")
             return False
-       
-        try:
-            username_field.clear()
-            username_field.send_keys(EMAIL)
-            password_field.clear()
-            password_field.send_keys(PASSWORD)
-           
-            if not safe_click(driver, sign_in_button, "Sign In button"):
-                logger.error(" Failed to click Sign In button")
+
+        logger.info(" Submitted 2FA method")
+    except Exception as e:
+        logger.warning(f" 2FA method selection failed: {str(e)}")
+        logger.warning("Continuing anyway - 2FA screens may vary")
+
+    # Step 5: Handle MFA challenge with integrated system
+    logger.info("\n📋 Step 5: Handling MFA Challenge")
+    wait_for_ready(driver)  # Wait for MFA page to load
+
+    # Check if we're on MFA page
+    try:
+        mfa_input = driver.find_element(By.XPATH, "//input[@placeholder='Code' or @name='code' or @type='text']")
+        if mfa_input.is_displayed():
+            logger.info("MFA challenge detected")
+            if not handle_mfa_challenge(driver):
+                logger.error("MFA challenge failed")
                 return False
-               
-            logger.info(" Login form submitted")
-        except Exception as e:
-            logger.error(f" Login failed: {str(e)}")
-            take_screenshot(driver, "login_failed")
-            return False
-       
-        # Step 4: Handle 2FA selection
-        logger.info("\n📋 Step 4: Setting up 2FA")
+    except:
+        logger.info("No MFA challenge detected, continuing...")
+
+    # Wait for login to complete
+    initial_url = driver.current_url
+    wait_for_url_change(driver, initial_url, "mfa")
+
+    wait_for_page_load(driver)
+    logger.info("2FA process completed!")
+    save_session(driver)
+    return True
+
+# ===============================
+# AUTHORIZATION RECORDS
+# ===============================
+def build_patient_record(data):
+    """Map an authorization payload from app.py to the field names used by the form fillers"""
+    return {
+        'Member ID': data.get('member_id', ''),
+        'Patient Date of Birth': format_date_for_form(data.get('date_of_birth', '')),
+        'Patient Name': data.get('patient_name', ''),
+        'Provider Name': data.get('provider_name', ''),
+        'NPI Number': data.get('npi_number', ''),
+        'Procedure Code': data.get('procedure_code', ''),
+        'Diagnosis Code': data.get('diagnosis_code', ''),
+        'From Date': format_date_for_form(data.get('from_date', '')),
+        'To Date': format_date_for_form(data.get('to_date', '')),
+        'Primary Insurance': data.get('primary_insurance', '')
+    }
+
+@timed()
+def open_authorizations_page(driver):
+    """Steps 6-8: from the dashboard to the Authorizations & Referrals page"""
+    # Step 6: Wait for dashboard to load
+    logger.info("\n Step 6: Waiting for dashboard to load")
+    wait_for_page_load(driver, LONG_TIMEOUT)
+    logger.info(f"Current URL: {driver.current_url}")
+    take_screenshot(driver, "dashboard")
+   
+    # Step 7: Navigate to Patient Registration
+    logger.info("\n Step 7: Navigating to Patient Registration")
+    patient_reg_element = wait_for_and_find_element(
+        driver, LOCATORS["patient_registration"], "Patient Registration", TIMEOUT
+    )
+   
+    if not patient_reg_element:
+        logger.error(" Could not find Patient Registration link")
+        return False
+   
+    # Hover and click
+    ActionChains(driver).move_to_element(patient_reg_element).perform()
+    logger.info(" Hovered over Patient Registration")
+   
+    if not safe_click(driver, patient_reg_element, "Patient Registration"):
+        logger.error(" Failed to click on Patient Registration")
+        return False
+    logger.info(" Clicked on Patient Registration")
+    wait_for_page_load(driver)
+    take_screenshot(driver, "after_patient_reg_click")
+   
+    # Step 8: Click on Authorizations & Referrals
+    logger.info("\n Step 8: Looking for Authorizations & Referrals")
+    auth_ref_element = wait_for_and_find_element(
+        driver, LOCATORS["auth_and_referrals"], "Authorizations & Referrals", TIMEOUT
+    )
+   
+    if not auth_ref_element:
+        logger.error(" Could not find Authorizations & Referrals")
+        # Try alternative locator
         try:
-            sms_option = WebDriverWait(driver, TIMEOUT).until(
-                EC.presence_of_element_located(LOCATORS["sms_option"])
+            logger.info(" Trying alternative locator for Authorizations & Referrals")
+            auth_ref_element = WebDriverWait(driver, TIMEOUT).until(
+                EC.element_to_be_clickable((By.XPATH, "//a[contains(text(), 'Authorizations & Referrals')]"))
             )
-           
-            if not safe_click(driver, sms_option, "SMS option"):
-                logger.warning(" Failed to click SMS option, trying to continue anyway")
-           
-            continue_button = WebDriverWait(driver, TIMEOUT).until(
-                EC.element_to_be_clickable(LOCATORS["continue_button"])
-            )
-           
-            if not safe_click(driver, continue_button, "Continue button"):
-                logger.error(" Failed to click Continue button")
-                return False
-               
-            logger.info(" Submitted 2FA method")
+            logger.info(" Found Authorizations & Referrals with alternative locator")
         except Exception as e:
-            logger.warning(f" 2FA method selection failed: {str(e)}")
-            logger.warning("Continuing anyway - 2FA screens may vary")
-       
-        # Step 5: Handle MFA challenge with integrated system
-        logger.info("\n📋 Step 5: Handling MFA Challenge")
-        time.sleep(3)  # Wait for MFA page to load
-        
-        # Check if we're on MFA page
+            logger.error(f" Alternative locator also failed: {str(e)}")
+            return False
+   
+    if not safe_click(driver, auth_ref_element, "Authorizations & Referrals"):
+        logger.error(" Failed to click on Authorizations & Referrals")
+        return False
+    logger.info(" Clicked on Authorizations & Referrals")
+    wait_for_page_load(driver, LONG_TIMEOUT)
+    take_screenshot(driver, "auth_referrals_page")
+    return True
+
+# Steps 9-17 of one submission; after step 17 the wizard is back on a blank
+# Authorization Request form, so the next record can start at step 10
+AUTHORIZATION_STEPS = [
+    (9, "Clicking on Authorization Request link", lambda driver, record: click_authorization_request(driver)),
+    (10, "Filling out Authorization form", lambda driver, record: fill_authorization_form(driver)),
+    (11, "Filling out Patient Information form", fill_patient_info_form),
+    (12, "Filling out Diagnosis and Procedure form", fill_diagnosis_procedure_form),
+    (13, "Selecting providers", lambda driver, record: select_providers(driver)),
+    (14, "Clicking Next Steps button", lambda driver, record: click_next_steps_button(driver)),
+    (15, "Clicking second Next button", lambda driver, record: click_second_next_button(driver)),
+    (16, "Clicking Submit button", lambda driver, record: click_submit_button(driver)),
+    (17, "Clicking final New Request button", lambda driver, record: click_final_new_request_button(driver)),
+]
+
+# After Submit the authorization may already exist in Availity, so this step
+# is never replayed automatically
+SUBMIT_STEP = 16
+# Extra in-session attempts for a record that failed before Submit: the first
+# resumes at the failed step, later ones start again from the blank form
+RECORD_RETRIES = int(os.getenv('AETNA_RECORD_RETRIES', '2'))
+
+def submit_authorization_record(driver, patient_record, start_step=9, on_step=None):
+    """Run steps start_step-17 for one record.
+
+    on_step, when given, is called with each step number as soon as that step
+    completed. Returns (success, failed_step, step_timings) where
+    step_timings maps each step number that ran to its duration in seconds.
+    """
+    logger.info(f"\n Processing patient record: {patient_record}")
+    step_timings = {}
+   
+    for step, description, action in AUTHORIZATION_STEPS:
+        if step < start_step:
+            continue
+        logger.info(f"\n Step {step}: {description}")
+        step_started = time.time()
         try:
-            mfa_input = driver.find_element(By.XPATH, "//input[@placeholder='Code' or @name='code' or @type='text']")
-            if mfa_input.is_displayed():
-                logger.info("MFA challenge detected")
-                if not handle_mfa_challenge(driver):
-                    logger.error("MFA challenge failed")
-                    return False
-        except:
-            logger.info("No MFA challenge detected, continuing...")
-        
-        # Wait for login to complete
-        initial_url = driver.current_url
-        start_time = time.time()
-        
-        while time.time() - start_time < 300:
-            if driver.current_url != initial_url:
-                break
-            time.sleep(3)
-        
-        wait_for_page_load(driver)
-        logger.info("2FA process completed!")
-       
-        # Step 6: Wait for dashboard to load
-        logger.info("\n Step 6: Waiting for dashboard to load")
-        wait_for_page_load(driver, LONG_TIMEOUT)
-        logger.info(f"Current URL: {driver.current_url}")
-        take_screenshot(driver, "dashboard")
-       
-        # Step 7: Navigate to Patient Registration
-        logger.info("\n Step 7: Navigating to Patient Registration")
-        patient_reg_element = wait_for_and_find_element(
-            driver, LOCATORS["patient_registration"], "Patient Registration", TIMEOUT
-        )
-       
-        if not patient_reg_element:
-            logger.error(" Could not find Patient Registration link")
+            ok = action(driver, patient_record)
+        except Exception as e:
+            logger.error(f" Unexpected error processing patient record: {str(e)}")
+            logger.error(traceback.format_exc())
+            ok = False
+        step_timings[step] = round(time.time() - step_started, 2)
+       
+        if not ok:
+            logger.error(f" Step {step} failed: {description}")
+            take_screenshot(driver, f"step_{step}_failed")
+            return False, step, step_timings
+        if on_step:
+            on_step(step)
+   
+    logger.info("Patient record processed successfully with complete workflow")
+    return True, None, step_timings
+
+# ===============================
+# CHECKPOINTS
+# ===============================
+def new_checkpoint(patient_record):
+    """Progress of one record: last completed step and whether Submit went through"""
+    return {
+        "member_id": patient_record.get('Member ID'),
+        "last_step": 0,
+        "submitted": False,
+        "submit_uncertain": False,
+        "url": None,
+    }
+
+def wizard_still_at(driver, checkpoint, patient_record):
+    """True when the browser still shows this record's wizard where the checkpoint left it"""
+    last_step = checkpoint.get("last_step", 0)
+    if not 9 <= last_step < SUBMIT_STEP or not checkpoint.get("url"):
+        return False
+    try:
+        driver.switch_to.default_content()
+        if driver.current_url != checkpoint["url"]:
             return False
+        if last_step < 11:
+            return True
+        # From step 11 on the form carries the record's member ID
+        frames = driver.find_elements(By.TAG_NAME, "iframe")
+        if len(frames) < 2:
+            return False
+        driver.switch_to.frame(frames[1])
+        member_id_field = driver.find_element(By.CSS_SELECTOR, "input#subscriber\\.memberId")
+        return member_id_field.get_attribute("value") == patient_record.get('Member ID')
+    except Exception:
+        return False
+    finally:
+        try:
+            driver.switch_to.default_content()
+        except Exception:
+            pass
+
+def run_authorization_batch(driver, patient_records, checkpoints=None, on_checkpoint=None):
+    """Submit several records in one logged-in session.
+
+    checkpoints maps the record index (as a string) to the checkpoint left by
+    an earlier attempt; on_checkpoint is called with {"records": checkpoints}
+    after every completed step so the caller can persist it. A record that
+    already passed Submit is never submitted again, and a failed record is
+    resumed at the failed step while its wizard is still on screen, else
+    restarted from the blank authorization form, not from login.
+
+    Returns one result dict per record with its success, the step that failed
+    and per-step timings.
+    """
+    checkpoints = checkpoints if checkpoints is not None else {}
+    results = []
+    on_blank_form = False
+    page_open = False
+
+    def save_checkpoints():
+        if on_checkpoint:
+            try:
+                on_checkpoint({"records": checkpoints})
+            except Exception as e:
+                logger.warning(f" Could not save checkpoint: {str(e)}")
+
+    # Keep an inherited checkpoint on this attempt too, so a later retry still
+    # sees which records were submitted or need checking even if nothing runs now
+    if checkpoints:
+        save_checkpoints()
+   
+    for index, patient_record in enumerate(patient_records, start=1):
+        logger.info(f"\n ===== Authorization record {index}/{len(patient_records)} =====")
+        record_started = time.time()
+        result = {"index": index - 1, "member_id": patient_record.get('Member ID'), "success": False,
+                  "failed_step": None, "step_timings": {}, "seconds": None, "attempts": 0, "resumed_from": None}
+
+        key = str(index - 1)
+        checkpoint = checkpoints.get(key)
+        if not checkpoint or checkpoint.get("member_id") != patient_record.get('Member ID'):
+            checkpoint = checkpoints[key] = new_checkpoint(patient_record)
+
+        if checkpoint["submitted"]:
+            logger.info(f" Record {index} was submitted in an earlier attempt, skipping")
+            result.update(success=True, note="Already submitted in an earlier attempt", seconds=0)
+            results.append(result)
+            continue
+        if checkpoint["submit_uncertain"]:
+            logger.error(f" Record {index}: Submit failed in an earlier attempt, not resubmitting")
+            result.update(failed_step=SUBMIT_STEP, seconds=0,
+                          error="Submit outcome unknown after an earlier attempt; check Availity before resubmitting")
+            results.append(result)
+            continue
+
+        def on_step(step):
+            checkpoint["last_step"] = step
+            checkpoint["url"] = driver.current_url
+            if step == SUBMIT_STEP:
+                checkpoint["submitted"] = True
+            save_checkpoints()
+       
+        for attempt in range(1 + RECORD_RETRIES):
+            result["attempts"] = attempt + 1
+            try:
+                if wizard_still_at(driver, checkpoint, patient_record):
+                    start_step = checkpoint["last_step"] + 1
+                    logger.info(f" Resuming record {index} at step {start_step}")
+                elif on_blank_form:
+                    start_step = 10
+                else:
+                    if not page_open:
+                        # Back to a known page; log in again if Availity expired the session meanwhile
+                        if (index > 1 or attempt > 0) and not is_logged_in(driver) and not login_to_availity(driver):
+                            raise BotError(ERROR_LOGIN, "Availity login failed")
+                        page_open = open_authorizations_page(driver)
+                        if not page_open:
+                            result["failed_step"] = 8
+                            continue
+                    start_step = 9
+                result["resumed_from"] = start_step if start_step not in (9, 10) else None
+
+                success, failed_step, step_timings = submit_authorization_record(
+                    driver, patient_record, start_step=start_step, on_step=on_step
+                )
+                result["step_timings"].update(step_timings)
+                result.update(success=success, failed_step=failed_step)
+                if success:
+                    on_blank_form = True
+                    break
+
+                on_blank_form = False
+                if failed_step == SUBMIT_STEP:
+                    # The click may have gone through; leave it to a person
+                    checkpoint["submit_uncertain"] = True
+                    save_checkpoints()
+                    result["error"] = "Submit outcome unknown; check Availity before resubmitting"
+                    page_open = False
+                    break
+                if checkpoint["submitted"]:
+                    # Only the New Request reset failed; the authorization is in
+                    result.update(success=True, note="Submitted; New Request reset failed")
+                    page_open = False
+                    break
+                if result["resumed_from"]:
+                    # Resuming did not help; next attempt starts from the blank form
+                    checkpoint["url"] = None
+                page_open = wizard_still_at(driver, checkpoint, patient_record)
+            except Exception as e:
+                logger.error(f" Unexpected error processing patient record: {str(e)}")
+                logger.error(traceback.format_exc())
+                result["error"] = str(e)
+                on_blank_form = False
+                page_open = False
+                try:
+                    driver.switch_to.default_content()
+                except Exception:
+                    pass
        
-        # Hover and click
-        ActionChains(driver).move_to_element(patient_reg_element).perform()
-        logger.info(" Hovered over Patient Registration")
-        time.sleep(2)
-       
-        if safe_click(driver, patient_reg_element, "Patient Registration"):
-            logger.info(" Clicked on Patient Registration")
-            time.sleep(3)
-            wait_for_page_load(driver)
-            take_screenshot(driver, "after_patient_reg_click")
-           
-            # Step 8: Click on Authorizations & Referrals
-            logger.info("\n Step 8: Looking for Authorizations & Referrals")
-            auth_ref_element = wait_for_and_find_element(
-                driver, LOCATORS["auth_and_referrals"], "Authorizations & Referrals", TIMEOUT
+        result["seconds"] = round(time.time() - record_started, 2)
+        logger.info(f" Record {index}: {'succeeded' if result['success'] else 'failed'} in {result['seconds']}s")
+        results.append(result)
+   
+    return results
+
+# ===============================
+# CALLABLE ENTRY POINT
+# ===============================
+BOT_NAME = "aetna_prior_auth"
+
+class StepProgressHandler(logging.Handler):
+    """Time "Step N: ..." log lines as result steps and forward them to a progress callback"""
+    def __init__(self, progress=None):
+        super().__init__(level=logging.INFO)
+        self.progress = progress
+
+    def emit(self, record):
+        # Workflow steps are logged on a line of their own ("\n Step 12: ..."); this
+        # skips the numbered sub-steps inside fill_diagnosis_procedure_form
+        message = record.getMessage()
+        if not message.startswith("\n") or not STEP_PATTERN.search(message):
+            return
+        note_step(message)
+        if self.progress:
+            try:
+                self.progress(message.strip())
+            except Exception:
+                pass
+
+def submit_prior_auth(record, driver=None, progress=None, checkpoint=None, on_checkpoint=None):
+    """Submit one authorization record, or a list of them, through Availity.
+
+    record uses the payload keys sent by app.py (member_id, date_of_birth,
+    procedure_code, ...). A driver passed in is reused and left open for the
+    caller; it is logged in first if it has no valid session. Without one a
+    browser is started and closed again.
+    progress, when given, is called with every "Step N: ..." message.
+    checkpoint is the last checkpoint saved through on_checkpoint by an
+    earlier attempt; see run_authorization_batch.
+
+    Returns the result document (see rpa_result); its data holds a result
+    dict per record (success, failed_step, step_timings, seconds), or a list
+    of them when record is a list.
+    """
+    is_batch = isinstance(record, list)
+    patient_records = [build_patient_record(r) for r in (record if is_batch else [record])]
+    recorder = ResultRecorder(BOT_NAME)
+
+    progress_handler = StepProgressHandler(progress)
+    logger.addHandler(progress_handler)
+
+    owns_driver = driver is None
+    try:
+        with recording(recorder):
+            if owns_driver:
+                driver = setup_chrome_driver()
+            if not driver:
+                raise BotError(ERROR_DRIVER, "Failed to initialize Chrome driver")
+
+            # Steps 1-5: log in, unless the browser already has a session
+            if not owns_driver and is_logged_in(driver):
+                logger.info("\n Steps 1-5: Reusing logged-in Availity session")
+            elif restore_session(driver):
+                logger.info("\n Steps 1-5: Reusing saved Availity session")
+            elif not login_to_availity(driver):
+                raise BotError(ERROR_LOGIN, "Availity login failed")
+
+            # Steps 6-17 for every record
+            results = run_authorization_batch(
+                driver, patient_records,
+                checkpoints=dict((checkpoint or {}).get("records", {})),
+                on_checkpoint=on_checkpoint
             )
-           
-            if not auth_ref_element:
-                logger.error(" Could not find Authorizations & Referrals")
-                # Try alternative locator
-                try:
-                    logger.info(" Trying alternative locator for Authorizations & Referrals")
-                    auth_ref_element = WebDriverWait(driver, TIMEOUT).until(
-                        EC.element_to_be_clickable((By.XPATH, "//a[contains(text(), 'Authorizations & Referrals')]"))
-                    )
-                    logger.info(" Found Authorizations & Referrals with alternative locator")
-                except Exception as e:
-                    logger.error(f" Alternative locator also failed: {str(e)}")
-                    return False
-           
-            if safe_click(driver, auth_ref_element, "Authorizations & Referrals"):
-                logger.info(" Clicked on Authorizations & Referrals")
-                time.sleep(3)
-                wait_for_page_load(driver, LONG_TIMEOUT)
-                take_screenshot(driver, "auth_referrals_page")
-               
-                # Create patient record from command line arguments
-                patient_record = {
-                    'Member ID': member_id,
-                    'Patient Date of Birth': format_date_for_form(patient_dob),
-                    'Patient Name': patient_name,
-                    'Provider Name': provider_name,
-                    'NPI Number': provider_npi,
-                    'Procedure Code': procedure_code,
-                    'Diagnosis Code': diagnosis_code,
-                    'From Date': format_date_for_form(from_date),
-                    'To Date': format_date_for_form(to_date),
-                    'Primary Insurance': primary_insurance
-                }
-               
-                logger.info(f"\n Processing patient record: {patient_record}")
-               
-                try:
-                    # Step 9: Click on Authorization Request link
-                    logger.info(f"\n Step 9: Clicking on Authorization Request link")
-                    if click_authorization_request(driver):
-                        logger.info(" Successfully navigated to Authorization Request page")
-                       
-                        # Step 10: Fill out the Authorization form
-                        logger.info(f"\n Step 10: Filling out Authorization form")
-                        if fill_authorization_form(driver):
-                            logger.info(" Authorization form filled successfully")
-                           
-                            # Step 11: Fill out the Patient Information form
-                            logger.info(f"\n Step 11: Filling out Patient Information form")
-                            if fill_patient_info_form(driver, patient_record):
-                                logger.info(" Patient Information form filled successfully")  
-                               
-                                # Step 12: Fill out the Diagnosis and Procedure form
-                                logger.info(f"\n Step 12: Filling out Diagnosis and Procedure form")
-                                if fill_diagnosis_procedure_form(driver, patient_record):
-                                    logger.info(" Diagnosis and Procedure form filled successfully")
-                                   
-                                    # Step 13: Select providers
-                                    logger.info(f"\n Step 13: Selecting providers")
-                                    if select_providers(driver):
-                                        logger.info(" Providers selected successfully")
-                                       
-                                        # Step 14: Click Next Steps button
-                                        logger.info(f"\n Step 14: Clicking Next Steps button")
-                                        if click_next_steps_button(driver):
-                                            logger.info(" Next Steps button clicked successfully")
-                                           
-                                            # Step 15: Click second Next button
-                                            logger.info(f"\n Step 15: Clicking second Next button")
-                                            if click_second_next_button(driver):
-                                                logger.info(" Second Next button clicked successfully")
-                                               
-                                                # Step 16: Click Submit button
-                                                logger.info(f"\n Step 16: Clicking Submit button")
-                                                if click_submit_button(driver):
-                                                    logger.info(" Submit button clicked successfully")
-                                                   
-                                                    # Step 17: Click final New Request button
-                                                    logger.info(f"\n Step 17: Clicking final New Request button")
-                                                    if click_final_new_request_button(driver):
-                                                        logger.info(" Final New Request button clicked successfully")
-                                                        logger.info("Patient record processed successfully with complete workflow")
-                                                        return True  # Success
-                                                    else:
-                                                        logger.error(" Failed to click final New Request button")
-                                                        return False
-                                                else:
-                                                    logger.error(" Failed to click Submit button")
-                                                    return False
-                                            else:
-                                                logger.error(" Failed to click second Next button")
-                                                return False
-                                        else:
-                                            logger.error(" Failed to click Next Steps button")
-                                            return False
-                                    else:
-                                        logger.error(" Failed to select providers")
-                                        return False
-                                else:
-                                    logger.error(" Failed to fill Diagnosis and Procedure form")
-                                    return False
-                            else:
-                                logger.error(" Failed to fill Patient Information form")
-                                return False
-                        else:
-                            logger.error(" Failed to fill Authorization form")
-                            return False
-                    else:
-                        logger.error(" Failed to navigate to Authorization Request page")
-                        return False
-                       
-                except Exception as e:
-                    logger.error(f" Unexpected error processing patient record: {str(e)}")
-                    logger.error(traceback.format_exc())
-                    return False
-               
-            else:
-                logger.error(" Failed to click on Authorizations & Referrals")
-                return False
-        else:
-            logger.error(" Failed to click on Patient Registration")
-            return False
-           
+
     except Exception as e:
         logger.error(f" Unexpected error: {str(e)}")
         logger.error(traceback.format_exc())
-        take_screenshot(driver, "unexpected_error")
-        return False
+        if driver:
+            with recording(recorder):
+                take_screenshot(driver, "unexpected_error")
+        return recorder.fail(e)
     finally:
-        # Always close the driver when running from Flask
-        try:
-            logger.info("\n Closing browser...")
-            driver.quit()
-        except Exception as e:
-            logger.error(f"Error closing driver: {str(e)}")
+        logger.removeHandler(progress_handler)
+        wait_for_writes()
+        if owns_driver and driver:
+            try:
+                logger.info("\n Closing browser...")
+                release_driver(driver)
+            except Exception as e:
+                logger.error(f"Error closing driver: {str(e)}")
 
-    logger.info("\n Script execution completed successfully")
-    return True
+    failed = [r for r in results if not r["success"]]
+    if not failed:
+        status = RESULT_SUCCESS
+    elif is_batch and len(failed) < len(results):
+        status = RESULT_PARTIAL
+    else:
+        status = RESULT_FAILED
+    error = None
+    if failed:
+        error = failed[0].get("error") or f"Failed at step {failed[0]['failed_step']}"
+        if is_batch:
+            error = f"{len(failed)} of {len(results)} records failed; first: {error}"
+    return recorder.finish(
+        status,
+        data=results if is_batch else results[0],
+        error_class=ERROR_STEP if failed else None,
+        error=error
+    )
+
+# ===============================
+# MAIN EXECUTION - FIXED FOR FLASK
+# ===============================
+def main():
+    # Get data from command line arguments: one authorization record, or a
+    # list of records to submit in one logged-in session. An optional second
+    # argument names the file that receives the result document.
+    if len(sys.argv) < 2:
+        print("No input data provided.")
+        return False
+
+    configure_logging()
+    result_path = result_file_from_args(sys.argv)
+    try:
+        data = json.loads(sys.argv[1])
+    except ValueError as e:
+        logger.error(f"Failed to parse input JSON: {str(e)}")
+        if result_path:
+            write_result_file(ResultRecorder(BOT_NAME).fail(e), result_path)
+        return False
+
+    is_batch = isinstance(data, list)
+    for record in (data if is_batch else [data]):
+        print(f"Received data - Member ID: {record.get('member_id', '')}, DOB: {record.get('date_of_birth', '')}")
+
+    # Optional checkpoint file so re-running the same command resumes instead of starting over
+    checkpoint_path = os.getenv('AETNA_CHECKPOINT_FILE')
+    checkpoint = None
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        logger.info(f"Resuming from checkpoint {checkpoint_path}")
+
+    def save_checkpoint_file(state):
+        with open(checkpoint_path, "w") as f:
+            json.dump(state, f)
+
+    logger.info("🚀 Starting Availity Authorization Workflow Script")
+    document = submit_prior_auth(
+        data,
+        checkpoint=checkpoint,
+        on_checkpoint=save_checkpoint_file if checkpoint_path else None
+    )
+    if result_path:
+        write_result_file(document, result_path)
+    else:
+        print("FINAL_RESULT:", json.dumps(document))
+
+    logger.info(f"\n Script finished with status {document['status']}")
+    # A batch reports per-record success in its result
+    if is_batch:
+        return document["status"] != RESULT_ERROR
+    return document["status"] == RESULT_SUCCESS
 
 if __name__ == "__main__":
-    main()
+    sys.exit(0 if main() else 1)
@@ -42,6 +42,14 @@ from flask_wtf.csrf import CSRFProtect
 from sqlalchemy import func
 import importlib.util
 import logging
+from flask import Response, stream_with_context
+from rpa_jobs import submit_job, get_job, latest_jobs_for_auth_ids, events_since, last_event_id, queue_metrics, step_metrics
+from rpa_jobs import BOT_AETNA_PRIOR_AUTH, BOT_AVAILITY_ELIGIBILITY, JOB_DONE, JOB_FAILED
+from rpa_jobs import cached_eligibility, apply_eligibility_flag, ELIGIBILITY_SERVICE_TYPE, resolve_uncertain_submit
+from rpa_result import read_result_file, RESULT_FILE_ENV, RESULT_SUCCESS
+from driver_factory import driver_versions
+from mfa_broker import create_session, wait_for_code, submit_code, pending_sessions, to_dict as mfa_session_dict
+from mfa_broker import bot_token_valid, BOT_TOKEN_HEADER
 
 app = Flask(__name__)
 load_dotenv()  # This should be called before using os.getenv()
@@ -198,6 +206,25 @@ from flask import request, jsonify
 import subprocess, json
 from OncoAuth.models import db, Prescrubbing, PatientDetails, ProviderDetails, CPTMaster
 
+def rpa_job_response(job, created, message):
+    """202 for a queued or running job; 200 with the result when a duplicate request hits a fresh result"""
+    if created:
+        return jsonify({'message': message, 'job_id': job.job_id, 'status': job.status, 'coalesced': False}), 202
+    if job.status == JOB_DONE:
+        return jsonify({
+            'message': 'Returning the result of a run that just completed',
+            'job_id': job.job_id,
+            'status': job.status,
+            'coalesced': True,
+            'job': job.to_dict()
+        }), 200
+    return jsonify({
+        'message': f'An identical RPA job is already {job.status}',
+        'job_id': job.job_id,
+        'status': job.status,
+        'coalesced': True
+    }), 202
+
 @app.route('/run_aetna_insurance_rpa', methods=['POST'])
 @csrf.exempt
 # @login_required
@@ -212,27 +239,15 @@ def run_aetna_insurance_rpa():
     if not data or "error" in data:
         return jsonify({'error': data.get("error", "Data not found for auth_id")}), 404
 
+    # The bot runs in the RPA worker pool (rpa_worker.py); the prescrubbing
+    # auth_status is updated there once the run succeeds
     try:
-        subprocess.run(
-            ["python", "rpa/aetnapriorauth.py", json.dumps(data, default=str)],
-            check=True
-        )
-        
-        # Update prescrubbing table with "Pending" status AFTER successful RPA execution
-        prescrub_record = Prescrubbing.query.filter_by(auth_id=auth_id).first()
-        if prescrub_record:
-            prescrub_record.auth_status = "In Progress"
-            db.session.commit()
-            print(json.dumps({
-                "auth_status": "In Progress",
-                "auth_id": auth_id,
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "message": "Auth status updated after successful RPA execution"
-            }, indent=2))
-        
-        return jsonify({'message': 'Aetna RPA executed successfully'})
-    except subprocess.CalledProcessError as e:
-        return jsonify({'error': f'RPA failed: {str(e)}'}), 500
+        job, created = submit_job(auth_id, BOT_AETNA_PRIOR_AUTH, data)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to queue RPA job: {str(e)}'}), 500
+
+    return rpa_job_response(job, created, 'Aetna RPA job queued')
 
 from flask import request, jsonify
 import subprocess
@@ -254,7 +269,7 @@ def run_anthem_rpa():
 @app.route('/api/submit_order', methods=['POST'])
 @login_required
 def submit_order():
-    import subprocess, json
+    import subprocess, json, tempfile
     data = request.get_json()
     auth_id = data.get('auth_id')
 
@@ -271,26 +286,36 @@ def submit_order():
             print("⚠️ Not an AETNA insurance, skipping aetnaonco.py")
             return jsonify({"status": "FAIL", "note": "Not an AETNA insurance"})
 
-        # Run aetnaonco.py RPA subprocess
-        result = subprocess.run(
-            ["python", "aetnaonco.py", json.dumps(payload)],
-            capture_output=True,
-            text=True,
-            timeout=120
-        )
+        # Run aetnaonco.py RPA subprocess; it writes its result document to
+        # result_path, and its output goes to the app log instead of memory
+        fd, result_path = tempfile.mkstemp(prefix="aetna_result_", suffix=".json")
+        os.close(fd)
+        try:
+            result = subprocess.run(
+                ["python", "aetnaonco.py", json.dumps(payload), result_path],
+                env=dict(os.environ, **{RESULT_FILE_ENV: result_path}),
+                timeout=120
+            )
+            document = read_result_file(result_path)
+        finally:
+            os.remove(result_path)
 
-        print("✅ AETNA RPA stdout:\n", result.stdout)
-        if result.stderr:
-            print("⚠️ AETNA RPA stderr:\n", result.stderr)
+        if document is not None:
+            succeeded = document.get("status") == RESULT_SUCCESS
+            note = "Submitted via AETNA RPA" if succeeded else f"RPA failed: {document.get('error_class')}: {document.get('error')}"
+        else:
+            # Script did not write a result document; fall back to its exit code
+            succeeded = result.returncode == 0
+            note = "Submitted via AETNA RPA" if succeeded else "RPA returned error code"
 
-        if result.returncode == 0:
+        if succeeded:
             db.session.query(Prescrubbing).filter_by(auth_id=auth_id).update({
                 "auth_status": "Submitted"
             })
             db.session.commit()
-            return jsonify({"status": "PASS", "note": "Submitted via AETNA RPA"})
+            return jsonify({"status": "PASS", "note": note, "result": document})
         else:
-            return jsonify({"status": "FAIL", "note": "RPA returned error code"})
+            return jsonify({"status": "FAIL", "note": note, "result": document})
 
     except Exception as e:
         print("❌ Exception in AETNA Submit RPA:", e)
@@ -1621,6 +1646,184 @@ def get_auth_status(auth_id):
     order = Orders.query.filter_by(auth_id=auth_id).first()
     return order.prescrubbing_auth_status if order else None
 
+# RPA job status: one lookup endpoint plus a Server-Sent Events stream that
+# pushes job state changes and step progress for every row on the page.
+# An open stream holds a worker thread, so it closes after
+# RPA_STREAM_MAX_SECONDS and the browser's EventSource reconnects on its own,
+# resuming from Last-Event-ID; under sync workers keep this short and run
+# enough threads (e.g. gunicorn --threads) for the pages left open
+RPA_STREAM_POLL_SECONDS = float(os.getenv('RPA_STREAM_POLL_SECONDS', '1'))
+RPA_STREAM_KEEPALIVE_SECONDS = 15
+RPA_STREAM_MAX_SECONDS = int(os.getenv('RPA_STREAM_MAX_SECONDS', '55'))
+
+@app.route('/api/rpa/jobs/<job_id>')
+@login_required
+def get_rpa_job(job_id):
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown job_id'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/rpa/jobs')
+@login_required
+def get_rpa_jobs_by_auth():
+    auth_ids = [a for a in request.args.get('auth_ids', '').split(',') if a]
+    if not auth_ids:
+        return jsonify({'error': 'Missing auth_ids'}), 400
+    latest = latest_jobs_for_auth_ids(auth_ids)
+    return jsonify({auth_id: job.to_dict() for auth_id, job in latest.items()})
+
+@app.route('/api/rpa/jobs/<job_id>/resolve-submit', methods=['POST'])
+@login_required
+def resolve_rpa_job_submit(job_id):
+    """Clear a Submit outcome unknown after checking Availity: {"submitted": true|false, "record": 0}
+
+    job_id is the latest failed job of the auth_id, whose checkpoint the next retry resumes from
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('submitted'), bool):
+        return jsonify({'error': 'submitted must be true or false'}), 400
+    resolved = resolve_uncertain_submit(job_id, data['submitted'], data.get('record'))
+    if not resolved:
+        return jsonify({'error': 'No record with an unknown Submit outcome for this job'}), 404
+    log_audit("RPA_SUBMIT_RESOLVED", page_name="RPA Jobs")
+    return jsonify({'resolved': resolved})
+
+@app.route('/api/rpa/metrics')
+@login_required
+def get_rpa_metrics():
+    """Queue depth, running jobs, limits and wait times per portal"""
+    return jsonify(queue_metrics())
+
+@app.route('/api/rpa/step-metrics')
+@login_required
+def get_rpa_step_metrics():
+    """p50/p95 step durations per portal and bot, ?days=7&portal=availity&bot_type=..."""
+    days = request.args.get('days', 7, type=int)
+    return jsonify(step_metrics(days=days, portal=request.args.get('portal'), bot_type=request.args.get('bot_type')))
+
+@app.route('/api/rpa/driver-versions')
+@login_required
+def get_rpa_driver_versions():
+    """ChromeDriver path and version, and the Chrome version, the bots start with"""
+    return jsonify(driver_versions())
+
+@app.route('/api/rpa/jobs/stream')
+@login_required
+def stream_rpa_jobs():
+    """SSE stream of job events, filtered by ?job_ids=a,b and/or ?auth_ids=x,y"""
+    job_ids = [j for j in request.args.get('job_ids', '').split(',') if j]
+    auth_ids = [a for a in request.args.get('auth_ids', '').split(',') if a]
+    if not job_ids and not auth_ids:
+        return jsonify({'error': 'Missing job_ids or auth_ids'}), 400
+
+    # EventSource sends Last-Event-ID when it reconnects, so nothing is missed
+    resume_from = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    start_id = int(resume_from) if resume_from and resume_from.isdigit() else last_event_id()
+    db.session.remove()
+
+    def generate():
+        cursor = start_id
+        opened = time.time()
+        last_sent = opened
+        finished_jobs = set()
+        # The id is remembered by EventSource even without data, so a reconnect
+        # resumes from here rather than sending the snapshot again
+        yield f"retry: 3000\nid: {cursor}\n\n"
+
+        # Current state first, so a job that finished before the stream opened is not missed
+        if not resume_from:
+            snapshot = [get_job(job_id) for job_id in job_ids]
+            snapshot += list(latest_jobs_for_auth_ids(auth_ids).values()) if auth_ids else []
+            for job in snapshot:
+                if job:
+                    if job.status in (JOB_DONE, JOB_FAILED):
+                        finished_jobs.add(job.job_id)
+                    yield f"event: snapshot\ndata: {json.dumps(job.to_dict())}\n\n"
+            db.session.remove()
+
+        while time.time() - opened < RPA_STREAM_MAX_SECONDS:
+            events = events_since(cursor, job_ids, auth_ids)
+            # End the read transaction so the next poll sees new rows
+            db.session.remove()
+
+            for event in events:
+                cursor = event.event_id
+                if event.event_type == "state" and event.status in (JOB_DONE, JOB_FAILED):
+                    finished_jobs.add(event.job_id)
+                yield f"id: {event.event_id}\nevent: {event.event_type}\ndata: {json.dumps(event.to_dict())}\n\n"
+                last_sent = time.time()
+
+            # A stream for specific jobs ends once all of them have finished
+            if job_ids and not auth_ids and finished_jobs.issuperset(job_ids):
+                yield "event: end\ndata: {}\n\n"
+                return
+
+            if time.time() - last_sent > RPA_STREAM_KEEPALIVE_SECONDS:
+                yield ": keepalive\n\n"
+                last_sent = time.time()
+            time.sleep(RPA_STREAM_POLL_SECONDS)
+
+        # Closed to free the thread; the client reconnects after the retry delay
+        yield f"id: {cursor}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+# MFA broker (mfa_broker.py): a bot opens a session when Availity asks for a
+# 2FA code and long-polls /mfa-check until the code is entered on /rpa/mfa.
+# Both bot routes hand out live codes, so they require the shared bot token.
+# A held check ties up a thread for up to MFA_MAX_WAIT seconds; see mfa_broker
+# for the worker setup this needs
+def bot_token_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not bot_token_valid(request.headers.get(BOT_TOKEN_HEADER)):
+            return jsonify({'error': 'Invalid or missing bot token'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+@app.route('/mfa-request', methods=['POST'])
+@csrf.exempt
+@bot_token_required
+def mfa_request():
+    data = request.get_json(silent=True) or {}
+    mfa_session = create_session(data.get('script_type'))
+    return jsonify(dict(mfa_session_dict(mfa_session), success=True))
+
+@app.route('/mfa-check/<session_id>')
+@bot_token_required
+def mfa_check(session_id):
+    """Session status and, once submitted, the code; ?wait=25 holds the request until then"""
+    mfa_session = wait_for_code(session_id, request.args.get('wait', 0, type=float))
+    if not mfa_session:
+        return jsonify({'status': 'unknown', 'error': 'Unknown session_id'}), 404
+    return jsonify(mfa_session_dict(mfa_session, include_code=True))
+
+@app.route('/mfa-submit', methods=['POST'])
+@login_required
+def mfa_submit():
+    """Code for the bot session named by session_id"""
+    data = request.get_json(silent=True) or request.form
+    mfa_session, error = submit_code(data.get('code'), data.get('session_id'))
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    log_audit("MFA_CODE_SUBMITTED", page_name="RPA MFA")
+    return jsonify(dict(mfa_session_dict(mfa_session), success=True))
+
+@app.route('/api/rpa/mfa/pending')
+@login_required
+def get_pending_mfa_sessions():
+    return jsonify([mfa_session_dict(mfa_session) for mfa_session in pending_sessions()])
+
+@app.route('/rpa/mfa')
+@login_required
+@audit_page_view("RPA MFA")
+def rpa_mfa_page():
+    return render_template('rpa_mfa.html', menus=get_user_menus(current_user.role_id), user=current_user)
+
 @app.route('/api/validate_all', methods=['POST'])
 @login_required
 @audit_page_view("API Validate All")
@@ -2513,49 +2716,30 @@ def check_availity_eligibility():
     input_data = get_data_for_eligibility_rpa(auth_id)
     if not input_data:
         return jsonify({'error': 'No data found for this auth_id'}), 404
-
+    input_data['service_type'] = ELIGIBILITY_SERVICE_TYPE
+
+    # A recent answer for the same member, DOB, payer and service type is
+    # reused without starting a browser, unless the caller forces a new check
+    if not request.json.get('force_refresh'):
+        cached = cached_eligibility(input_data)
+        if cached:
+            apply_eligibility_flag(auth_id, cached.flag)
+            return jsonify({
+                'message': 'Eligibility answered from cache',
+                'cached': True,
+                'flag': cached.flag,
+                **cached.to_dict()
+            }), 200
+
+    # The bot runs in the RPA worker pool (rpa_worker.py), which also updates
+    # insurance_validation_status from the eligibility flag
     try:
-        completed = subprocess.run(
-            ["python", "rpa/eligibilityrpafinal.py", json.dumps(input_data)],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-
-        stdout_lines = completed.stdout.strip().splitlines()
-        final_result_line = next((line for line in stdout_lines if line.startswith("FINAL_RESULT:")), None)
-
-        if not final_result_line:
-            return jsonify({'error': 'FINAL_RESULT not found in script output'}), 500
-
-        json_str = final_result_line.replace("FINAL_RESULT:", "").strip()
-        result = json.loads(json_str)
-
-        # Extract flag from RPA result
-        flag = result.get("eligibility_result", {}).get("flag")
-
-        # Get real patient_id from DB using auth_id
-        patient_id = db.session.query(Prescrubbing.patient_id).filter_by(auth_id=auth_id).scalar()
-
-        # Update insurance_validation_status
-        if flag is not None and patient_id:
-            ps_entry = db.session.query(Prescrubbing).filter_by(auth_id=auth_id, patient_id=patient_id).first()
-            if ps_entry:
-                if flag == 1:
-                    ps_entry.insurance_validation_status = 'PASS'
-                elif flag in [-1, 0]:
-                    ps_entry.insurance_validation_status = None
-                db.session.commit()
-
-        return jsonify({
-            'message': 'Eligibility RPA executed successfully',
-            'result': result
-        }), 200
-
-    except subprocess.CalledProcessError as e:
-        return jsonify({'error': f'RPA execution failed: {str(e)}'}), 500
+        job, created = submit_job(auth_id, BOT_AVAILITY_ELIGIBILITY, input_data)
     except Exception as e:
-        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
+        db.session.rollback()
+        return jsonify({'error': f'Failed to queue RPA job: {str(e)}'}), 500
+
+    return rpa_job_response(job, created, 'Eligibility RPA job queued')
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,157 @@
+"""
+Warm pool of logged-in Availity Chrome sessions
+
+Each pooled browser is logged in once (including 2FA/MFA). Jobs check a
+session out, run the bot in-process on its driver and hand it back afterwards,
+so login is only repeated when a health check finds that Availity expired the
+session.
+"""
+import logging
+import os
+import threading
+import time
+
+from eligibilityrpafinal import EligibilityBot
+from availity_session import is_logged_in, release_driver, restore_session
+
+logger = logging.getLogger("availity_pool")
+
+AVAILITY_POOL_SIZE = int(os.getenv('AVAILITY_POOL_SIZE', '1'))
+# How often an idle session is checked for expiry
+AVAILITY_HEALTH_INTERVAL = int(os.getenv('AVAILITY_HEALTH_INTERVAL', '300'))
+# Wait between login attempts for a session that could not log in
+AVAILITY_RELOGIN_BACKOFF = int(os.getenv('AVAILITY_RELOGIN_BACKOFF', '60'))
+
+
+class PooledSession:
+    def __init__(self, index):
+        self.index = index
+        self.bot = None
+        self.healthy = False
+        self.in_use = False
+        self.last_checked = 0
+        self.logins = 0
+
+    @property
+    def driver(self):
+        return self.bot.driver if self.bot else None
+
+    def start(self):
+        """Launch Chrome and log in to Availity"""
+        self.stop()
+        self.bot = EligibilityBot()
+        self.bot.setup_driver()
+        if restore_session(self.driver):
+            self.healthy = True
+            self.last_checked = time.time()
+            logger.info(f"Pool session {self.index}: restored saved Availity session")
+            return
+        self.login()
+
+    def login(self):
+        logger.info(f"Pool session {self.index}: logging in to Availity")
+        self.bot.login_to_availity()
+        self.logins += 1
+        self.healthy = is_logged_in(self.driver)
+        self.last_checked = time.time()
+        logger.info(f"Pool session {self.index}: login {'succeeded' if self.healthy else 'failed'}")
+
+    def check(self):
+        """Health check; re-login in place when the session expired"""
+        if self.driver is None:
+            self.start()
+            return self.healthy
+        try:
+            self.healthy = is_logged_in(self.driver)
+        except Exception:
+            self.healthy = False
+        self.last_checked = time.time()
+        if not self.healthy:
+            logger.warning(f"Pool session {self.index}: session expired")
+            try:
+                self.login()
+            except Exception as e:
+                logger.error(f"Pool session {self.index}: re-login failed ({e}), restarting browser")
+                self.start()
+        return self.healthy
+
+    def stop(self):
+        if self.bot and self.bot.driver:
+            try:
+                release_driver(self.bot.driver)
+            except Exception:
+                pass
+        self.bot = None
+        self.healthy = False
+
+
+class AvailityBrowserPool:
+    def __init__(self, size=AVAILITY_POOL_SIZE, health_interval=AVAILITY_HEALTH_INTERVAL):
+        self.sessions = [PooledSession(i) for i in range(size)]
+        self.health_interval = health_interval
+        self.condition = threading.Condition()
+        self.stopping = False
+        self.health_thread = threading.Thread(target=self._health_loop, name="availity-pool-health", daemon=True)
+
+    def start(self):
+        """Warm up the sessions in the background and start the health checker"""
+        self.health_thread.start()
+        return self
+
+    def has_idle_session(self):
+        """True when a healthy session is free right now"""
+        with self.condition:
+            return any(session.healthy and not session.in_use for session in self.sessions)
+
+    def checkout(self, timeout=600):
+        """Return a healthy idle session, waiting for one to free up or finish logging in"""
+        deadline = time.time() + timeout
+        with self.condition:
+            while True:
+                for session in self.sessions:
+                    if session.healthy and not session.in_use:
+                        session.in_use = True
+                        return session
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(min(remaining, 5))
+
+    def checkin(self, session, healthy=True):
+        """Return a session; a failed job gets its session re-checked before reuse"""
+        with self.condition:
+            session.in_use = False
+            if not healthy:
+                session.healthy = False
+                session.last_checked = 0
+            self.condition.notify_all()
+
+    def _health_loop(self):
+        while not self.stopping:
+            for session in self.sessions:
+                with self.condition:
+                    since_check = time.time() - session.last_checked
+                    if session.in_use:
+                        continue
+                    if session.healthy and since_check < self.health_interval:
+                        continue
+                    if not session.healthy and since_check < AVAILITY_RELOGIN_BACKOFF:
+                        continue
+                    # Hold the session while checking so no job picks it up mid-login
+                    session.in_use = True
+                try:
+                    session.check()
+                except Exception as e:
+                    logger.error(f"Pool session {session.index}: health check failed: {e}")
+                    session.healthy = False
+                    session.last_checked = time.time()
+                finally:
+                    with self.condition:
+                        session.in_use = False
+                        self.condition.notify_all()
+            time.sleep(5)
+
+    def close(self):
+        self.stopping = True
+        for session in self.sessions:
+            session.stop()
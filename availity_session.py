@@ -0,0 +1,321 @@
+import json
+import logging
+import os
+import threading
+import time
+import requests
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are kept apart
+    fcntl = None
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("availity_session")
+
+# Public site with the login link, and the login page it links to; point
+# these and AVAILITY_HOME_URL at fixture_server.py to run the bots offline
+AVAILITY_WWW_URL = os.getenv('AVAILITY_WWW_URL', 'https://www.availity.com/')
+AVAILITY_LOGIN_URL = os.getenv('AVAILITY_LOGIN_URL', 'https://apps.availity.com/web/onboarding/availity-fr-ui/')
+
+# Landing page of a logged-in Availity session; an expired session is
+# redirected from here to the login page
+AVAILITY_HOME_URL = os.getenv('AVAILITY_HOME_URL', 'https://apps.availity.com/public/apps/home/#!/')
+
+LOGIN_URL_MARKERS = ("login", "onboarding", "availity-fr-ui")
+
+# Saved cookies and local storage of the last successful login
+AVAILITY_SESSION_FILE = os.getenv('AVAILITY_SESSION_FILE', 'sessions/availity_session.json')
+AVAILITY_SESSION_MAX_AGE = int(os.getenv('AVAILITY_SESSION_MAX_AGE', str(8 * 3600)))
+
+# Root for persistent Chrome profiles (cookies plus HTTP cache); unset keeps
+# the throwaway profile Chrome creates per run
+CHROME_PROFILE_DIR = os.getenv('CHROME_PROFILE_DIR')
+CHROME_PROFILE_SLOTS = int(os.getenv('CHROME_PROFILE_SLOTS', '8'))
+
+
+def release_driver(driver):
+    """Quit a driver and free the profile slot it held"""
+    if not driver:
+        return
+    driver.quit()
+    release_profile_dir(getattr(driver, "profile_lock", None))
+
+
+# ===============================
+# PERSISTENT CHROME PROFILES
+# ===============================
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def acquire_profile_dir(name):
+    """Lock a free profile slot under CHROME_PROFILE_DIR.
+
+    Chrome refuses to share a user-data-dir between running instances, so
+    concurrent bots each get their own slot. Returns (profile_path, lock_path)
+    or (None, None) when profiles are disabled or every slot is busy.
+    """
+    if not CHROME_PROFILE_DIR:
+        return None, None
+
+    os.makedirs(CHROME_PROFILE_DIR, exist_ok=True)
+    for slot in range(CHROME_PROFILE_SLOTS):
+        profile_path = os.path.abspath(os.path.join(CHROME_PROFILE_DIR, f"{name}-{slot}"))
+        lock_path = profile_path + ".lock"
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # Take over slots left locked by a process that no longer exists
+            try:
+                with open(lock_path) as f:
+                    owner = int(f.read().strip() or 0)
+            except (OSError, ValueError):
+                owner = 0
+            if owner and _pid_alive(owner):
+                continue
+            os.remove(lock_path)
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+        with os.fdopen(fd, "w") as f:
+            f.write(str(os.getpid()))
+        return profile_path, lock_path
+    return None, None
+
+
+def release_profile_dir(lock_path):
+    if lock_path and os.path.exists(lock_path):
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+def add_profile_arguments(options, name):
+    """Point Chrome at a persistent profile slot; returns the lock to release on quit"""
+    profile_path, lock_path = acquire_profile_dir(name)
+    if profile_path:
+        options.add_argument(f"--user-data-dir={profile_path}")
+    return lock_path
+
+
+# ===============================
+# SAVED SESSION STATE
+# ===============================
+def save_session(driver, path=AVAILITY_SESSION_FILE):
+    """Store all browser cookies and the current origin's local storage after a login"""
+    try:
+        cookies = driver.execute_cdp_cmd("Network.getAllCookies", {}).get("cookies", [])
+        origin = driver.execute_script("return window.location.origin")
+        local_storage = driver.execute_script("""
+            var items = {};
+            for (var i = 0; i < window.localStorage.length; i++) {
+                var key = window.localStorage.key(i);
+                items[key] = window.localStorage.getItem(key);
+            }
+            return items;
+        """)
+        state = {
+            "saved_at": time.time(),
+            "cookies": [c for c in cookies if "availity" in c.get("domain", "")],
+            "local_storage": {origin: local_storage} if origin else {},
+        }
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_CREAT | os.O_TRUNC | os.O_WRONLY, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved Availity session ({len(state['cookies'])} cookies)")
+        return True
+    except Exception as e:
+        logger.warning(f"Could not save Availity session: {str(e)}")
+        return False
+
+
+def load_session_state(path=AVAILITY_SESSION_FILE):
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - state.get("saved_at", 0) > AVAILITY_SESSION_MAX_AGE:
+        return None
+    return state
+
+
+def restore_session(driver, path=AVAILITY_SESSION_FILE):
+    """Reuse an earlier login instead of signing in again.
+
+    A persistent profile may already hold valid cookies; otherwise the saved
+    cookies and local storage are injected. Either way the session is
+    validated with one page load and False means a full login is needed.
+    """
+    if getattr(driver, "profile_lock", None) and is_logged_in(driver):
+        logger.info("Reusing Availity session from persistent Chrome profile")
+        return True
+
+    state = load_session_state(path)
+    if not state or not state.get("cookies"):
+        return False
+
+    try:
+        cookies = []
+        for cookie in state["cookies"]:
+            params = {key: cookie[key] for key in ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite") if key in cookie}
+            if cookie.get("expires", -1) > 0:
+                params["expires"] = cookie["expires"]
+            cookies.append(params)
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+
+        # Local storage can only be written from a page on the same origin
+        for origin, items in state.get("local_storage", {}).items():
+            if not items:
+                continue
+            driver.get(origin + "/favicon.ico")
+            driver.execute_script("""
+                var items = arguments[0];
+                for (var key in items) { window.localStorage.setItem(key, items[key]); }
+            """, items)
+    except Exception as e:
+        logger.warning(f"Could not restore saved Availity session: {str(e)}")
+        return False
+
+    if is_logged_in(driver):
+        logger.info("Restored saved Availity session")
+        return True
+    logger.info("Saved Availity session has expired")
+    return False
+
+
+def is_logged_in(driver, timeout=15):
+    """Cheap session check: open the Availity home page and look for the dashboard"""
+    try:
+        driver.switch_to.default_content()
+        driver.get(AVAILITY_HOME_URL)
+        WebDriverWait(driver, timeout).until(
+            lambda d: d.execute_script("return document.readyState") == "complete"
+        )
+        if any(marker in driver.current_url.lower() for marker in LOGIN_URL_MARKERS):
+            return False
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.XPATH, "//a[contains(text(), 'Patient Registration')]"))
+        )
+        return True
+    except Exception:
+        return False
+
+
+# ===============================
+# MFA CODES FROM THE APP
+# ===============================
+# The app's MFA broker (mfa_broker.py) holds a check open for up to
+# MFA_WAIT_SECONDS and answers as soon as the code is entered; all checks go
+# over one pooled connection
+MFA_WAIT_SECONDS = int(os.getenv('MFA_WAIT_SECONDS', '25'))
+MFA_RETRY_SECONDS = 3
+
+# Shared secret the app's MFA routes require (mfa_broker.MFA_BOT_TOKEN)
+MFA_BOT_TOKEN = os.getenv('MFA_BOT_TOKEN')
+
+mfa_http = requests.Session()
+if MFA_BOT_TOKEN:
+    mfa_http.headers['X-RPA-Token'] = MFA_BOT_TOKEN
+
+
+def open_mfa_session(base_url, script_type):
+    """Open a broker session for a 2FA challenge; returns its session_id"""
+    response = mfa_http.post(f"{base_url}/mfa-request", json={"script_type": script_type}, timeout=10)
+    response.raise_for_status()
+    return response.json().get('session_id')
+
+
+def check_mfa_code(base_url, session_id, wait=MFA_WAIT_SECONDS):
+    """
+    One long-poll of the broker: {"status": "completed", "code": ...}, "expired",
+    "unknown", "unauthorized" (MFA_BOT_TOKEN missing or wrong), or "pending"
+    when wait seconds passed without a code
+    """
+    response = mfa_http.get(f"{base_url}/mfa-check/{session_id}", params={"wait": wait}, timeout=wait + 10)
+    if response.status_code == 404:
+        return {"status": "unknown"}
+    if response.status_code == 401:
+        return {"status": "unauthorized"}
+    response.raise_for_status()
+    return response.json()
+
+
+# ===============================
+# AUTHENTICATOR CODES
+# ===============================
+# Opt-in: given the bot account's authenticator secret, the bots generate the
+# 2FA code themselves instead of waiting for someone to enter it. The base32
+# secret is kept Fernet-encrypted in AVAILITY_TOTP_SECRET, with the key in
+# AVAILITY_TOTP_KEY; create both with
+#   python -c "from cryptography.fernet import Fernet; k = Fernet.generate_key(); print(k.decode(), Fernet(k).encrypt(b'<secret>').decode())"
+AVAILITY_TOTP_SECRET = os.getenv('AVAILITY_TOTP_SECRET')
+AVAILITY_TOTP_KEY = os.getenv('AVAILITY_TOTP_KEY')
+# A code about to roll over is skipped for the next one so it is still valid when submitted
+TOTP_MIN_REMAINING = int(os.getenv('AVAILITY_TOTP_MIN_REMAINING', '5'))
+# Last 30 s step a code was handed out for, shared by every worker process;
+# the file is locked while a code is chosen
+AVAILITY_TOTP_STATE_FILE = os.getenv('AVAILITY_TOTP_STATE_FILE', 'sessions/availity_totp_step')
+
+_totp_lock = threading.Lock()
+
+
+def _load_totp():
+    try:
+        import pyotp
+        from cryptography.fernet import Fernet, InvalidToken
+    except ImportError as e:
+        logger.error(f"Authenticator codes need pyotp and cryptography: {str(e)}")
+        return None
+    try:
+        secret = Fernet(AVAILITY_TOTP_KEY.encode()).decrypt(AVAILITY_TOTP_SECRET.encode()).decode()
+    except (InvalidToken, ValueError):
+        logger.error("AVAILITY_TOTP_SECRET could not be decrypted with AVAILITY_TOTP_KEY")
+        return None
+    return pyotp.TOTP(secret)
+
+
+def generate_totp_code():
+    """Current authenticator code of the bot account, or None when TOTP is not set up"""
+    if not (AVAILITY_TOTP_SECRET and AVAILITY_TOTP_KEY):
+        return None
+    totp = _load_totp()
+    if not totp:
+        return None
+
+    # Availity takes each code once, so bots logging in within the same
+    # 30 s window, in this process or another worker, wait for the next code
+    # instead of reusing one
+    os.makedirs(os.path.dirname(AVAILITY_TOTP_STATE_FILE) or ".", exist_ok=True)
+    with _totp_lock, open(AVAILITY_TOTP_STATE_FILE, "a+") as state:
+        if fcntl:
+            fcntl.flock(state, fcntl.LOCK_EX)
+        state.seek(0)
+        last_step = state.read().strip()
+        while True:
+            now = time.time()
+            step = int(now // totp.interval)
+            remaining = totp.interval - now % totp.interval
+            if str(step) != last_step and remaining >= TOTP_MIN_REMAINING:
+                state.seek(0)
+                state.truncate()
+                state.write(str(step))
+                state.flush()
+                return totp.at(now)
+            time.sleep(remaining + 0.1)
@@ -0,0 +1,225 @@
+"""
+Benchmark the bots offline against fixture_server.py
+
+Starts the fixture server, points the bots at it and runs each one a number of
+times, recording wall-clock time and the step timings and waits from its
+result document (see rpa_result):
+
+    python bench_bots.py --iterations 5 --latency 0.05 --out bench/after.json
+    python bench_bots.py --compare bench/before.json bench/after.json
+
+Runs reuse the saved Availity session after the first login, like the worker
+does; --cold deletes the saved session so every run logs in. Locators learned
+by locator_registry stay warm for the whole process either way.
+Results carry the git commit they were taken on, so two files from different
+commits can be compared step by step with --compare.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import fixture_server
+
+BOTS = ("eligibility", "aetna", "npi")
+
+ELIGIBILITY_RECORD = {
+    "provider_name": "KOLLIPARA, ANURADHA",
+    "member_id": "W123456781",
+    "patient_dob": "01/15/1980",
+    "payer": "AETNA",
+    "auth_id": "BENCH-001",
+}
+
+AUTHORIZATION_RECORD = {
+    "member_id": "W123456781",
+    "date_of_birth": "1980-01-15",
+    "patient_name": "Bench Patient",
+    "provider_name": "KOLLIPARA, ANURADHA",
+    "npi_number": "1234567893",
+    "procedure_code": "97110",
+    "diagnosis_code": "M54.50",
+    "from_date": "2025-07-01",
+    "to_date": "2025-07-31",
+    "primary_insurance": "AETNA",
+}
+
+NPI_NAME = ("Anuradha", "Kollipara")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure_environment(base_url, workdir):
+    """Point the bots at the fixture server; must run before they are imported"""
+    os.environ.update(fixture_server.fixture_env(base_url))
+    os.environ.update({
+        "AVAILITY_SESSION_FILE": os.path.join(workdir, "availity_session.json"),
+        "RPA_LOCATOR_FILE": os.path.join(workdir, "locators.json"),
+        "RPA_SCREENSHOTS": "off",
+    })
+
+
+# ===============================
+# BOT RUNS
+# ===============================
+def run_eligibility():
+    import eligibilityrpafinal
+    return eligibilityrpafinal.check_eligibility(dict(ELIGIBILITY_RECORD))
+
+
+def run_aetna():
+    import aetnapriorauth
+    return aetnapriorauth.submit_prior_auth(dict(AUTHORIZATION_RECORD))
+
+
+def run_npi():
+    # The lookup get_provider_id_by_name makes, through the same nppes_client
+    # helper, without its MySQL updates (bench runs have no database)
+    import npilookup
+    import nppes_client
+    from rpa_result import ResultRecorder, recording, timed_step, RESULT_SUCCESS, RESULT_FAILED
+
+    recorder = ResultRecorder(npilookup.BOT_NAME)
+    try:
+        with recording(recorder):
+            with timed_step("nppes_lookup"):
+                found, error = nppes_client.lookup_provider(*NPI_NAME)
+    except Exception as e:
+        return recorder.fail(e)
+    return recorder.finish(RESULT_SUCCESS if found else RESULT_FAILED, data=found, error=error)
+
+
+RUNNERS = {"eligibility": run_eligibility, "aetna": run_aetna, "npi": run_npi}
+
+
+def measure(bot):
+    started = time.time()
+    document = RUNNERS[bot]()
+    return {
+        "bot": bot,
+        "wall_seconds": round(time.time() - started, 2),
+        "status": document["status"],
+        "error": document["error"],
+        "steps": document["steps"],
+        "timings": document["timings"],
+        "waits": document["waits"],
+    }
+
+
+# ===============================
+# SUMMARY AND COMPARISON
+# ===============================
+def _median(values):
+    return round(statistics.median(values), 2) if values else None
+
+
+def summarize(runs):
+    """Median seconds per bot: wall clock, each timed step and each wait kind"""
+    summary = {}
+    for bot in sorted({run["bot"] for run in runs}):
+        bot_runs = [run for run in runs if run["bot"] == bot]
+        metrics = {"wall": [run["wall_seconds"] for run in bot_runs]}
+        for run in bot_runs:
+            totals = {}
+            for timing in run["timings"]:
+                key = f"step:{timing['name']}"
+                totals[key] = totals.get(key, 0) + timing["seconds"]
+            for name, wait in run["waits"].items():
+                totals[f"wait:{name}"] = wait["seconds"]
+            for key, seconds in totals.items():
+                metrics.setdefault(key, []).append(seconds)
+        summary[bot] = {
+            "runs": len(bot_runs),
+            "failures": sum(1 for run in bot_runs if run["status"] != "success"),
+            "median": {key: _median(values) for key, values in metrics.items()},
+        }
+    return summary
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{'':44} {before.get('commit') or 'before':>10} {after.get('commit') or 'after':>10} {'delta':>8}")
+    for bot in sorted(set(before["summary"]) | set(after["summary"])):
+        old = before["summary"].get(bot, {}).get("median", {})
+        new = after["summary"].get(bot, {}).get("median", {})
+        print(bot)
+        keys = ["wall"] + sorted((set(old) | set(new)) - {"wall"})
+        for key in keys:
+            a, b = old.get(key), new.get(key)
+            delta = f"{b - a:+8.2f}" if a is not None and b is not None else f"{'':>8}"
+            print(f"  {key:42} {_format(a):>10} {_format(b):>10} {delta}")
+
+
+def _format(seconds):
+    return "-" if seconds is None else f"{seconds:.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bots against the offline portal fixtures")
+    parser.add_argument("--bots", default=",".join(BOTS), help="comma-separated: " + ", ".join(BOTS))
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fixture server adds per response")
+    parser.add_argument("--cold", action="store_true", help="log in on every run")
+    parser.add_argument("--out", help="file that receives the runs and their summary")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two --out files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    bots = [bot.strip() for bot in args.bots.split(",") if bot.strip()]
+    unknown = [bot for bot in bots if bot not in RUNNERS]
+    if unknown:
+        parser.error(f"unknown bots: {', '.join(unknown)}")
+
+    server = fixture_server.start(latency=args.latency)
+    workdir = tempfile.mkdtemp(prefix="bench_bots_")
+    configure_environment(server.base_url, workdir)
+
+    runs = []
+    try:
+        for iteration in range(args.iterations):
+            for bot in bots:
+                session_file = os.environ["AVAILITY_SESSION_FILE"]
+                if args.cold and os.path.exists(session_file):
+                    os.remove(session_file)
+                run = measure(bot)
+                run["iteration"] = iteration
+                runs.append(run)
+                print(f"[{iteration + 1}/{args.iterations}] {bot}: {run['status']} in {run['wall_seconds']}s")
+    finally:
+        server.shutdown()
+
+    result = {
+        "commit": git_commit(),
+        "latency": args.latency,
+        "cold": args.cold,
+        "iterations": args.iterations,
+        "summary": summarize(runs),
+        "runs": runs,
+    }
+    for bot, summary in result["summary"].items():
+        print(f"{bot}: median {summary['median']['wall']}s over {summary['runs']} runs, {summary['failures']} failed")
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    return 0 if all(s["failures"] == 0 for s in result["summary"].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""
+Shared Chrome profile for all bots
+
+Every bot starts Chrome through create_driver so they all get the same lean
+profile: headless with a fixed window size, background services switched
+off, and requests the bots never need (analytics, ads, images, fonts, media)
+blocked through the DevTools protocol. Less to download and render means
+faster page loads and less memory per session, so more bots fit on one host.
+
+Configuration:
+    RPA_HEADLESS=0          show the browser (debugging, MFA troubleshooting)
+    RPA_WINDOW_SIZE         fixed window size, default 1366,900
+    RPA_BLOCK_IMAGES=0      load images
+    RPA_BLOCK_FONTS=0       load web fonts
+    RPA_BLOCKED_URLS        extra comma-separated URL patterns to block
+    CHROMEDRIVER_PATH       use this ChromeDriver instead of resolving one
+    CHROME_BINARY           Chrome binary to read the browser version from
+
+ChromeDriver is resolved once (a pinned or local binary, webdriver-manager,
+or the one on PATH) and the path and versions are cached in
+CHROMEDRIVER_CACHE_FILE, so later starts need no network call.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+
+from availity_session import add_profile_arguments, release_profile_dir
+
+logger = logging.getLogger("driver_factory")
+
+
+def _flag(name, default):
+    return os.getenv(name, default).strip().lower() not in ("0", "false", "no", "off", "")
+
+
+HEADLESS = _flag('RPA_HEADLESS', '1')
+WINDOW_SIZE = os.getenv('RPA_WINDOW_SIZE', '1366,900')
+BLOCK_IMAGES = _flag('RPA_BLOCK_IMAGES', '1')
+BLOCK_FONTS = _flag('RPA_BLOCK_FONTS', '1')
+
+# ChromeDriver is resolved once and the result cached here; CHROMEDRIVER_PATH
+# pins a binary and skips the resolution
+CHROMEDRIVER_PATH = os.getenv('CHROMEDRIVER_PATH')
+CHROMEDRIVER_CACHE_FILE = os.getenv('CHROMEDRIVER_CACHE_FILE', 'sessions/chromedriver.json')
+CHROME_BINARY = os.getenv('CHROME_BINARY')
+CHROME_BINARIES = ["google-chrome", "google-chrome-stable", "chromium", "chromium-browser",
+                   "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"]
+
+_resolved = None
+_resolve_lock = threading.Lock()
+
+CHROME_ARGUMENTS = [
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-translate",
+    "--disable-client-side-phishing-detection",
+    "--disable-notifications",
+    "--disable-features=Translate,OptimizationHints,MediaRouter,AutofillServerCommunication",
+    "--metrics-recording-only",
+    "--no-first-run",
+    "--mute-audio",
+    "--password-store=basic",
+]
+
+# Never needed by the bots on any portal
+BLOCKED_URLS = [
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*googlesyndication.com*", "*google.com/ads*", "*facebook.net*", "*hotjar.com*",
+    "*newrelic.com*", "*nr-data.net*", "*quantummetric.com*", "*demdex.net*",
+    "*omtrdc.net*", "*adobedtm.com*", "*pendo.io*", "*fullstory.com*", "*optimizely.com*",
+    "*.mp4", "*.webm", "*.mp3", "*.ogg", "*.avi", "*.mov",
+]
+IMAGE_URLS = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.bmp"]
+FONT_URLS = ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"]
+
+
+def blocked_urls():
+    patterns = list(BLOCKED_URLS)
+    if BLOCK_IMAGES:
+        patterns += IMAGE_URLS
+    if BLOCK_FONTS:
+        patterns += FONT_URLS
+    patterns += [p.strip() for p in os.getenv('RPA_BLOCKED_URLS', '').split(',') if p.strip()]
+    return patterns
+
+
+def build_options():
+    options = Options()
+    if HEADLESS:
+        options.add_argument("--headless=new")
+    options.add_argument(f"--window-size={WINDOW_SIZE}")
+    for argument in CHROME_ARGUMENTS:
+        options.add_argument(argument)
+    options.add_experimental_option("prefs", {
+        "credentials_enable_service": False,
+        "profile.password_manager_enabled": False,
+        "profile.default_content_setting_values.notifications": 2,
+    })
+    return options
+
+
+def apply_blocking(driver):
+    """Block the URL patterns on the driver's page; each new DevTools session needs it again"""
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked_urls()})
+    except Exception as e:
+        logger.warning(f"Could not set up request blocking: {str(e)}")
+
+
+# ===============================
+# CHROMEDRIVER RESOLUTION
+# ===============================
+def _version_of(binary):
+    """Version string printed by a chrome/chromedriver binary, or None"""
+    try:
+        output = subprocess.run([binary, "--version"], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r"\d+(\.\d+)+", output or "")
+    return match.group(0) if match else None
+
+
+def chrome_version():
+    """Version of the installed Chrome, read from the binary without starting a browser"""
+    candidates = [CHROME_BINARY] if CHROME_BINARY else CHROME_BINARIES
+    for name in candidates:
+        binary = shutil.which(name) or (name if os.path.exists(name) else None)
+        if binary:
+            version = _version_of(binary)
+            if version:
+                return version
+    return None
+
+
+def _major(version):
+    return (version or "").split(".")[0]
+
+
+def _load_cache():
+    try:
+        with open(CHROMEDRIVER_CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_cache(resolved):
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(CHROMEDRIVER_CACHE_FILE)), exist_ok=True)
+        tmp_path = f"{CHROMEDRIVER_CACHE_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(resolved, f)
+        os.replace(tmp_path, CHROMEDRIVER_CACHE_FILE)
+    except OSError as e:
+        logger.warning(f"Could not cache the ChromeDriver resolution: {str(e)}")
+
+
+def _find_chromedriver():
+    """(path, source) of a ChromeDriver binary; only webdriver-manager goes to the network"""
+    if CHROMEDRIVER_PATH:
+        return CHROMEDRIVER_PATH, "CHROMEDRIVER_PATH"
+    local = Path(__file__).resolve().parent / ("chromedriver.exe" if os.name == "nt" else "chromedriver")
+    if local.exists():
+        return str(local), "local"
+    try:
+        from webdriver_manager.chrome import ChromeDriverManager
+        return ChromeDriverManager().install(), "webdriver-manager"
+    except Exception as e:
+        logger.warning(f"webdriver-manager could not provide ChromeDriver: {str(e)}")
+    system = shutil.which("chromedriver")
+    if system:
+        return system, "PATH"
+    return None, None
+
+
+def resolve_chromedriver(refresh=False):
+    """
+    ChromeDriver to start Chrome with, resolved once and cached on disk
+
+    The cached path is reused without any network call for as long as the
+    binary exists and the installed Chrome keeps the major version it was
+    resolved for. Returns the cache entry; its path is None when nothing was
+    found, in which case Selenium Manager picks the driver.
+    """
+    global _resolved
+    with _resolve_lock:
+        if _resolved and not refresh:
+            return _resolved
+
+        browser_version = chrome_version()
+        cached = None if refresh else _load_cache()
+        if (cached and cached.get("path") and os.path.exists(cached["path"])
+                and (not CHROMEDRIVER_PATH or cached["path"] == CHROMEDRIVER_PATH)
+                and (not browser_version or _major(cached.get("browser_version")) == _major(browser_version))):
+            _resolved = cached
+            return _resolved
+
+        path, source = _find_chromedriver()
+        _resolved = {
+            "path": path,
+            "source": source or "selenium-manager",
+            "driver_version": _version_of(path) if path else None,
+            "browser_version": browser_version,
+            "resolved_at": datetime.now(timezone.utc).replace(tzinfo=None).isoformat(),
+        }
+        logger.info(f"Resolved ChromeDriver {_resolved['driver_version']} ({_resolved['source']}) "
+                    f"for Chrome {browser_version}")
+        _save_cache(_resolved)
+        return _resolved
+
+
+def driver_versions():
+    """ChromeDriver and Chrome versions from the cache, for the status API
+
+    Only reads what a bot or the worker already resolved; resolving here could
+    download ChromeDriver or run Chrome inside a web request.
+    """
+    cached = _resolved or _load_cache()
+    resolved = dict(cached, status="resolved") if cached else {"status": "unresolved"}
+    resolved["cache_file"] = CHROMEDRIVER_CACHE_FILE
+    resolved["headless"] = HEADLESS
+    return resolved
+
+
+def _start_chrome(options):
+    """Start Chrome with the cached ChromeDriver; resolve again once if the cached one fails"""
+    for attempt in range(2):
+        path = resolve_chromedriver(refresh=attempt > 0)["path"]
+        try:
+            if path:
+                return webdriver.Chrome(service=Service(path), options=options)
+            return webdriver.Chrome(options=options)
+        except Exception as e:
+            if attempt:
+                raise
+            logger.warning(f"Chrome did not start with ChromeDriver {path}, resolving it again: {str(e)}")
+
+
+def create_driver(profile):
+    """
+    Start Chrome with the shared bot profile
+
+    profile names the persistent profile slot ("availity", "npi") used when
+    CHROME_PROFILE_DIR is set. The returned driver carries its profile lock,
+    which release_driver frees on quit. Raises when Chrome cannot be started.
+    """
+    options = build_options()
+    profile_lock = add_profile_arguments(options, profile)
+    try:
+        driver = _start_chrome(options)
+    except Exception:
+        release_profile_dir(profile_lock)
+        raise
+    driver.profile_lock = profile_lock
+    apply_blocking(driver)
+    return driver
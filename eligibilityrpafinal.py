@@ -1,94 +1,258 @@
 import time
 import os
 import json
+import re
 import sys
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
+from functools import lru_cache
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.action_chains import ActionChains
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.common.exceptions import StaleElementReferenceException, NoSuchElementException
 from dotenv import load_dotenv
+from availity_session import (
+    release_driver, is_logged_in,
+    save_session, restore_session, open_mfa_session, check_mfa_code, generate_totp_code,
+    AVAILITY_WWW_URL, AVAILITY_LOGIN_URL, MFA_WAIT_SECONDS, MFA_RETRY_SECONDS
+)
+from driver_factory import create_driver
+from rpa_result import (
+    ResultRecorder, recording, note_step, timed, result_file_from_args, write_result_file,
+    RESULT_SUCCESS, RESULT_PARTIAL, RESULT_FAILED, RESULT_ERROR, ERROR_INVALID_INPUT, ERROR_STEP
+)
+from rpa_waits import (
+    settle, wait_for_ready, wait_for_network_idle, wait_for_frames, wait_for_url_change, wait_for_element
+)
+from rpa_forms import fill_field
+from rpa_screenshots import capture_screenshot, wait_for_writes
 
 load_dotenv()
 
+# Service type checked when the request does not name one
+SERVICE_TYPE = "Health Benefit Plan Coverage"
+
+# First entry of the payer autocomplete list
+PAYER_OPTION = (By.XPATH, "(//div[contains(@class, 'dropdown-item') or contains(@class, 'option') or @role='option'])[1]")
+
+# Elements that carry the eligibility response banner or badge
+RESPONSE_SELECTORS = [
+    'div[class*="alert"]',
+    'div[class*="notification"]',
+    'div[class*="message"]',
+    'div[class*="banner"]',
+    'div[class*="MuiAlert"]',
+    'div[class*="error"]',
+    'div[class*="success"]',
+    'div[class*="warning"]',
+    'div[class*="status"]',
+    'div[class*="badge"]',
+    'span[class*="badge"]',
+    'div[class*="coverage"]',
+    'span[class*="coverage"]'
+]
+
+# One pass over the document and every same-origin iframe below it; frames the
+# script cannot read (cross-origin) are returned by index path so the caller
+# can switch into them
+RESPONSE_SNAPSHOT_JS = """
+var selectors = arguments[0], root = arguments[1];
+var results = [], blocked = [], seen = {};
+
+function collect(doc, win, location, path) {
+    selectors.forEach(function(selector) {
+        doc.querySelectorAll(selector).forEach(function(element) {
+            var text = (element.textContent || element.innerText || '').trim();
+            if (text.length <= 2) { return; }
+            var rect = element.getBoundingClientRect();
+            if (rect.width <= 0 || rect.height <= 0) { return; }
+            var background = win.getComputedStyle(element).backgroundColor;
+            var key = location + '|' + background + '|' + text;
+            if (seen[key]) { return; }
+            seen[key] = true;
+            results.push({text: text, backgroundColor: background, location: location});
+        });
+    });
+    var frames = doc.getElementsByTagName('iframe');
+    for (var i = 0; i < frames.length; i++) {
+        var framePath = path.concat([i]);
+        var name = 'iframe_' + framePath.map(function(n) { return n + 1; }).join('_');
+        var child = null;
+        try { child = frames[i].contentDocument; } catch (e) {}
+        if (child && child.documentElement) {
+            collect(child, frames[i].contentWindow, name, framePath);
+        } else {
+            blocked.push(framePath);
+        }
+    }
+}
+
+collect(document, window, root.location, root.path);
+return {elements: results, blocked: blocked};
+"""
+
+# Response texts, matched as substrings of the lower-cased element text
+ACTIVE_COVERAGE_PATTERNS = [
+    "active coverage",
+    "coverage active",
+    "patient eligible",
+    "eligible",
+    "benefits available",
+    "valid coverage",
+    "approved",
+    "coverage is active"
+]
+INACTIVE_STATUS_PATTERNS = [
+    "member status inactive",
+    "inactive",
+    "coverage inactive",
+    "status: inactive",
+    "member inactive",
+    "coverage expired",
+    "not active"
+]
+INVALID_PATTERNS = [
+    "invalid/missing subscriber",
+    "invalid/missing insured id",
+    "birth date does not match",
+    "please correct and resubmit",
+    "not eligible",
+    "invalid member id",
+    "error",
+    "incorrect",
+    "invalid patient",
+    "member not found"
+]
+
+
+def _any_of(patterns):
+    return re.compile("|".join(re.escape(pattern) for pattern in patterns))
+
+
+ACTIVE_COVERAGE_RE = _any_of(ACTIVE_COVERAGE_PATTERNS)
+INACTIVE_STATUS_RE = _any_of(INACTIVE_STATUS_PATTERNS)
+INVALID_RE = _any_of(INVALID_PATTERNS)
+
+# Background colors of the response, compared within COLOR_TOLERANCE
+# (sum of the RGB channel differences)
+VALID_COLORS = [
+    "#90EE90", "#98FB98", "#00FF00", "#32CD32", "#228B22",
+    "#008000", "#00C851", "#4CAF50", "#D4EDDA", "#DFF0D8",
+    # Blue tones for "Active Coverage" badges
+    "#007BFF", "#0056B3", "#004085", "#CCE5FF", "#B3D9FF",
+    "#E3F2FD", "#BBDEFB", "#90CAF9", "#64B5F6", "#42A5F5"
+]
+INACTIVE_COLORS = [
+    "#FF0000", "#DC3545", "#C82333", "#BD2130", "#B52D3A",
+    "#A71E2A", "#8B0000", "#CD5C5C", "#F8D7DA", "#F5C6CB",
+    "#FFEBEE", "#FFCDD2", "#EF9A9A", "#E57373", "#EF5350"
+]
+INVALID_COLORS = [
+    "#FFCEA", "#FFCEAA", "#FFD4AA", "#F0E68C", "#FFE4B5",
+    "#FFEAA7", "#FFF2CC", "#FFFACD", "#FFFFE0", "#FFFFF0",
+    "#FDF5E6", "#FAF0E6", "#FFEFD5", "#FFE4E1"
+]
+COLOR_TOLERANCE = 30
+
+
+def _hex_rgb(color):
+    color = color.lstrip('#')
+    return int(color[0:2], 16), int(color[2:4], 16), int(color[4:6], 16)
+
+
+_PALETTES = {
+    name: [_hex_rgb(color) for color in colors]
+    for name, colors in (("valid", VALID_COLORS), ("inactive", INACTIVE_COLORS), ("invalid", INVALID_COLORS))
+}
+
+
+@lru_cache(maxsize=256)
+def color_category(color_hex):
+    """Palettes ("valid", "inactive", "invalid") a hex color falls in; a page uses few colors, so this is cached"""
+    if not color_hex:
+        return frozenset()
+    try:
+        r, g, b = _hex_rgb(color_hex)
+    except ValueError:
+        return frozenset()
+    return frozenset(
+        name for name, palette in _PALETTES.items()
+        if any(abs(r - pr) + abs(g - pg) + abs(b - pb) <= COLOR_TOLERANCE for pr, pg, pb in palette)
+    )
+
+
 class EligibilityBot:
-    def __init__(self):
-        self.driver = None
+    def __init__(self, driver=None, progress=None):
+        # A driver passed in belongs to the caller: it is reused and left open
+        self.driver = driver
+        self.owns_driver = driver is None
+        self.progress = progress
         self.timeout = 20
         self.email = os.getenv('AVAILITY_EMAIL')
         self.password = os.getenv('AVAILITY_PASSWORD')
         self.mfa_session_id = None
-        self.flask_base_url = "http://localhost:5000"  # Adjust if Flask runs on different port
+        self.eligibility_url = None
+        self.flask_base_url = os.getenv('FLASK_BASE_URL', 'http://localhost:5000')
 
     def request_mfa_session(self):
         """Request a new MFA session from Flask backend"""
         try:
-            response = requests.post(f"{self.flask_base_url}/mfa-request", 
-                                   json={"script_type": "eligibility"}, 
-                                   timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                self.mfa_session_id = data.get('session_id')
-                print(f"MFA session requested: {self.mfa_session_id}")
-                return True
-            else:
-                print(f"Failed to request MFA session: {response.status_code}")
-                return False
+            self.mfa_session_id = open_mfa_session(self.flask_base_url, "eligibility")
+            print(f"MFA session requested: {self.mfa_session_id}")
+            return bool(self.mfa_session_id)
         except Exception as e:
             print(f"Error requesting MFA session: {str(e)}")
             return False
 
     def wait_for_mfa_code(self, timeout=300):
-        """Poll Flask backend for MFA code"""
+        """Long-poll Flask backend for MFA code; returns as soon as it is entered"""
         if not self.mfa_session_id:
             print("No MFA session ID available")
             return None
             
         start_time = time.time()
         while time.time() - start_time < timeout:
+            polled = time.time()
             try:
-                response = requests.get(f"{self.flask_base_url}/mfa-check/{self.mfa_session_id}", 
-                                      timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('status') == 'completed':
-                        mfa_code = data.get('code')
-                        print(f"Received MFA code: {mfa_code}")
-                        return mfa_code
-                    elif data.get('status') == 'expired':
-                        print("MFA session expired")
-                        return None
-                        
-                # Wait before next poll
-                time.sleep(3)
+                wait = min(MFA_WAIT_SECONDS, max(1, int(timeout - (polled - start_time))))
+                data = check_mfa_code(self.flask_base_url, self.mfa_session_id, wait=wait)
+                if data.get('status') == 'completed':
+                    mfa_code = data.get('code')
+                    print("Received MFA code")
+                    return mfa_code
+                elif data.get('status') in ('expired', 'unknown', 'unauthorized'):
+                    print(f"MFA session {data.get('status')}")
+                    return None
+
+                # A backend that answers without holding the request is not polled in a tight loop
+                time.sleep(max(0, 1 - (time.time() - polled)))
                 
             except Exception as e:
                 print(f"Error checking MFA code: {str(e)}")
-                time.sleep(3)
+                time.sleep(MFA_RETRY_SECONDS)
                 
         print("Timeout waiting for MFA code")
         return None
 
     def handle_mfa_challenge(self):
-        """Handle MFA challenge by requesting session and waiting for code"""
-        print("MFA challenge detected, requesting user input...")
-        
-        # Request MFA session
-        if not self.request_mfa_session():
-            print("Failed to request MFA session")
-            return False
+        """Handle MFA challenge with a generated authenticator code, or by requesting session and waiting for code"""
+        # Opt-in: the account's authenticator secret is configured (see availity_session)
+        mfa_code = generate_totp_code()
+        if mfa_code:
+            print("MFA challenge detected, using generated authenticator code")
+        else:
+            print("MFA challenge detected, requesting user input...")
             
-        # Wait for user to enter code
-        mfa_code = self.wait_for_mfa_code()
-        if not mfa_code:
-            print("Failed to get MFA code")
-            return False
+            # Request MFA session
+            if not self.request_mfa_session():
+                print("Failed to request MFA session")
+                return False
+                
+            # Wait for user to enter code
+            mfa_code = self.wait_for_mfa_code()
+            if not mfa_code:
+                print("Failed to get MFA code")
+                return False
             
         # Enter the code
         try:
@@ -112,27 +276,18 @@ class EligibilityBot:
             return False
 
     def setup_driver(self):
-        options = Options()
-        options.add_argument("--start-maximized")
-        options.add_argument("--disable-extensions")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=options)
+        self.driver = create_driver("availity")
         return self.driver
 
     def wait_for_page_load(self):
         WebDriverWait(self.driver, self.timeout).until(
             lambda d: d.execute_script("return document.readyState") == "complete"
         )
-        time.sleep(2)
+        wait_for_network_idle(self.driver)
 
     def safe_click(self, element):
         try:
             self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", element)
-            time.sleep(1)
             element.click()
             return True
         except:
@@ -202,86 +357,32 @@ class EligibilityBot:
             return None
 
     def is_invalid_color(self, color_hex):
-        """Check if color indicates invalid/error status"""
-        if not color_hex:
-            return False
-        
-        # Define invalid color patterns (yellow/amber/orange tones)
-        invalid_colors = [
-            "#FFCEA", "#FFCEAA", "#FFD4AA", "#F0E68C", "#FFE4B5", 
-            "#FFEAA7", "#FFF2CC", "#FFFACD", "#FFFFE0", "#FFFFF0",
-            "#FDF5E6", "#FAF0E6", "#FFEFD5", "#FFE4E1"
-        ]
-        
-        # Check for exact matches or similar colors
-        for invalid_color in invalid_colors:
-            if self.is_color_similar(color_hex, invalid_color):
-                return True
-        
-        return False
+        """Check if color indicates invalid/error status (yellow/amber/orange tones)"""
+        return "invalid" in color_category(color_hex)
 
     def is_valid_color(self, color_hex):
-        """Check if color indicates valid/success status"""
-        if not color_hex:
-            return False
-        
-        # Define valid color patterns (green tones and blue tones for active coverage)
-        valid_colors = [
-            "#90EE90", "#98FB98", "#00FF00", "#32CD32", "#228B22", 
-            "#008000", "#00C851", "#4CAF50", "#D4EDDA", "#DFF0D8",
-            # Blue tones for "Active Coverage" badges
-            "#007BFF", "#0056B3", "#004085", "#CCE5FF", "#B3D9FF",
-            "#E3F2FD", "#BBDEFB", "#90CAF9", "#64B5F6", "#42A5F5"
-        ]
-        
-        # Check for exact matches or similar colors
-        for valid_color in valid_colors:
-            if self.is_color_similar(color_hex, valid_color):
-                return True
-        
-        return False
+        """Check if color indicates valid/success status (green and blue tones)"""
+        return "valid" in color_category(color_hex)
 
     def is_inactive_color(self, color_hex):
         """Check if color indicates inactive status (red tones)"""
-        if not color_hex:
-            return False
-        
-        # Define inactive color patterns (red tones)
-        inactive_colors = [
-            "#FF0000", "#DC3545", "#C82333", "#BD2130", "#B52D3A",
-            "#A71E2A", "#8B0000", "#CD5C5C", "#F8D7DA", "#F5C6CB",
-            "#FFEBEE", "#FFCDD2", "#EF9A9A", "#E57373", "#EF5350"
-        ]
-        
-        # Check for exact matches or similar colors
-        for inactive_color in inactive_colors:
-            if self.is_color_similar(color_hex, inactive_color):
-                return True
-        
-        return False
+        return "inactive" in color_category(color_hex)
 
-    def is_color_similar(self, color1, color2, tolerance=30):
+    def is_color_similar(self, color1, color2, tolerance=COLOR_TOLERANCE):
         """Check if two hex colors are similar within tolerance"""
         try:
             if not color1 or not color2:
                 return False
-            
-            # Remove # if present
-            color1 = color1.lstrip('#')
-            color2 = color2.lstrip('#')
-            
-            # Convert to RGB
-            r1, g1, b1 = int(color1[0:2], 16), int(color1[2:4], 16), int(color1[4:6], 16)
-            r2, g2, b2 = int(color2[0:2], 16), int(color2[2:4], 16), int(color2[4:6], 16)
-            
-            # Calculate color distance
+            r1, g1, b1 = _hex_rgb(color1)
+            r2, g2, b2 = _hex_rgb(color2)
             distance = abs(r1 - r2) + abs(g1 - g2) + abs(b1 - b2)
             return distance <= tolerance
-        except:
+        except ValueError:
             return False
 
+    @timed()
     def login_to_availity(self):
-        self.driver.get("https://www.availity.com/")
+        self.driver.get(AVAILITY_WWW_URL)
         self.wait_for_page_load()
         
         try:
@@ -293,7 +394,7 @@ class EligibilityBot:
             pass
         
         login_link = WebDriverWait(self.driver, self.timeout).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, "a[href='https://apps.availity.com/web/onboarding/availity-fr-ui/']"))
+            EC.element_to_be_clickable((By.CSS_SELECTOR, f"a[href='{AVAILITY_LOGIN_URL}']"))
         )
         self.safe_click(login_link)
         self.wait_for_page_load()
@@ -325,7 +426,7 @@ class EligibilityBot:
         
         # Handle MFA challenge
         print("Checking for MFA challenge...")
-        time.sleep(3)  # Wait for MFA page to load
+        wait_for_ready(self.driver)  # Wait for MFA page to load
         
         # Check if we're on MFA page
         try:
@@ -340,15 +441,13 @@ class EligibilityBot:
         
         # Wait for login to complete
         initial_url = self.driver.current_url
-        start_time = time.time()
-        
-        while time.time() - start_time < 300:
-            if self.driver.current_url != initial_url:
-                break
-            time.sleep(3)
+        wait_for_url_change(self.driver, initial_url, "mfa")
         
         self.wait_for_page_load()
+        save_session(self.driver)
+        return True
 
+    @timed()
     def navigate_to_eligibility(self):
         patient_reg = WebDriverWait(self.driver, self.timeout).until(
             EC.element_to_be_clickable((By.XPATH, "//a[contains(text(), 'Patient Registration')]"))
@@ -361,10 +460,22 @@ class EligibilityBot:
         )
         self.safe_click(eligibility_link)
         self.wait_for_page_load()
+        self.eligibility_url = self.driver.current_url
+
+    @timed()
+    def reset_eligibility_form(self):
+        """Reload a blank inquiry form for the next patient without going back through the menus"""
+        self.driver.switch_to.default_content()
+        if not self.eligibility_url:
+            self.navigate_to_eligibility()
+            return
+        self.driver.get(self.eligibility_url)
+        self.wait_for_page_load()
 
+    @timed()
     def fill_payer(self, payer_name):
         self.driver.switch_to.default_content()
-        time.sleep(3)
+        wait_for_frames(self.driver, 2)
         
         frames = self.driver.find_elements(By.TAG_NAME, "iframe")
         if len(frames) >= 2:
@@ -374,29 +485,21 @@ class EligibilityBot:
                 EC.presence_of_element_located((By.CSS_SELECTOR, "input[id*='payer']"))
             )
             
-            payer_field.clear()
-            time.sleep(0.5)
             ActionChains(self.driver).move_to_element(payer_field).click().perform()
-            time.sleep(0.5)
-            
-            for char in payer_name:
-                payer_field.send_keys(char)
-                time.sleep(0.1)
-            
-            time.sleep(1)
+            fill_field(self.driver, payer_field, payer_name, "payer", verify=False)
             
             try:
-                first_item = self.driver.find_element(By.XPATH, "(//div[contains(@class, 'dropdown-item') or contains(@class, 'option') or @role='option'])[1]")
+                first_item = wait_for_element(self.driver, PAYER_OPTION, "dropdown")
                 self.safe_click(first_item)
             except:
                 ActionChains(self.driver).send_keys(Keys.DOWN).perform()
-                time.sleep(0.5)
                 ActionChains(self.driver).send_keys(Keys.ENTER).perform()
             
             self.driver.switch_to.default_content()
             return True
         return False
 
+    @timed()
     def fill_provider(self, provider_name):
         frames = self.driver.find_elements(By.TAG_NAME, "iframe")
         
@@ -406,21 +509,14 @@ class EligibilityBot:
                 
                 provider_field = self.driver.find_element(By.CSS_SELECTOR, "input#provider")
                 
-                provider_field.clear()
-                time.sleep(0.5)
                 ActionChains(self.driver).move_to_element(provider_field).click().perform()
-                time.sleep(0.5)
+                fill_field(self.driver, provider_field, provider_name, "provider", verify=False)
                 
-                for char in provider_name:
-                    provider_field.send_keys(char)
-                    time.sleep(0.1)
-                
-                time.sleep(1)
+                settle(self.driver)
                 
                 ActionChains(self.driver).send_keys(Keys.ARROW_DOWN).perform()
-                time.sleep(0.5)
                 ActionChains(self.driver).send_keys(Keys.ENTER).perform()
-                time.sleep(1)
+                settle(self.driver)
                 
                 self.driver.switch_to.default_content()
                 return True
@@ -429,6 +525,7 @@ class EligibilityBot:
                 continue
         return False
 
+    @timed()
     def fill_patient_data(self, member_id, dob):
         """Fill patient data using member_id instead of patient_id"""
         frames = self.driver.find_elements(By.TAG_NAME, "iframe")
@@ -466,28 +563,14 @@ class EligibilityBot:
             """)
             
             if member_id_field:
-                member_id_field.clear()
-                time.sleep(0.5)
-                ActionChains(self.driver).move_to_element(member_id_field).click().perform()
-                time.sleep(0.5)
-                
-                for char in str(member_id):
-                    member_id_field.send_keys(char)
-                    time.sleep(0.1)
+                fill_field(self.driver, member_id_field, member_id, "member_id")
             
             try:
                 dob_field = WebDriverWait(self.driver, 5).until(
                     EC.presence_of_element_located((By.XPATH, "//input[contains(@placeholder, 'mm/dd/yyyy') or contains(@aria-label, 'Date of Birth')]"))
                 )
                 
-                dob_field.clear()
-                time.sleep(0.5)
-                ActionChains(self.driver).move_to_element(dob_field).click().perform()
-                time.sleep(0.5)
-                
-                for char in dob:
-                    dob_field.send_keys(char)
-                    time.sleep(0.1)
+                fill_field(self.driver, dob_field, dob, "dob")
                 
                 dob_field.send_keys(Keys.TAB)
             except:
@@ -497,6 +580,7 @@ class EligibilityBot:
             return True
         return False
 
+    @timed()
     def fill_service_type_and_submit(self, service_type):
         service_parts = service_type.split(" - ")
         service_name = service_parts[0]
@@ -537,19 +621,9 @@ class EligibilityBot:
                     
                     if service_type_field:
                         self.driver.execute_script("arguments[0].style.border='5px solid green'", service_type_field)
-                        time.sleep(1)
-                        
-                        service_type_field.clear()
-                        time.sleep(0.5)
                         
                         ActionChains(self.driver).move_to_element(service_type_field).click().perform()
-                        time.sleep(0.5)
-                        
-                        for char in service_name:
-                            service_type_field.send_keys(char)
-                            time.sleep(0.3)
-                        
-                        time.sleep(2)
+                        fill_field(self.driver, service_type_field, service_name, "service_type", verify=False)
                         
                         try:
                             option = WebDriverWait(self.driver, 5).until(
@@ -558,16 +632,15 @@ class EligibilityBot:
                             self.safe_click(option)
                         except:
                             ActionChains(self.driver).send_keys(Keys.ARROW_DOWN).perform()
-                            time.sleep(0.5)
                             ActionChains(self.driver).send_keys(Keys.ENTER).perform()
                         
-                        time.sleep(1)
+                        settle(self.driver)
                         
                         submit_button = WebDriverWait(self.driver, 5).until(
                             EC.element_to_be_clickable((By.XPATH, "//button[@type='submit' and contains(@class, 'MuiButton-containedPrimary') and contains(text(), 'Submit')]"))
                         )
                         self.safe_click(submit_button)
-                        time.sleep(3)
+                        wait_for_network_idle(self.driver, "next_page")
                         
                         self.driver.switch_to.default_content()
                         return True
@@ -586,6 +659,31 @@ class EligibilityBot:
         self.driver.switch_to.default_content()
         return False
 
+    def response_snapshot(self):
+        """
+        Text, background and location of every visible response element, in one round trip
+
+        Same-origin iframes are walked inside the browser; only frames the
+        script cannot read (cross-origin) are entered with switch_to.frame.
+        """
+        snapshot = self.driver.execute_script(
+            RESPONSE_SNAPSHOT_JS, RESPONSE_SELECTORS, {"location": "main_page", "path": []})
+        element_data = snapshot['elements']
+
+        for path in snapshot['blocked']:
+            try:
+                for index in path:
+                    self.driver.switch_to.frame(index)
+                location = "iframe_" + "_".join(str(index + 1) for index in path)
+                element_data.extend(self.driver.execute_script(
+                    RESPONSE_SNAPSHOT_JS, RESPONSE_SELECTORS, {"location": location, "path": path})['elements'])
+            except Exception as e:
+                print(f"Could not read frame {path}: {str(e)}")
+            finally:
+                self.driver.switch_to.default_content()
+        return element_data
+
+    @timed()
     def check_eligibility_response(self):
         """
         Enhanced method to check eligibility response with support for:
@@ -596,186 +694,35 @@ class EligibilityBot:
         print("Waiting for eligibility response after form submission...")
         
         self.wait_for_page_load()
-        time.sleep(5)
         
         try:
             self.driver.switch_to.default_content()
             
-            # Use JavaScript to find and analyze elements to avoid stale element issues
-            element_data = self.driver.execute_script("""
-                var results = [];
-                
-                // Define selectors to search for
-                var selectors = [
-                    'div[class*="alert"]',
-                    'div[class*="notification"]', 
-                    'div[class*="message"]',
-                    'div[class*="banner"]',
-                    'div[class*="MuiAlert"]',
-                    'div[class*="error"]',
-                    'div[class*="success"]',
-                    'div[class*="warning"]',
-                    'div[class*="status"]',
-                    'div[class*="badge"]',
-                    'span[class*="badge"]',
-                    'div[class*="coverage"]',
-                    'span[class*="coverage"]'
-                ];
-                
-                // Search in main document
-                selectors.forEach(function(selector) {
-                    var elements = document.querySelectorAll(selector);
-                    elements.forEach(function(element) {
-                        var text = element.textContent || element.innerText || '';
-                        if (text.trim().length > 2) { // Filter out very short texts
-                            var computedStyle = window.getComputedStyle(element);
-                            var rect = element.getBoundingClientRect();
-                            
-                            if (rect.width > 0 && rect.height > 0) { // Element is visible
-                                results.push({
-                                    text: text.trim(),
-                                    backgroundColor: computedStyle.backgroundColor,
-                                    borderColor: computedStyle.borderColor,
-                                    color: computedStyle.color,
-                                    className: element.className,
-                                    tagName: element.tagName,
-                                    location: 'main_page'
-                                });
-                            }
-                        }
-                    });
-                });
-                
-                return results;
-            """)
-            
-            # Also check iframes
-            frames = self.driver.find_elements(By.TAG_NAME, "iframe")
-            for i, frame in enumerate(frames):
-                try:
-                    self.driver.switch_to.frame(frame)
-                    
-                    iframe_data = self.driver.execute_script("""
-                        var results = [];
-                        
-                        var selectors = [
-                            'div[class*="alert"]',
-                            'div[class*="notification"]', 
-                            'div[class*="message"]',
-                            'div[class*="banner"]',
-                            'div[class*="MuiAlert"]',
-                            'div[class*="error"]',
-                            'div[class*="success"]',
-                            'div[class*="warning"]',
-                            'div[class*="status"]',
-                            'div[class*="badge"]',
-                            'span[class*="badge"]',
-                            'div[class*="coverage"]',
-                            'span[class*="coverage"]'
-                        ];
-                        
-                        selectors.forEach(function(selector) {
-                            var elements = document.querySelectorAll(selector);
-                            elements.forEach(function(element) {
-                                var text = element.textContent || element.innerText || '';
-                                if (text.trim().length > 2) {
-                                    var computedStyle = window.getComputedStyle(element);
-                                    var rect = element.getBoundingClientRect();
-                                    
-                                    if (rect.width > 0 && rect.height > 0) {
-                                        results.push({
-                                            text: text.trim(),
-                                            backgroundColor: computedStyle.backgroundColor,
-                                            borderColor: computedStyle.borderColor,
-                                            color: computedStyle.color,
-                                            className: element.className,
-                                            tagName: element.tagName,
-                                            location: 'iframe_""" + str(i+1) + """'
-                                        });
-                                    }
-                                }
-                            });
-                        });
-                        
-                        return results;
-                    """)
-                    
-                    element_data.extend(iframe_data)
-                    
-                    self.driver.switch_to.default_content()
-                    
-                except Exception as e:
-                    self.driver.switch_to.default_content()
-                    continue
-            
-            # Analyze collected element data with enhanced logic
+            started = time.time()
+            element_data = self.response_snapshot()
             print(f"Found {len(element_data)} elements to analyze")
-            
+
             for data in element_data:
                 text = data['text']
                 bg_color = data['backgroundColor']
                 location = data['location']
-                
-                # Convert background color to hex
+
                 bg_hex = self.rgb_to_hex(bg_color)
-                
-                # Text analysis
                 text_lower = text.lower()
-                
-                print(f"Analyzing element: '{text}' with background: {bg_color} ({bg_hex})")
-                
-                # Enhanced text patterns for different scenarios
-                
-                # Active Coverage patterns (flag = 1)
-                active_coverage_patterns = [
-                    "active coverage",
-                    "coverage active", 
-                    "patient eligible",
-                    "eligible",
-                    "benefits available",
-                    "valid coverage",
-                    "approved",
-                    "coverage is active"
-                ]
-                
-                # Member Status Inactive patterns (flag = 0)
-                inactive_status_patterns = [
-                    "member status inactive",
-                    "inactive",
-                    "coverage inactive",
-                    "status: inactive",
-                    "member inactive",
-                    "coverage expired",
-                    "not active"
-                ]
-                
-                # Invalid/Error patterns (flag = -1)
-                invalid_patterns = [
-                    "invalid/missing subscriber",
-                    "invalid/missing insured id", 
-                    "birth date does not match",
-                    "please correct and resubmit",
-                    "not eligible",
-                    "invalid member id",
-                    "error",
-                    "incorrect",
-                    "invalid patient",
-                    "member not found"
-                ]
-                
-                # Check text patterns
-                text_indicates_active = any(pattern in text_lower for pattern in active_coverage_patterns)
-                text_indicates_inactive = any(pattern in text_lower for pattern in inactive_status_patterns)
-                text_indicates_invalid = any(pattern in text_lower for pattern in invalid_patterns)
-                
-                # Enhanced color analysis
-                color_indicates_active = self.is_valid_color(bg_hex) if bg_hex else False
-                color_indicates_inactive = self.is_inactive_color(bg_hex) if bg_hex else False
-                color_indicates_invalid = self.is_invalid_color(bg_hex) if bg_hex else False
-                
+
+                # Text patterns: active (flag = 1), inactive (flag = 0), invalid (flag = -1)
+                text_indicates_active = ACTIVE_COVERAGE_RE.search(text_lower) is not None
+                text_indicates_inactive = INACTIVE_STATUS_RE.search(text_lower) is not None
+                text_indicates_invalid = INVALID_RE.search(text_lower) is not None
+
+                colors = color_category(bg_hex)
+                color_indicates_active = "valid" in colors
+                color_indicates_inactive = "inactive" in colors
+                color_indicates_invalid = "invalid" in colors
+
                 # Decision logic with priority: Text patterns first, then color
                 if text_indicates_active or (color_indicates_active and not text_indicates_inactive and not text_indicates_invalid):
-                    print(f"ELIGIBILITY RESULT: ACTIVE COVERAGE")
+                    print(f"ELIGIBILITY RESULT: ACTIVE COVERAGE ('{text}', {bg_color}, {time.time() - started:.3f}s)")
                     return {
                         "status": "ACTIVE_COVERAGE",
                         "message": text,
@@ -787,7 +734,7 @@ class EligibilityBot:
                         "location": location
                     }
                 elif text_indicates_inactive or (color_indicates_inactive and not text_indicates_invalid):
-                    print(f"ELIGIBILITY RESULT: MEMBER STATUS INACTIVE")
+                    print(f"ELIGIBILITY RESULT: MEMBER STATUS INACTIVE ('{text}', {bg_color}, {time.time() - started:.3f}s)")
                     return {
                         "status": "MEMBER_INACTIVE",
                         "message": text,
@@ -799,7 +746,7 @@ class EligibilityBot:
                         "location": location
                     }
                 elif text_indicates_invalid or color_indicates_invalid:
-                    print(f"ELIGIBILITY RESULT: INVALID/ERROR")
+                    print(f"ELIGIBILITY RESULT: INVALID/ERROR ('{text}', {bg_color}, {time.time() - started:.3f}s)")
                     return {
                         "status": "INVALID",
                         "message": text,
@@ -810,7 +757,7 @@ class EligibilityBot:
                         "detection_method": "Text-based" if text_indicates_invalid else "Color-based",
                         "location": location
                     }
-            
+
             # If we found elements but couldn't classify them
             if element_data:
                 first_element = element_data[0]
@@ -859,7 +806,7 @@ class EligibilityBot:
         patient_id = str(patient_data.get("auth_id", ""))   # For database logging (auth_id as patient_id)
         dob = patient_data.get("patient_dob", "")
         payer_name = patient_data.get("payer", "")
-        service_type = "Health Benefit Plan Coverage"
+        service_type = patient_data.get("service_type") or SERVICE_TYPE
         
         print(f"Processing Member ID: {member_id} for Patient ID: {patient_id}")
         
@@ -899,54 +846,197 @@ class EligibilityBot:
             "payer": patient_data.get("payer"),
             "provider_name": patient_data.get("provider_name"),
             "provider_npi_id": patient_data.get("provider_npi_id"),
+            "service_type": service_type,
             "eligibility_result": eligibility_result
         }
         
         return final_result
 
-    def run(self, input_data):
-        try:
+    def report(self, message):
+        """Print a progress line and pass it on to the caller's progress callback"""
+        print(message)
+        note_step(message)
+        if self.progress:
+            try:
+                self.progress(message)
+            except Exception:
+                pass
+
+    def release(self):
+        if self.owns_driver:
+            release_driver(self.driver)
+        elif self.driver:
+            try:
+                self.driver.switch_to.default_content()
+            except Exception:
+                pass
+
+    def start_session(self):
+        """Start Chrome, make sure Availity is logged in and open the inquiry form"""
+        self.report("Step 1: Starting Chrome")
+        if self.driver is None:
             self.setup_driver()
+        if not self.owns_driver and is_logged_in(self.driver):
+            self.report("Step 2: Reusing logged-in Availity session")
+        elif restore_session(self.driver):
+            self.report("Step 2: Reusing saved Availity session")
+        else:
+            self.report("Step 2: Logging in to Availity")
             self.login_to_availity()
-            self.navigate_to_eligibility()
+        self.report("Step 3: Opening Eligibility and Benefits Inquiry")
+        self.navigate_to_eligibility()
+
+    def run(self, input_data):
+        try:
+            self.start_session()
             
+            self.report(f"Step 4: Checking eligibility for member {input_data.get('member_id', '')}")
             result = self.process_patient(input_data)
+            if not result.get("success"):
+                capture_screenshot(self.driver, "eligibility_failed")
             return result
                 
         except Exception as e:
             print(f"Error: {str(e)}")
-            return {"success": False, "error": str(e)}
-        finally:
             if self.driver:
-                self.driver.quit()
+                capture_screenshot(self.driver, "eligibility_error")
+            return {"success": False, "error": str(e), "error_class": type(e).__name__}
+        finally:
+            self.release()
+
+    def run_batch(self, patients):
+        """Check many patients on one login; returns one result per patient, in order"""
+        results = []
+        try:
+            self.start_session()
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            self.release()
+            return [{"success": False, "error": str(e), "auth_id": p.get("auth_id")} for p in patients]
+
+        try:
+            for index, patient_data in enumerate(patients, start=1):
+                self.report(f"Step 4: Checking eligibility for member {patient_data.get('member_id', '')} ({index}/{len(patients)})")
+                try:
+                    if index > 1:
+                        self.reset_eligibility_form()
+                    result = self.process_patient(patient_data)
+                    if not result.get("success"):
+                        capture_screenshot(self.driver, f"eligibility_failed_{index}")
+                except Exception as e:
+                    print(f"Error for member {patient_data.get('member_id', '')}: {str(e)}")
+                    capture_screenshot(self.driver, f"eligibility_error_{index}")
+                    result = {"success": False, "error": str(e), "error_class": type(e).__name__}
+                    # The session may have expired mid-batch; log in again before the next row
+                    if not is_logged_in(self.driver):
+                        print("Availity session lost, logging in again")
+                        self.login_to_availity()
+                    self.eligibility_url = None
+
+                result.setdefault("auth_id", patient_data.get("auth_id"))
+                results.append(result)
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            for patient_data in patients[len(results):]:
+                results.append({"success": False, "error": str(e), "auth_id": patient_data.get("auth_id")})
+        finally:
+            self.release()
+        return results
+
+# Required fields - Flask route expects both member_id and auth_id (as patient_id)
+REQUIRED_FIELDS = ['provider_name', 'member_id', 'patient_dob', 'payer', 'auth_id']
+
+BOT_NAME = "availity_eligibility"
+
+def check_eligibility(record, driver=None, progress=None):
+    """Run an eligibility inquiry for one patient, or a batch on a single login.
+
+    record is the payload sent by app.py, or a list of them. A driver passed
+    in is reused and left open for the caller. progress, when given, is called
+    with every "Step N: ..." message.
+
+    Returns the result document (see rpa_result). Its data is the result dict,
+    or a list of results in input order; rows with missing fields fail
+    without being run. flag is the eligibility flag of a single inquiry.
+    """
+    is_batch = isinstance(record, list)
+    patients = record if is_batch else [record]
+    recorder = ResultRecorder(BOT_NAME)
+
+    results = [None] * len(patients)
+    valid = []
+    for index, patient_data in enumerate(patients):
+        missing_fields = [field for field in REQUIRED_FIELDS if not patient_data.get(field)]
+        if missing_fields:
+            results[index] = {"success": False, "error": f"Missing required fields: {missing_fields}",
+                              "error_class": ERROR_INVALID_INPUT, "auth_id": patient_data.get("auth_id")}
+        else:
+            valid.append(index)
+
+    if valid:
+        with recording(recorder):
+            bot = EligibilityBot(driver=driver, progress=progress)
+            if is_batch:
+                for index, result in zip(valid, bot.run_batch([patients[i] for i in valid])):
+                    results[index] = result
+            else:
+                results[0] = bot.run(patients[0])
+
+    failed = [r for r in results if not r.get("success")]
+    if not failed:
+        status = RESULT_SUCCESS
+    elif is_batch and len(failed) < len(results):
+        status = RESULT_PARTIAL
+    elif not valid:
+        status = RESULT_ERROR
+    else:
+        status = RESULT_FAILED
+
+    flag = None
+    if not is_batch:
+        flag = (results[0].get("eligibility_result") or {}).get("flag")
+    error = failed[0].get("error") if failed else None
+    if failed and is_batch:
+        error = f"{len(failed)} of {len(results)} patients failed; first: {error}"
+    wait_for_writes()
+    return recorder.finish(
+        status,
+        data=results if is_batch else results[0],
+        flag=flag,
+        error_class=(failed[0].get("error_class") or ERROR_STEP) if failed else None,
+        error=error
+    )
 
 def main():
     if len(sys.argv) < 2:
         print("No input JSON provided")
         sys.exit(1)
     
+    # Optional second argument: file that receives the result document
+    result_path = result_file_from_args(sys.argv)
     try:
         input_data = json.loads(sys.argv[1])
-        
-        # Required fields - Flask route expects both member_id and auth_id (as patient_id)
-        required_fields = ['provider_name', 'member_id', 'patient_dob', 'payer', 'auth_id']
-        missing_fields = [field for field in required_fields if not input_data.get(field)]
-        
-        if missing_fields:
-            print(f"Missing required fields: {missing_fields}")
-            sys.exit(1)
-        
-        bot = EligibilityBot()
-        result = bot.run(input_data)
-        
-        # Print final result exactly as Flask route expects
-        print("FINAL_RESULT:", json.dumps(result))
-        
-        sys.exit(0 if result.get("success") else 1)
-        
     except Exception as e:
         print(f"Failed to parse input JSON: {str(e)}")
+        if result_path:
+            write_result_file(ResultRecorder(BOT_NAME).fail(e), result_path)
         sys.exit(1)
+    
+    document = check_eligibility(input_data)
+    if result_path:
+        write_result_file(document, result_path)
+    else:
+        # Callers still scraping stdout (app new.py) read eligibility_result at
+        # the top level, as the bot printed it before the result document
+        printed = dict(document)
+        if isinstance(document.get("data"), dict):
+            printed["eligibility_result"] = document["data"].get("eligibility_result")
+        print("FINAL_RESULT:", json.dumps(printed))
+    
+    # A batch reports per-row success in its result
+    if isinstance(input_data, list):
+        sys.exit(0 if document["status"] != RESULT_ERROR else 1)
+    sys.exit(0 if document["status"] == RESULT_SUCCESS else 1)
 
 if __name__ == "__main__":
     main()
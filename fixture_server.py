@@ -0,0 +1,254 @@
+"""
+Offline stand-in for the portals the bots drive
+
+Serves HTML fixtures (fixtures/) that reproduce the markup of the pages the
+bots walk through, with just enough script to behave like the real ones:
+
+    Availity    home page with the Essentials login link, login, 2FA method
+                and authenticator-code pages, dashboard with the Patient
+                Registration menu, the eligibility inquiry form (payer,
+                provider and service type typeaheads in the second iframe,
+                result alert) and the authorization wizard (Select2 fields,
+                date picker, Next / Next Steps / Submit, New Request)
+    NPPES       the registry's JSON API (/nppes/api/?version=2.1&first_name=...),
+                answered from PROVIDERS
+    MFA         /mfa-request and /mfa-check/<id>, answering every challenge
+                with FIXTURE_MFA_CODE, so no human is needed
+
+Point the bots at it with the environment fixture_env() returns (printed by
+the CLI), e.g.
+
+    python fixture_server.py --port 8765 --latency 0.05
+
+Eligibility results depend on the member ID: one ending in 0 is inactive,
+one ending in 9 is invalid, any other has active coverage. --latency adds a
+delay to every response to mimic the portal's round trips.
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger("fixture_server")
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FIXTURE_MFA_CODE = os.getenv('FIXTURE_MFA_CODE', '123456')
+SESSION_COOKIE = "fixture_session"
+
+LOGIN_PATH = "/web/onboarding/availity-fr-ui/"
+HOME_PATH = "/public/apps/home/"
+
+# Pages and the fixture each one serves; the portal pages need a login
+PAGES = {
+    "/": ("availity/www.html", False),
+    LOGIN_PATH: ("availity/login.html", False),
+    LOGIN_PATH + "method": ("availity/login-method.html", False),
+    LOGIN_PATH + "code": ("availity/login-code.html", False),
+    HOME_PATH: ("availity/dashboard.html", True),
+    "/public/apps/eligibility/": ("availity/eligibility.html", True),
+    "/public/apps/authorizations/": ("availity/authorizations.html", True),
+}
+
+CONTENT_TYPES = {".html": "text/html", ".js": "application/javascript", ".css": "text/css"}
+
+# Providers known to the registry stand-in, in the NPPES API's result format
+PROVIDERS = [
+    {"number": "1234567893", "enumeration_type": "NPI-1",
+     "basic": {"first_name": "ANURADHA", "last_name": "KOLLIPARA", "credential": "MD", "status": "A"},
+     "taxonomies": [{"code": "207R00000X", "desc": "Internal Medicine", "primary": True, "state": "NY"}]},
+    {"number": "1245319599", "enumeration_type": "NPI-1",
+     "basic": {"first_name": "FRANCIS", "last_name": "MOMOH", "credential": "MD", "status": "A"},
+     "taxonomies": [{"code": "207Q00000X", "desc": "Family Medicine", "primary": True, "state": "NY"}]},
+    {"number": "1316943756", "enumeration_type": "NPI-1",
+     "basic": {"first_name": "JOHN", "last_name": "SMITH", "credential": "PT", "status": "A"},
+     "taxonomies": [{"code": "225100000X", "desc": "Physical Therapist", "primary": True, "state": "NJ"}]},
+    {"number": "1407852270", "enumeration_type": "NPI-1",
+     "basic": {"first_name": "JANE", "last_name": "DOE", "credential": "NP", "status": "D"},
+     "taxonomies": [{"code": "363L00000X", "desc": "Nurse Practitioner", "primary": True, "state": "NJ"}]},
+]
+
+ELIGIBILITY_RESPONSES = {
+    "ACTIVE_COVERAGE": "Active Coverage",
+    "MEMBER_INACTIVE": "Member Status Inactive",
+    "INVALID": "Invalid/Missing Subscriber/Insured ID. Please correct and resubmit.",
+}
+
+
+def eligibility_status(member_id):
+    if member_id.endswith("0"):
+        return "MEMBER_INACTIVE"
+    if member_id.endswith("9") or not member_id:
+        return "INVALID"
+    return "ACTIVE_COVERAGE"
+
+
+def _name_matches(value, query):
+    """NPPES name matching: case-insensitive, a trailing * matches a prefix"""
+    if not query:
+        return True
+    value, query = value.upper(), query.upper()
+    if query.endswith("*"):
+        return value.startswith(query[:-1])
+    return value == query
+
+
+def search_providers(params):
+    """Results of the registry API for the query parameters"""
+    number = params.get("number", "")
+    results = [
+        p for p in PROVIDERS
+        if (not number or p["number"] == number)
+        and _name_matches(p["basic"]["first_name"], params.get("first_name", ""))
+        and _name_matches(p["basic"]["last_name"], params.get("last_name", ""))
+    ]
+    limit = int(params.get("limit") or 10)
+    return {"result_count": len(results[:limit]), "results": results[:limit]}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    server_version = "FixtureServer/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    # ===============================
+    # RESPONSES
+    # ===============================
+    def _send(self, status, body, content_type="text/html", headers=None):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-store")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _json(self, payload, status=200):
+        self._send(status, json.dumps(payload), "application/json")
+
+    def _redirect(self, location, headers=None):
+        self._send(302, "", headers=dict(headers or {}, Location=self.server.base_url + location))
+
+    def _fixture(self, relative_path, values=None):
+        path = os.path.normpath(os.path.join(FIXTURE_DIR, relative_path))
+        if not path.startswith(FIXTURE_DIR) or not os.path.isfile(path):
+            self._send(404, "Not found", "text/plain")
+            return
+        extension = os.path.splitext(path)[1]
+        with open(path, encoding="utf-8") as f:
+            body = f.read()
+        for key, value in dict(values or {}, BASE=self.server.base_url).items():
+            body = body.replace("{{" + key + "}}", str(value))
+        self._send(200, body, CONTENT_TYPES.get(extension, "application/octet-stream"))
+
+    def _logged_in(self):
+        return f"{SESSION_COOKIE}=" in (self.headers.get("Cookie") or "")
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return {}
+
+    # ===============================
+    # ROUTES
+    # ===============================
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        path = url.path
+
+        if path in PAGES:
+            fixture, needs_login = PAGES[path]
+            if needs_login and not self._logged_in():
+                self._redirect(LOGIN_PATH)
+                return
+            self._fixture(fixture)
+        elif path == LOGIN_PATH + "complete":
+            if params.get("code") != FIXTURE_MFA_CODE:
+                self._redirect(LOGIN_PATH + "code")
+                return
+            self._redirect(HOME_PATH, {"Set-Cookie": f"{SESSION_COOKIE}={uuid.uuid4().hex}; Path=/"})
+        elif path.startswith("/static/"):
+            self._fixture(path[1:])
+        elif path.startswith("/fixtures/"):
+            self._fixture(path[len("/fixtures/"):])
+        elif path == "/api/eligibility":
+            status = eligibility_status(params.get("memberId", ""))
+            self._json({"status": status, "message": ELIGIBILITY_RESPONSES[status]})
+        elif path == "/api/wizard-step":
+            self._json({"step": params.get("step")})
+        elif path.startswith("/mfa-check/"):
+            self._json({"status": "completed", "code": FIXTURE_MFA_CODE,
+                        "session_id": path.rsplit("/", 1)[-1]})
+        elif path.rstrip("/") == "/nppes/api":
+            self._json(search_providers(params))
+        else:
+            self._send(404, "Not found", "text/plain")
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if path == "/mfa-request":
+            self._json({"success": True, "session_id": uuid.uuid4().hex})
+        elif path == "/api/authorizations":
+            body = self._body()
+            reference = f"FX{int(time.time() * 1000) % 10**8:08d}"
+            self._json({"reference": reference,
+                        "message": f"Request submitted for member {body.get('memberId', '')}. "
+                                   f"Reference number {reference}."})
+        else:
+            self._send(404, "Not found", "text/plain")
+
+
+def start(port=0, host="127.0.0.1", latency=0.0):
+    """Serve the fixtures from a background thread; returns the server (see server.base_url)"""
+    server = ThreadingHTTPServer((host, port), FixtureHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.base_url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name="fixture-server", daemon=True).start()
+    logger.info(f"Fixture server on {server.base_url}")
+    return server
+
+
+def fixture_env(base_url):
+    """Environment that points the bots at the fixture server"""
+    return {
+        "AVAILITY_WWW_URL": f"{base_url}/",
+        "AVAILITY_LOGIN_URL": f"{base_url}{LOGIN_PATH}",
+        "AVAILITY_HOME_URL": f"{base_url}{HOME_PATH}#!/",
+        "NPPES_API_URL": f"{base_url}/nppes/api/",
+        "FLASK_BASE_URL": base_url,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the portal fixtures for offline bot runs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = start(args.port, args.host, args.latency)
+    for name, value in fixture_env(server.base_url).items():
+        print(f"export {name}='{value}'")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+/*
+ * Stand-in for the typeahead inputs of the eligibility form (payer,
+ * provider, benefit/service type).
+ *
+ *   autocomplete(input, options, {itemClass: 'dropdown-item', delay: 150})
+ *
+ * Typing shows the options that contain the text after a short "request";
+ * clicking an option or ArrowDown/Enter picks it.
+ */
+(function () {
+    window.autocomplete = function (input, options, settings) {
+        settings = settings || {};
+        var list = document.createElement('div');
+        list.className = 'autocomplete-menu';
+        list.style.display = 'none';
+        input.parentNode.appendChild(list);
+        var timer = null, highlighted = -1;
+
+        function items() { return list.querySelectorAll('div'); }
+
+        function pick(value) {
+            var setter = Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, 'value').set;
+            setter.call(input, value);
+            input.setAttribute('data-selected', value);
+            list.style.display = 'none';
+            input.dispatchEvent(new Event('change', {bubbles: true}));
+        }
+
+        function show() {
+            var query = input.value.toLowerCase();
+            list.innerHTML = '';
+            highlighted = -1;
+            options.filter(function (option) { return option.toLowerCase().indexOf(query) !== -1; })
+                .forEach(function (option) {
+                    var item = document.createElement('div');
+                    item.className = settings.itemClass || 'dropdown-item';
+                    item.setAttribute('role', 'option');
+                    item.textContent = option;
+                    item.addEventListener('mousedown', function (e) { e.preventDefault(); pick(option); });
+                    item.addEventListener('click', function () { pick(option); });
+                    list.appendChild(item);
+                });
+            list.style.display = list.children.length ? 'block' : 'none';
+        }
+
+        input.addEventListener('input', function () {
+            if (input.getAttribute('data-selected') === input.value) { return; }
+            clearTimeout(timer);
+            timer = setTimeout(show, settings.delay === undefined ? 150 : settings.delay);
+        });
+        input.addEventListener('keydown', function (e) {
+            var rows = items();
+            if (list.style.display === 'none' || !rows.length) { return; }
+            if (e.key === 'ArrowDown') {
+                highlighted = Math.min(highlighted + 1, rows.length - 1);
+            } else if (e.key === 'ArrowUp') {
+                highlighted = Math.max(highlighted - 1, 0);
+            } else if (e.key === 'Enter' && highlighted >= 0) {
+                e.preventDefault();
+                pick(rows[highlighted].textContent);
+                return;
+            } else {
+                return;
+            }
+            rows.forEach(function (row, i) { row.classList.toggle('active', i === highlighted); });
+        });
+    };
+})();
@@ -0,0 +1,163 @@
+/*
+ * Stand-in for the Select2 3.x widgets on the Availity forms.
+ *
+ * Renders the markup the bots work with (.select2-container / .select2-choice /
+ * .select2-chosen, one shared .select2-drop with .select2-input and
+ * .select2-result-selectable rows), opens on mousedown or click, filters
+ * remote-style with a "Searching..." row, selects on mouseup and supports
+ * ArrowDown/Enter. Enable on <select class="s2">:
+ *   data-placeholder  text shown until something is chosen
+ *   data-search       "1" to show the search box
+ *   data-delay        ms the search "request" takes (default 150)
+ */
+(function () {
+    var drop = null, active = null, timer = null;
+
+    function text(option) { return option.textContent.trim(); }
+
+    function build(select) {
+        var container = document.createElement('div');
+        container.className = 'select2-container form-control';
+        container.id = 's2id_' + select.id;
+        container.innerHTML = '<a class="select2-choice" href="javascript:void(0)">' +
+            '<span class="select2-chosen"></span><abbr class="select2-search-choice-close"></abbr>' +
+            '<span class="select2-arrow"><b></b></span></a>';
+        container.querySelector('.select2-chosen').textContent = select.getAttribute('data-placeholder') || '';
+        container.select = select;
+        select.style.display = 'none';
+        select.parentNode.insertBefore(container, select);
+
+        container.addEventListener('mousedown', function (e) { e.preventDefault(); open(container); });
+        container.addEventListener('click', function () { open(container); });
+        return container;
+    }
+
+    function ensureDrop() {
+        if (drop) { return drop; }
+        drop = document.createElement('div');
+        drop.className = 'select2-drop';
+        drop.style.display = 'none';
+        drop.innerHTML = '<div class="select2-search"><input type="text" class="select2-input" autocomplete="off"></div>' +
+            '<ul class="select2-results"></ul>';
+        document.body.appendChild(drop);
+
+        var input = drop.querySelector('.select2-input');
+        input.addEventListener('input', function () { search(input.value); });
+        drop.addEventListener('mouseup', function (e) {
+            var row = e.target.closest('.select2-result-selectable');
+            if (row) { choose(row); }
+        });
+        drop.addEventListener('click', function (e) {
+            var row = e.target.closest('.select2-result-selectable');
+            if (row) { choose(row); }
+        });
+        drop.addEventListener('mouseover', function (e) {
+            var row = e.target.closest('.select2-result-selectable');
+            if (row) { highlight(row); }
+        });
+        document.addEventListener('keydown', function (e) {
+            if (!active) { return; }
+            var rows = Array.prototype.slice.call(drop.querySelectorAll('.select2-result-selectable'));
+            var current = rows.indexOf(drop.querySelector('.select2-highlighted'));
+            if (e.key === 'ArrowDown') {
+                highlight(rows[Math.min(current + 1, rows.length - 1)]);
+                e.preventDefault();
+            } else if (e.key === 'ArrowUp') {
+                highlight(rows[Math.max(current - 1, 0)]);
+                e.preventDefault();
+            } else if (e.key === 'Enter' && current >= 0) {
+                choose(rows[current]);
+                e.preventDefault();
+            } else if (e.key === 'Escape') {
+                close();
+            }
+        }, true);
+        document.addEventListener('mousedown', function (e) {
+            if (active && !drop.contains(e.target) && !active.contains(e.target)) { close(); }
+        });
+        return drop;
+    }
+
+    function highlight(row) {
+        if (!row) { return; }
+        var previous = drop.querySelector('.select2-highlighted');
+        if (previous) { previous.classList.remove('select2-highlighted'); }
+        row.classList.add('select2-highlighted');
+    }
+
+    function render(options) {
+        var list = drop.querySelector('.select2-results');
+        list.innerHTML = '';
+        if (!options.length) {
+            list.innerHTML = '<li class="select2-no-results">No matches found</li>';
+            return;
+        }
+        options.forEach(function (option) {
+            var row = document.createElement('li');
+            row.className = 'select2-results-dept-0 select2-result select2-result-selectable';
+            row.innerHTML = '<div class="select2-result-label"></div>';
+            row.querySelector('.select2-result-label').textContent = text(option);
+            row.option = option;
+            list.appendChild(row);
+        });
+    }
+
+    function search(query) {
+        var select = active.select;
+        var delay = parseInt(select.getAttribute('data-delay') || '150', 10);
+        drop.querySelector('.select2-results').innerHTML = '<li class="select2-searching">Searching...</li>';
+        clearTimeout(timer);
+        timer = setTimeout(function () {
+            var q = query.toLowerCase();
+            render(Array.prototype.filter.call(select.options, function (option) {
+                return option.value && text(option).toLowerCase().indexOf(q) !== -1;
+            }));
+        }, delay);
+    }
+
+    function open(container) {
+        ensureDrop();
+        if (active === container) { return; }
+        if (active) { close(); }
+        active = container;
+        var searchable = container.select.getAttribute('data-search') === '1';
+        var input = drop.querySelector('.select2-input');
+        drop.querySelector('.select2-search').style.display = searchable ? '' : 'none';
+        input.value = '';
+
+        var rect = container.getBoundingClientRect();
+        drop.style.top = (rect.bottom + window.scrollY) + 'px';
+        drop.style.left = (rect.left + window.scrollX) + 'px';
+        drop.style.width = rect.width + 'px';
+        drop.style.display = 'block';
+        drop.classList.add('select2-drop-active');
+        container.classList.add('select2-dropdown-open', 'select2-container-active');
+
+        render(Array.prototype.filter.call(container.select.options, function (o) { return o.value; }));
+        if (searchable) { input.focus(); }
+    }
+
+    function close() {
+        if (!active) { return; }
+        active.classList.remove('select2-dropdown-open', 'select2-container-active');
+        drop.classList.remove('select2-drop-active');
+        drop.style.display = 'none';
+        active = null;
+    }
+
+    function choose(row) {
+        var container = active;
+        if (!container) { return; }
+        var select = container.select;
+        select.value = row.option.value;
+        container.querySelector('.select2-chosen').textContent = text(row.option);
+        close();
+        select.dispatchEvent(new Event('change', {bubbles: true}));
+    }
+
+    window.select2lite = {
+        init: function (root) {
+            (root || document).querySelectorAll('select.s2').forEach(build);
+        }
+    };
+})();
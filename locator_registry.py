@@ -0,0 +1,218 @@
+"""
+Learned locator order for elements the bots find in several ways
+
+Portal markup drifts, so many lookups try a list of strategies (an id, an
+aria attribute, a JavaScript search by nearby text, ...) in a fixed order,
+and every lookup paid for the misses in front of the strategy that works.
+locate() remembers which strategy found each logical element, tries that one
+first (waiting at most RPA_LOCATOR_PROBE seconds for it), and only runs the
+other strategies when it misses, i.e. when the markup actually changed.
+
+Strategies are listed most specific first, and a broad fallback can match
+the wrong element. A strategy lower in the list only becomes the winner
+after finding the element on RPA_LOCATOR_MIN_HITS lookups in a row, not on
+one lookup where the page had not rendered yet. Every
+RPA_LOCATOR_RECHECK_EVERY hits the strategies are tried in their listed
+order again, so a more specific one that matches takes first place back.
+
+Hit and miss counts per strategy and the current winner are kept in
+LOCATOR_FILE, so every bot process starts with what earlier runs learned.
+They are written when a winner changes, at most every RPA_LOCATOR_SAVE_INTERVAL
+seconds otherwise, and when the process exits or the worker finishes a job
+(worker processes end without running atexit handlers).
+
+    member_id = locate(driver, "aetna.member_id", [
+        ("id", (By.CSS_SELECTOR, "input#subscriber\\\\.memberId")),
+        ("aria", (By.XPATH, "//input[contains(@aria-labelledby, 'subscriber.memberId')]")),
+        ("nearby_text", lambda d: d.execute_script(FIND_MEMBER_ID_JS)),
+    ])
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from selenium.common.exceptions import WebDriverException
+
+from rpa_waits import wait_until, POLL_INTERVAL
+
+logger = logging.getLogger("locator_registry")
+
+LOCATOR_FILE = os.getenv('RPA_LOCATOR_FILE', 'sessions/locators.json')
+
+# How long the last winning strategy gets before the others are tried
+PROBE_TIMEOUT = float(os.getenv('RPA_LOCATOR_PROBE', '2'))
+# Lookups in a row a strategy below the winner must win before it takes over
+MIN_HITS = int(os.getenv('RPA_LOCATOR_MIN_HITS', '3'))
+# Hits of the winner after which the strategies are tried in their listed order again
+RECHECK_EVERY = int(os.getenv('RPA_LOCATOR_RECHECK_EVERY', '20'))
+# Longest the counts of this process stay unsaved
+SAVE_INTERVAL = float(os.getenv('RPA_LOCATOR_SAVE_INTERVAL', '30'))
+
+_stats = None
+_touched = set()
+_last_save = time.time()
+_lock = threading.Lock()
+
+
+def _load():
+    global _stats
+    if _stats is None:
+        try:
+            with open(LOCATOR_FILE) as f:
+                _stats = json.load(f)
+        except (OSError, ValueError):
+            _stats = {}
+    return _stats
+
+
+def save():
+    """Write the stats of the elements looked up in this process, keeping other processes' entries"""
+    global _last_save
+    with _lock:
+        _last_save = time.time()
+        if not _touched:
+            return
+        try:
+            with open(LOCATOR_FILE) as f:
+                on_disk = json.load(f)
+        except (OSError, ValueError):
+            on_disk = {}
+        on_disk.update({name: _stats[name] for name in _touched})
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(LOCATOR_FILE)), exist_ok=True)
+            tmp_path = f"{LOCATOR_FILE}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(on_disk, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, LOCATOR_FILE)
+            _touched.clear()
+        except OSError as e:
+            logger.warning(f"Could not save locator stats: {str(e)}")
+
+
+atexit.register(save)
+
+
+def _save_if_due():
+    if time.time() - _last_save >= SAVE_INTERVAL:
+        save()
+
+
+def winner(name):
+    """Strategy that last found the element, or None"""
+    with _lock:
+        return _load().get(name, {}).get("winner")
+
+
+def _recheck_due(name):
+    """True when the learned winner has had RECHECK_EVERY hits since the full order was last tried"""
+    with _lock:
+        return _load().get(name, {}).get("since_recheck", 0) >= RECHECK_EVERY
+
+
+def _record(name, found, missed, order, full_pass=False):
+    """
+    Count the hit and the misses of one lookup; returns True when the winner changed
+
+    The strategies are listed most specific first. One found earlier in the
+    list than the winner takes over at once; one further down (typically a
+    broad fallback that matched because the page was not rendered yet) must
+    find the element on MIN_HITS lookups in a row first.
+    """
+    with _lock:
+        entry = _load().setdefault(name, {"winner": None, "strategies": {}})
+        for strategy in missed:
+            entry["strategies"].setdefault(strategy, {"hits": 0, "misses": 0})["misses"] += 1
+        if full_pass:
+            entry["since_recheck"] = 0
+        changed = False
+        if found:
+            counts = entry["strategies"].setdefault(found, {"hits": 0, "misses": 0})
+            counts["hits"] += 1
+            counts["last_hit"] = datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+            current = entry["winner"]
+            if found == current:
+                entry["candidate"], entry["streak"] = None, 0
+                if not full_pass:
+                    entry["since_recheck"] = entry.get("since_recheck", 0) + 1
+            else:
+                if entry.get("candidate") == found:
+                    entry["streak"] = entry.get("streak", 0) + 1
+                else:
+                    entry["candidate"], entry["streak"] = found, 1
+                rank = order.index(found)
+                outranks = rank == 0 or (current in order and rank < order.index(current))
+                if outranks or entry["streak"] >= MIN_HITS:
+                    entry.update(winner=found, candidate=None, streak=0, since_recheck=0)
+                    changed = True
+        _touched.add(name)
+        return changed
+
+
+def _attempt(driver, finder, accept):
+    """Result of one strategy, or None; a finder is a (By, value) locator or a callable(driver)"""
+    try:
+        if callable(finder):
+            return finder(driver) or None
+        for element in driver.find_elements(*finder):
+            if accept is None or accept(element):
+                return element
+    except WebDriverException:
+        pass
+    return None
+
+
+def locate(driver, name, strategies, timeout=0, probe=None, accept=None):
+    """
+    Find an element with the strategy that worked last time, falling back to the rest in order
+
+    strategies is a list of (strategy_name, finder). accept, if given, filters
+    the elements a locator matches (e.g. displayed and enabled); callables do
+    their own filtering and return None on a miss. The strategies are tried in
+    rounds until one finds something or timeout seconds have passed (one
+    round when timeout is 0). Returns what the winning finder found, or None.
+    """
+    finders = dict(strategies)
+    order = [strategy for strategy, _ in strategies]
+    learned = winner(name)
+    missed = []
+    # Every RECHECK_EVERY hits the winner gets no head start, so a more
+    # specific locator that matches again reclaims first place
+    full_pass = learned in finders and _recheck_due(name)
+    if learned in finders and not full_pass:
+        probe = PROBE_TIMEOUT if probe is None else probe
+        found = wait_until(driver, lambda d: _attempt(d, finders[learned], accept), "locator_probe",
+                           timeout=probe, required=False)
+        if found:
+            _record(name, learned, [], order)
+            _save_if_due()
+            return found
+        logger.info(f"{name}: '{learned}' no longer matches, trying the other locators")
+        missed.append(learned)
+
+    started = time.time()
+    while True:
+        for strategy in order:
+            if strategy == learned and not full_pass:
+                continue
+            found = _attempt(driver, finders[strategy], accept)
+            if found:
+                if _record(name, strategy, [s for s in missed if s != strategy], order, full_pass):
+                    logger.info(f"{name}: now found by '{strategy}'")
+                    save()
+                else:
+                    _save_if_due()
+                return found
+            if strategy not in missed:
+                missed.append(strategy)
+        if time.time() - started >= timeout:
+            break
+        time.sleep(POLL_INTERVAL)
+
+    _record(name, None, missed, order, full_pass)
+    _save_if_due()
+    logger.info(f"{name}: no locator matched ({', '.join(order)})")
+    return None
@@ -0,0 +1,251 @@
+"""
+MFA broker between the bots and the person holding the authenticator
+
+A bot that reaches Availity's 2FA page opens a session (POST /mfa-request) and
+then waits on GET /mfa-check/<session_id>?wait=25. The check is held open
+until someone enters the code on the MFA page (POST /mfa-submit) or the wait
+runs out, so the code reaches the bot as soon as it is submitted instead of
+on its next poll.
+
+Sessions are kept in memory and in rpa_mfa_sessions. The table lets a check
+land on any app process and survive a restart; a submit wakes the checks
+waiting in the same process at once, and checks in other processes read the
+table again every MFA_DB_POLL_SECONDS.
+
+    - a session is pending until a code is submitted for it or it expires,
+      MFA_SESSION_TTL seconds after it was opened; an expired session takes
+      no code
+    - a session takes one code, and a code completes one session: Availity
+      accepts a one-time code once, so a code already given to another
+      session within MFA_CODE_REUSE_SECONDS is refused
+    - a code is always submitted for a named session, so a session opened by
+      someone else cannot take the code meant for a waiting bot
+
+A held check occupies an app thread for up to MFA_MAX_WAIT seconds, one per
+bot waiting at the 2FA page (at most RPA_WORKERS plus any standalone runs).
+Serve the app with threaded or gevent workers (e.g. gunicorn --threads 8)
+so those waits, and the job event streams, do not starve page requests;
+with sync single-thread workers lower MFA_MAX_WAIT and the bots'
+MFA_WAIT_SECONDS.
+
+/mfa-request and /mfa-check hand out live codes, so the bots authenticate
+with the shared secret in MFA_BOT_TOKEN (sent as the X-RPA-Token header);
+the routes refuse every request while it is not configured.
+"""
+import hmac
+import logging
+import os
+import re
+import threading
+import time
+from datetime import timedelta
+from uuid import uuid4
+
+from OncoAuth.models import db
+from rpa_jobs import utcnow
+
+logger = logging.getLogger(__name__)
+
+MFA_PENDING = "pending"
+MFA_COMPLETED = "completed"
+MFA_EXPIRED = "expired"
+
+# The bots give up on a code after 300 s
+MFA_SESSION_TTL = int(os.getenv('MFA_SESSION_TTL', '300'))
+# Longest a check is held open; the bots ask for 25 s
+MFA_MAX_WAIT = float(os.getenv('MFA_MAX_WAIT', '30'))
+# How often a waiting check re-reads the table for submits made by other processes
+MFA_DB_POLL_SECONDS = float(os.getenv('MFA_DB_POLL_SECONDS', '0.5'))
+# Authenticator codes change every 30 s; one seen again within this window is a replay
+MFA_CODE_REUSE_SECONDS = int(os.getenv('MFA_CODE_REUSE_SECONDS', '120'))
+# Finished sessions, and the codes in them, are deleted after this long
+MFA_RETENTION = int(os.getenv('MFA_RETENTION', str(24 * 3600)))
+
+CODE_PATTERN = re.compile(r"^\d{6,8}$")
+
+MFA_BOT_TOKEN = os.getenv('MFA_BOT_TOKEN')
+BOT_TOKEN_HEADER = 'X-RPA-Token'
+
+
+class MfaSession(db.Model):
+    """One 2FA challenge a bot is waiting on, and the code entered for it"""
+    __tablename__ = 'rpa_mfa_sessions'
+
+    session_id = db.Column(db.String(36), primary_key=True)
+    script_type = db.Column(db.String(50))
+    status = db.Column(db.String(20), nullable=False, default=MFA_PENDING, index=True)
+    code = db.Column(db.String(12), index=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    completed_at = db.Column(db.DateTime)
+
+
+_table_ready = False
+
+
+def ensure_mfa_table():
+    global _table_ready
+    if not _table_ready:
+        MfaSession.__table__.create(bind=db.engine, checkfirst=True)
+        _table_ready = True
+
+
+# ===============================
+# IN-MEMORY SESSIONS
+# ===============================
+# Snapshots of the sessions this process has seen, keyed by session_id; the
+# condition is notified whenever one changes so waiting checks wake up
+_sessions = {}
+_changed = threading.Condition()
+
+
+def _snapshot(row):
+    status = row.status
+    if status == MFA_PENDING and row.expires_at <= utcnow():
+        status = MFA_EXPIRED
+    return {
+        "session_id": row.session_id,
+        "script_type": row.script_type,
+        "status": status,
+        "code": row.code if status == MFA_COMPLETED else None,
+        "created_at": row.created_at,
+        "expires_at": row.expires_at,
+    }
+
+
+def _remember(snapshot):
+    with _changed:
+        _sessions[snapshot["session_id"]] = snapshot
+        _changed.notify_all()
+
+
+def _forget_old_sessions(now):
+    horizon = now - timedelta(seconds=MFA_CODE_REUSE_SECONDS)
+    with _changed:
+        for session_id in [s for s, snapshot in _sessions.items() if snapshot["expires_at"] < horizon]:
+            del _sessions[session_id]
+
+
+def to_dict(snapshot, include_code=False):
+    """JSON form of a session; the code is only handed to the bot that owns it"""
+    data = {
+        "session_id": snapshot["session_id"],
+        "script_type": snapshot["script_type"],
+        "status": snapshot["status"],
+        "created_at": snapshot["created_at"].isoformat(),
+        "expires_at": snapshot["expires_at"].isoformat(),
+    }
+    if include_code and snapshot["code"]:
+        data["code"] = snapshot["code"]
+    return data
+
+
+# ===============================
+# BROKER OPERATIONS
+# ===============================
+def create_session(script_type=None):
+    ensure_mfa_table()
+    now = utcnow()
+    row = MfaSession(
+        session_id=str(uuid4()),
+        script_type=(script_type or "")[:50] or None,
+        status=MFA_PENDING,
+        created_at=now,
+        expires_at=now + timedelta(seconds=MFA_SESSION_TTL)
+    )
+    db.session.add(row)
+    MfaSession.query.filter(MfaSession.expires_at < now - timedelta(seconds=MFA_RETENTION)) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    _forget_old_sessions(now)
+
+    snapshot = _snapshot(row)
+    _remember(snapshot)
+    logger.info(f"MFA session {row.session_id} opened for {script_type}")
+    return snapshot
+
+
+def get_session(session_id):
+    """Current state of a session, or None when it does not exist"""
+    with _changed:
+        cached = _sessions.get(session_id)
+    if cached and cached["status"] != MFA_PENDING:
+        return cached
+
+    ensure_mfa_table()
+    # End the current transaction so a submit made by another process is seen
+    db.session.commit()
+    row = MfaSession.query.get(session_id)
+    snapshot = _snapshot(row) if row else None
+    if snapshot:
+        _remember(snapshot)
+    return snapshot
+
+
+def wait_for_code(session_id, wait=0):
+    """Session state once it is no longer pending, or after wait seconds"""
+    deadline = time.time() + min(max(wait, 0), MFA_MAX_WAIT)
+    while True:
+        snapshot = get_session(session_id)
+        remaining = deadline - time.time()
+        if not snapshot or snapshot["status"] != MFA_PENDING or remaining <= 0:
+            return snapshot
+        with _changed:
+            # Checked under the lock so a submit from this process cannot slip in unnoticed
+            if _sessions.get(session_id, {}).get("status") == MFA_PENDING:
+                _changed.wait(min(MFA_DB_POLL_SECONDS, remaining))
+
+
+def pending_sessions():
+    ensure_mfa_table()
+    rows = MfaSession.query \
+        .filter(MfaSession.status == MFA_PENDING, MfaSession.expires_at > utcnow()) \
+        .order_by(MfaSession.created_at) \
+        .all()
+    return [_snapshot(row) for row in rows]
+
+
+def bot_token_valid(token):
+    """True when token is the configured bot secret"""
+    if not MFA_BOT_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), MFA_BOT_TOKEN.encode())
+
+
+def submit_code(code, session_id):
+    """
+    Complete a pending session with a code
+    Returns (session, None) on success or (None, error message) when the code
+    is malformed or already used, or the session is unknown or no longer pending
+    """
+    if not session_id:
+        return None, "session_id is required"
+    code = re.sub(r"\s+", "", code or "")
+    if not CODE_PATTERN.match(code):
+        return None, "The code must be 6 to 8 digits"
+
+    ensure_mfa_table()
+    now = utcnow()
+    reused = MfaSession.query.filter(
+        MfaSession.code == code,
+        MfaSession.completed_at >= now - timedelta(seconds=MFA_CODE_REUSE_SECONDS)
+    ).first()
+    if reused:
+        db.session.rollback()
+        return None, "This code was already used; wait for the authenticator to show a new one"
+
+    # Conditional update: of two submits racing for one session only one wins
+    updated = MfaSession.query.filter(
+        MfaSession.session_id == session_id,
+        MfaSession.status == MFA_PENDING,
+        MfaSession.expires_at > now
+    ).update({"status": MFA_COMPLETED, "code": code, "completed_at": now}, synchronize_session=False)
+    db.session.commit()
+    if updated:
+        logger.info(f"MFA code submitted for session {session_id}")
+        return get_session(session_id), None
+
+    snapshot = get_session(session_id)
+    if not snapshot:
+        return None, "Unknown session_id"
+    return None, f"The session is already {snapshot['status']}"
@@ -1,20 +1,11 @@
-import time
 import mysql.connector
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, WebDriverException
 import os
-import platform
-from pathlib import Path
 import logging
 from dotenv import load_dotenv
 from urllib.parse import urlparse
-import subprocess
-import sys
+
+from nppes_client import lookup_provider
+from rpa_result import ResultRecorder, recording, timed_step, RESULT_SUCCESS, RESULT_FAILED
 
 load_dotenv()
 
@@ -33,66 +24,9 @@ def parse_sqlalchemy_uri(uri):
 SQLALCHEMY_URI = os.getenv('SQLALCHEMY_DATABASE_URI')
 DB_CONFIG = parse_sqlalchemy_uri(SQLALCHEMY_URI) if SQLALCHEMY_URI else None
 
-def install_chromedriver_manager():
-    """Install webdriver-manager if not already installed"""
-    try:
-        import webdriver_manager
-    except ImportError:
-        print("Installing webdriver-manager...")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "webdriver-manager"])
-
-def setup_chrome_driver():
-    """Setup Chrome driver with automatic version management"""
-    try:
-        # Try using webdriver-manager for automatic ChromeDriver management
-        install_chromedriver_manager()
-        from webdriver_manager.chrome import ChromeDriverManager
-        
-        options = Options()
-        options.add_argument("--start-maximized")
-        options.add_argument("--headless")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--window-size=1920,1080")
-        
-        # Use ChromeDriverManager to automatically download compatible version
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=options)
-        return driver
-        
-    except Exception as e:
-        print(f"Failed to setup Chrome driver with webdriver-manager: {e}")
-        
-        # Fallback to manual ChromeDriver path
-        try:
-            base_dir = Path(__file__).resolve().parent
-            if platform.system() == 'Windows':
-                chromedriver_path = base_dir / 'chromedriver.exe'
-            else:
-                chromedriver_path = base_dir / 'chromedriver'
-            
-            if not chromedriver_path.exists():
-                raise FileNotFoundError(f"ChromeDriver not found at {chromedriver_path}")
-            
-            # Make sure it's executable
-            if platform.system() != 'Windows':
-                os.chmod(chromedriver_path, 0o755)
-            
-            options = Options()
-            options.add_argument("--start-maximized")
-            options.add_argument("--headless")
-            options.add_argument("--no-sandbox")
-            options.add_argument("--disable-dev-shm-usage")
-            options.add_argument("--disable-gpu")
-            
-            service = Service(str(chromedriver_path))
-            driver = webdriver.Chrome(service=service, options=options)
-            return driver
-            
-        except Exception as fallback_error:
-            print(f"Fallback ChromeDriver setup also failed: {fallback_error}")
-            raise
+# Run history shared with the RPA worker (rpa_jobs.RpaStepTiming)
+BOT_NAME = "npi_lookup"
+PORTAL = "nppes"
 
 def get_provider_id_by_name(first_name, last_name, auth_id):
     """
@@ -103,141 +37,49 @@ def get_provider_id_by_name(first_name, last_name, auth_id):
         print("Database configuration not found. Please check SQLALCHEMY_DATABASE_URI environment variable.")
         return None
     
-    driver = None
     provider_id = None
+    recorder = ResultRecorder(BOT_NAME)
     
     print(f"Starting NPI search for: {first_name} {last_name}")
 
     try:
-        # Setup Chrome driver with automatic version management
-        driver = setup_chrome_driver()
-        wait = WebDriverWait(driver, 15)
-        
-        print(f"Searching NPI for: {first_name} {last_name}")
-        driver.get("https://npiregistry.cms.hhs.gov/search")
-        
-        # Wait for page to load completely
-        time.sleep(2)
-
-        # Fill search fields with better error handling
-        first_name_field = wait.until(EC.presence_of_element_located((By.ID, "firstName")))
-        first_name_field.clear()
-        first_name_field.send_keys(first_name)
-        
-        last_name_field = driver.find_element(By.ID, "lastName")
-        last_name_field.clear()
-        last_name_field.send_keys(last_name)
-
-        # Click Search button with improved reliability
-        search_btn = wait.until(EC.element_to_be_clickable((By.NAME, "search")))
-        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", search_btn)
-        time.sleep(1)
-        
-        try:
-            search_btn.click()
-        except Exception:
-            print("Regular click failed, trying JavaScript click")
-            driver.execute_script("arguments[0].click();", search_btn)
-
-        # Wait for results with better timeout handling
-        try:
-            npi_button = wait.until(EC.presence_of_element_located((
-                By.XPATH, "//table[contains(@class, 'table-hover')]//button[@class='btn btn-link']"
-            )))
-            npi_number = npi_button.text.strip()
-            print(f"Found NPI: {npi_number}")
-
-            # Click the NPI button to open details
-            driver.execute_script("arguments[0].click();", npi_button)
-            time.sleep(3)
-
-            # Extract additional provider details
-            provider_name = extract_provider_name(driver)
-            provider_name = extract_provider_name(driver)
-
-            # Protect against junk values
-            if provider_name and provider_name.lower().startswith("provider information for"):
-                print("⚠️ Skipping provider_name update due to invalid format.")
-                provider_name = None  # Treat as missing
-
-            
-            # Extract status from detail page
-            page_text = driver.page_source.lower()
-            if "active" in page_text:
-                status = "Active"
-            elif "inactive" in page_text:
-                status = "Inactive"
-            else:
-                status = "Unknown"
-
-            print(f"Provider Name: {provider_name}, Status: {status}")
-           
-            # Update database with the found NPI and details
-            provider_id = update_provider_in_db(first_name, last_name, npi_number, provider_name)
-
-            # Update prescrubbing table if auth_id is provided
-            if auth_id and provider_id:
-                update_npi_validation_status(auth_id, provider_id, "PASS")
-            
-            if provider_id:
-                print(f"Successfully updated database with provider_id: {provider_id}")
-            else:
-                print("Failed to update database")
+        with recording(recorder):
+            # One request to the NPPES registry API answers with NPI, name, status and taxonomy
+            with timed_step("nppes_lookup"):
+                found, error = lookup_provider(first_name, last_name)
+
+            if error:
+                # Registry unreachable: leave the validation status for a later retry
+                print(f"{error} for: {first_name} {last_name}")
+            elif found:
+                print(f"Found NPI: {found['npi']}, Provider Name: {found['provider_name']}, "
+                      f"Status: {found['status']}, Taxonomy: {found['taxonomy']}")
+                with timed_step("update_db"):
+                    # Update database with the found NPI and details
+                    provider_id = update_provider_in_db(first_name, last_name, found["npi"], found["provider_name"])
+
+                    # Update prescrubbing table if auth_id is provided
+                    if auth_id and provider_id:
+                        update_npi_validation_status(auth_id, provider_id, "PASS")
                 
-        except TimeoutException:
-            print(f"No results found for: {first_name} {last_name}")
-            if auth_id:
-                update_npi_validation_status(auth_id, None, "FAIL")
-
-    except WebDriverException as e:
-        print(f"WebDriver error for {first_name} {last_name}: {e}")
-        if "This version of ChromeDriver only supports Chrome version" in str(e):
-            print("\n🔧 SOLUTION: ChromeDriver version mismatch detected!")
-            print("Run: pip install webdriver-manager")
-            print("This will automatically manage ChromeDriver versions.")
-        provider_id = None
+                if provider_id:
+                    print(f"Successfully updated database with provider_id: {provider_id}")
+                else:
+                    print("Failed to update database")
+            else:
+                print(f"No results found for: {first_name} {last_name}")
+                if auth_id:
+                    update_npi_validation_status(auth_id, None, "FAIL")
 
     except Exception as e:
         print(f"Unexpected error for {first_name} {last_name}: {e}")
         provider_id = None
     
     finally:
-        if driver:
-            try:
-                driver.quit()
-                print("WebDriver closed successfully")
-            except Exception as e:
-                print(f"Error closing WebDriver: {e}")
+        save_step_timings(recorder.finish(RESULT_SUCCESS if provider_id else RESULT_FAILED))
     
     return provider_id
 
-def extract_provider_name(driver):
-    """Extract provider name from the NPI detail page with improved selectors"""
-    try:
-        selectors = [
-            "//h2[contains(@class, 'provider-name')]",
-            "//div[contains(@class, 'provider-name')]", 
-            "//span[contains(text(), 'Provider Name')]/following-sibling::*",
-            "//td[contains(text(), 'Provider Name')]/following-sibling::td",
-            "//div[@class='row']//strong[contains(text(), 'Name')]/parent::*/following-sibling::*",
-            "//h1", "//h2", "//h3"  # Fallback to any heading
-        ]
-        
-        for selector in selectors:
-            try:
-                elements = driver.find_elements(By.XPATH, selector)
-                for element in elements:
-                    text = element.text.strip()
-                    if text and len(text) > 2 and not text.isdigit():
-                        return text
-            except Exception:
-                continue
-        
-        return None
-    except Exception as e:
-        print(f"Error extracting provider name: {e}")
-        return None
-
 def update_provider_in_db(first_name, last_name, npi_number, provider_name):
     """Update the provider_details table with NPI number and other details"""
     connection = None
@@ -353,6 +195,33 @@ def update_npi_validation_status(auth_id, provider_id, status):
         if connection and connection.is_connected():
             connection.close()
 
+def save_step_timings(document):
+    """Add the lookup's step durations to the RPA run history (rpa_step_timings)"""
+    if not DB_CONFIG:
+        return
+    rows = [(timing["name"], timing["seconds"], timing["ok"]) for timing in document["timings"]]
+    rows.append(("total", document["seconds"], document["status"] == RESULT_SUCCESS))
+
+    connection = None
+    cursor = None
+    try:
+        connection = mysql.connector.connect(**DB_CONFIG)
+        cursor = connection.cursor()
+        insert_query = """
+        INSERT INTO rpa_step_timings (job_id, portal, bot_type, step, seconds, ok, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, UTC_TIMESTAMP())
+        """
+        cursor.executemany(insert_query, [(None, PORTAL, BOT_NAME, step, seconds, ok) for step, seconds, ok in rows])
+        connection.commit()
+    except mysql.connector.Error as error:
+        # The table is created by the app on first RPA use; timings are best effort
+        print(f"⚠️ Could not save NPI lookup timings: {error}")
+    finally:
+        if cursor:
+            cursor.close()
+        if connection and connection.is_connected():
+            connection.close()
+
 # Test function
 def test_npi_lookup():
     """Test the NPI lookup functionality"""
@@ -0,0 +1,110 @@
+"""
+Client for the NPPES NPI Registry API
+
+One GET to the registry's JSON API (https://npiregistry.cms.hhs.gov/api/,
+version 2.1) answers a provider lookup with the NPI, name, status and
+taxonomy, so the lookup needs no browser. Requests share one pooled
+connection and are retried on connection errors, 429 and 5xx with backoff.
+
+    lookup_provider("Anuradha", "Kollipara")
+    -> ({"npi": "1234567893", "provider_name": "ANURADHA KOLLIPARA, MD",
+         "status": "Active", "taxonomy": "Internal Medicine"}, None)
+
+Point NPPES_API_URL at fixture_server.py (/nppes/api/) to run lookups offline.
+"""
+import logging
+import os
+import threading
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+load_dotenv()
+
+logger = logging.getLogger("nppes_client")
+
+NPPES_API_URL = os.getenv('NPPES_API_URL', 'https://npiregistry.cms.hhs.gov/api/')
+NPPES_API_VERSION = "2.1"
+# (connect, read) seconds per attempt
+NPPES_TIMEOUT = (float(os.getenv('NPPES_CONNECT_TIMEOUT', '3')), float(os.getenv('NPPES_READ_TIMEOUT', '10')))
+NPPES_RETRIES = int(os.getenv('NPPES_RETRIES', '3'))
+
+STATUS_NAMES = {"A": "Active", "D": "Inactive"}
+
+_http = None
+_http_lock = threading.Lock()
+
+
+def _session():
+    global _http
+    with _http_lock:
+        if _http is None:
+            retry = Retry(
+                total=NPPES_RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset(["GET"])
+            )
+            _http = requests.Session()
+            _http.mount("https://", HTTPAdapter(max_retries=retry, pool_maxsize=8))
+            _http.mount("http://", HTTPAdapter(max_retries=retry, pool_maxsize=8))
+        return _http
+
+
+def search_providers(first_name=None, last_name=None, number=None, limit=10):
+    """
+    Raw registry results for a name or an NPI number
+    Returns the list of results (empty when nothing matches), or None when the
+    registry could not be reached or rejected the query
+    """
+    params = {"version": NPPES_API_VERSION, "limit": limit}
+    for name, value in (("first_name", first_name), ("last_name", last_name), ("number", number)):
+        if value:
+            params[name] = value.strip()
+    try:
+        response = _session().get(NPPES_API_URL, params=params, timeout=NPPES_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+    except (requests.RequestException, ValueError) as e:
+        logger.warning(f"NPPES registry request failed: {str(e)}")
+        return None
+    # Bad queries come back as 200 with a list of errors
+    if data.get("Errors"):
+        logger.warning(f"NPPES registry rejected the query: {data['Errors']}")
+        return None
+    return data.get("results") or []
+
+
+def provider_summary(result):
+    """NPI, display name, status and primary taxonomy of one registry result"""
+    basic = result.get("basic") or {}
+    if basic.get("organization_name"):
+        name = basic["organization_name"]
+    else:
+        name = " ".join(part for part in (basic.get("first_name"), basic.get("middle_name"), basic.get("last_name")) if part)
+        if basic.get("credential"):
+            name = f"{name}, {basic['credential']}"
+    taxonomies = result.get("taxonomies") or []
+    primary = next((t for t in taxonomies if t.get("primary")), taxonomies[0] if taxonomies else {})
+    return {
+        "npi": str(result.get("number") or ""),
+        "provider_name": name or None,
+        "status": STATUS_NAMES.get(basic.get("status"), "Unknown"),
+        "taxonomy": primary.get("desc"),
+    }
+
+
+def lookup_provider(first_name, last_name):
+    """
+    First registry match for a provider's name
+    Returns (summary, None), (None, None) when nothing matches, or (None, error
+    message) when the registry could not be reached or rejected the query
+    """
+    results = search_providers(first_name=first_name, last_name=last_name, limit=1)
+    if results is None:
+        return None, "NPPES registry lookup failed"
+    if not results:
+        return None, None
+    return provider_summary(results[0]), None
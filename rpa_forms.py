@@ -0,0 +1,134 @@
+"""
+Value entry for portal form fields
+
+Typing a value one character at a time with a sleep between keys costs
+seconds per field. fill_field sets the whole value in one call through the
+native value setter (so React and Angular see the change) and fires the
+input/change/blur events the widgets listen to, then checks the value stuck.
+A field whose value does not stick falls back to keystrokes, and is typed
+from then on for the rest of the process.
+
+Entry modes, chosen per field name:
+    fast      set the value in one call and fire the events
+    last_key  set all but the last character, then type the last one; for
+              autocomplete inputs that only search on a real key event
+    type      send the keystrokes
+
+Override with RPA_FIELD_ENTRY, e.g. "payer=type,from_date=type".
+"""
+import logging
+import os
+import re
+import time
+
+from selenium.webdriver.common.keys import Keys
+
+logger = logging.getLogger("rpa_forms")
+
+ENTRY_FAST = "fast"
+ENTRY_LAST_KEY = "last_key"
+ENTRY_TYPE = "type"
+
+FIELD_ENTRY = {
+    "member_id": ENTRY_FAST,
+    "dob": ENTRY_FAST,
+    "from_date": ENTRY_FAST,
+    "payer": ENTRY_LAST_KEY,
+    "provider": ENTRY_LAST_KEY,
+    "service_type": ENTRY_LAST_KEY,
+    "select2_search": ENTRY_LAST_KEY,
+}
+DEFAULT_ENTRY = ENTRY_FAST
+
+# Delay between keystrokes when a field is typed
+KEY_DELAY = float(os.getenv('RPA_KEY_DELAY', '0.03'))
+
+# Fields that fell back to keystrokes in this process
+_needs_keys = set()
+
+SET_VALUE_JS = """
+var field = arguments[0], value = arguments[1], fire = arguments[2];
+var proto = field instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+var setter = Object.getOwnPropertyDescriptor(proto, 'value').set;
+field.focus();
+setter.call(field, value);
+field.dispatchEvent(new Event('input', {bubbles: true}));
+if (fire) {
+    field.dispatchEvent(new Event('change', {bubbles: true}));
+    field.dispatchEvent(new Event('blur', {bubbles: true}));
+    if (window.angular) {
+        var scope = angular.element(field).scope();
+        if (scope && !scope.$$phase) { scope.$apply(); }
+    }
+}
+return field.value;
+"""
+
+
+def _load_overrides():
+    entries = dict(FIELD_ENTRY)
+    for item in os.getenv('RPA_FIELD_ENTRY', '').split(','):
+        name, _, mode = item.partition('=')
+        if name.strip() and mode.strip() in (ENTRY_FAST, ENTRY_LAST_KEY, ENTRY_TYPE):
+            entries[name.strip()] = mode.strip()
+    return entries
+
+
+_entries = _load_overrides()
+
+
+def entry_mode(field):
+    if field in _needs_keys:
+        return ENTRY_TYPE
+    return _entries.get(field, DEFAULT_ENTRY)
+
+
+def _alnum(text):
+    return re.sub(r'[^0-9A-Za-z]', '', str(text or '')).lower()
+
+
+def value_matches(actual, expected):
+    """Compare ignoring input masks: 07/17/2025 matches 07172025, "__/__/____" matches nothing"""
+    if str(actual or '') == str(expected or ''):
+        return True
+    return bool(_alnum(expected)) and _alnum(actual) == _alnum(expected)
+
+
+def type_value(element, value, delay=KEY_DELAY):
+    """Clear the field and send the value as keystrokes"""
+    element.send_keys(Keys.CONTROL + "a")
+    element.send_keys(Keys.DELETE)
+    if not delay:
+        element.send_keys(value)
+        return
+    for char in value:
+        element.send_keys(char)
+        time.sleep(delay)
+
+
+def fill_field(driver, element, value, field=None, verify=True):
+    """
+    Enter value into an input the way the field's entry mode says
+
+    Returns True when the field ends up holding the value (always True when
+    verify is False, e.g. for search boxes a widget clears on selection).
+    """
+    value = str(value)
+    mode = entry_mode(field)
+    if mode != ENTRY_TYPE:
+        try:
+            if mode == ENTRY_LAST_KEY and value:
+                driver.execute_script(SET_VALUE_JS, element, value[:-1], False)
+                element.send_keys(value[-1])
+            else:
+                driver.execute_script(SET_VALUE_JS, element, value, True)
+            if not verify or value_matches(element.get_attribute('value'), value):
+                return True
+            logger.info(f"{field or 'field'} did not keep a value set in one call, typing it instead")
+        except Exception as e:
+            logger.info(f"Could not set {field or 'field'} in one call, typing it instead: {str(e)}")
+        if field:
+            _needs_keys.add(field)
+
+    type_value(element, value)
+    return not verify or value_matches(element.get_attribute('value'), value)
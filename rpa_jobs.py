@@ -0,0 +1,828 @@
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from OncoAuth.models import db, Prescrubbing, PatientDetails
+
+logger = logging.getLogger(__name__)
+
+# ===============================
+# JOB STATES AND BOT TYPES
+# ===============================
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+BOT_AETNA_PRIOR_AUTH = "aetna_prior_auth"
+BOT_AVAILITY_ELIGIBILITY = "availity_eligibility"
+
+# Module (and CLI script) of each bot type, relative to RPA_SCRIPT_DIR; the
+# worker imports them and calls their entry points in-process
+BOT_SCRIPTS = {
+    BOT_AETNA_PRIOR_AUTH: "aetnapriorauth.py",
+    BOT_AVAILITY_ELIGIBILITY: "eligibilityrpafinal.py",
+}
+
+# Portal each bot signs in to; jobs on the same portal (and so the same
+# account) share its concurrency and rate limits
+PORTAL_AVAILITY = "availity"
+PORTAL_NPPES = "nppes"
+PORTAL_HUMANA = "humana"
+
+BOT_PORTALS = {
+    BOT_AETNA_PRIOR_AUTH: PORTAL_AVAILITY,
+    BOT_AVAILITY_ELIGIBILITY: PORTAL_AVAILITY,
+}
+
+# ===============================
+# CONFIGURATION
+# ===============================
+RPA_SCRIPT_DIR = os.getenv('RPA_SCRIPT_DIR', 'rpa')
+JOB_TIMEOUT = int(os.getenv('RPA_JOB_TIMEOUT', '900'))
+JOB_MAX_ATTEMPTS = int(os.getenv('RPA_JOB_MAX_ATTEMPTS', '2'))
+# A running job whose worker has not sent a heartbeat for this long is
+# considered orphaned (worker crashed or host restarted) and is re-queued
+JOB_STALE_AFTER = int(os.getenv('RPA_JOB_STALE_AFTER', '120'))
+
+# Default (max concurrent jobs, max job starts per minute) per portal account;
+# override with e.g. RPA_AVAILITY_CONCURRENCY=3 and RPA_AVAILITY_PER_MINUTE=30
+DEFAULT_PORTAL_LIMITS = {
+    PORTAL_AVAILITY: (2, 20),
+    PORTAL_NPPES: (4, 60),
+    PORTAL_HUMANA: (1, 10),
+}
+# A repeat request for the same auth_id and bot within this many seconds of a
+# successful run gets that run's result instead of starting a new one
+IDEMPOTENCY_WINDOW = int(os.getenv('RPA_IDEMPOTENCY_WINDOW', '300'))
+# Checkpoints of a failed job are picked up by the next job for the same
+# auth_id and bot for this long
+CHECKPOINT_MAX_AGE = int(os.getenv('RPA_CHECKPOINT_MAX_AGE', str(24 * 3600)))
+# Window over which recent starts count towards a facility's share of a portal
+FAIR_SHARE_WINDOW = int(os.getenv('RPA_FAIR_SHARE_WINDOW', '3600'))
+
+# Eligibility answers are reused for this many seconds per status; override
+# with e.g. RPA_ELIGIBILITY_TTL_ACTIVE_COVERAGE=43200. Other statuses
+# (UNKNOWN, NO_RESPONSE, ERROR) are never cached
+ELIGIBILITY_CACHE_TTLS = {
+    "ACTIVE_COVERAGE": 24 * 3600,
+    "MEMBER_INACTIVE": 4 * 3600,
+    "INVALID": 3600,
+}
+# Service type the eligibility bot checks when the request does not name one
+ELIGIBILITY_SERVICE_TYPE = "Health Benefit Plan Coverage"
+
+
+class RpaJob(db.Model):
+    __tablename__ = 'rpa_jobs'
+
+    job_id = db.Column(db.String(36), primary_key=True)
+    auth_id = db.Column(db.String(64), index=True)
+    bot_type = db.Column(db.String(50), nullable=False)
+    portal = db.Column(db.String(30), index=True)
+    facility_id = db.Column(db.String(64))
+    status = db.Column(db.String(20), nullable=False, default=JOB_QUEUED, index=True)
+    payload = db.Column(db.Text)
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    # Last step each record completed, saved while the bot runs so a retry can resume
+    checkpoint = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker_id = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "auth_id": self.auth_id,
+            "bot_type": self.bot_type,
+            "portal": self.portal,
+            "facility_id": self.facility_id,
+            "status": self.status,
+            "result": json.loads(self.result) if self.result else None,
+            "error": self.error,
+            "attempts": self.attempts,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class RpaJobEvent(db.Model):
+    """State changes and step-level progress of a job, streamed to the UI"""
+    __tablename__ = 'rpa_job_events'
+
+    event_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    job_id = db.Column(db.String(36), nullable=False, index=True)
+    auth_id = db.Column(db.String(64), index=True)
+    event_type = db.Column(db.String(20), nullable=False)  # "state" or "progress"
+    status = db.Column(db.String(20))
+    message = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    def to_dict(self):
+        return {
+            "event_id": self.event_id,
+            "job_id": self.job_id,
+            "auth_id": self.auth_id,
+            "event_type": self.event_type,
+            "status": self.status,
+            "message": self.message,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+class RpaStepTiming(db.Model):
+    """Run history: one row per timed step of a finished bot run"""
+    __tablename__ = 'rpa_step_timings'
+
+    timing_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    job_id = db.Column(db.String(36), index=True)
+    portal = db.Column(db.String(30))
+    bot_type = db.Column(db.String(50), nullable=False)
+    step = db.Column(db.String(100), nullable=False)
+    seconds = db.Column(db.Float, nullable=False)
+    ok = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class EligibilityCacheEntry(db.Model):
+    """Last eligibility answer from Availity for a member, DOB, payer and service type"""
+    __tablename__ = 'rpa_eligibility_cache'
+    __table_args__ = (db.UniqueConstraint('member_id', 'patient_dob', 'payer', 'service_type'),)
+
+    cache_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    member_id = db.Column(db.String(64), nullable=False)
+    patient_dob = db.Column(db.String(10), nullable=False)
+    payer = db.Column(db.String(120), nullable=False)
+    service_type = db.Column(db.String(120), nullable=False)
+    status = db.Column(db.String(30), nullable=False)
+    flag = db.Column(db.Integer)
+    result = db.Column(db.Text)
+    job_id = db.Column(db.String(36))
+    checked_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def to_dict(self):
+        return {
+            "status": self.status,
+            "flag": self.flag,
+            "eligibility_result": json.loads(self.result) if self.result else None,
+            "job_id": self.job_id,
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None,
+        }
+
+
+class RpaPortal(db.Model):
+    """One row per portal; claims lock it so workers apply the portal's limits one at a time"""
+    __tablename__ = 'rpa_portals'
+
+    portal = db.Column(db.String(30), primary_key=True)
+
+
+def portal_limits(portal):
+    """(max concurrent jobs, max job starts per minute) for a portal"""
+    concurrency, per_minute = DEFAULT_PORTAL_LIMITS.get(portal, (1, 10))
+    prefix = f"RPA_{(portal or 'default').upper()}_"
+    return int(os.getenv(prefix + 'CONCURRENCY', concurrency)), int(os.getenv(prefix + 'PER_MINUTE', per_minute))
+
+
+def utcnow():
+    """Naive UTC timestamp, matching how the other tables store DateTime columns"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+_table_ready = False
+
+
+def ensure_job_table():
+    """Create the RPA job tables on first use and add columns introduced since"""
+    global _table_ready
+    if not _table_ready:
+        RpaJob.__table__.create(bind=db.engine, checkfirst=True)
+        RpaJobEvent.__table__.create(bind=db.engine, checkfirst=True)
+        RpaPortal.__table__.create(bind=db.engine, checkfirst=True)
+        RpaStepTiming.__table__.create(bind=db.engine, checkfirst=True)
+        EligibilityCacheEntry.__table__.create(bind=db.engine, checkfirst=True)
+        if _add_missing_columns(RpaJob):
+            # Jobs queued before portals existed
+            with db.engine.begin() as conn:
+                for bot_type, portal in BOT_PORTALS.items():
+                    conn.execute(text("UPDATE rpa_jobs SET portal = :portal WHERE portal IS NULL AND bot_type = :bot_type"),
+                                 {"portal": portal, "bot_type": bot_type})
+        _table_ready = True
+
+
+def _add_missing_columns(model):
+    """ALTER an existing table to add model columns it lacks; returns the names added"""
+    existing = {column["name"] for column in inspect(db.engine).get_columns(model.__tablename__)}
+    added = []
+    with db.engine.begin() as conn:
+        for column in model.__table__.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(text(f"ALTER TABLE {model.__tablename__} ADD COLUMN {column.name} {column_type}"))
+                added.append(column.name)
+    return added
+
+
+def facility_for_auth(auth_id):
+    """Facility of the patient behind an auth_id, used to share portal capacity between facilities"""
+    return db.session.query(PatientDetails.facility_id) \
+        .join(Prescrubbing, Prescrubbing.patient_id == PatientDetails.patient_id) \
+        .filter(Prescrubbing.auth_id == auth_id) \
+        .scalar()
+
+
+def record_event(job, event_type, message=None, commit=True):
+    db.session.add(RpaJobEvent(
+        job_id=job.job_id,
+        auth_id=job.auth_id,
+        event_type=event_type,
+        status=job.status,
+        message=message[:500] if message else None,
+        created_at=utcnow()
+    ))
+    if commit:
+        db.session.commit()
+
+
+# ===============================
+# QUEUE OPERATIONS
+# ===============================
+def enqueue_job(auth_id, bot_type, payload):
+    """Store a new queued job and return it; the caller only gets the job id back"""
+    if bot_type not in BOT_SCRIPTS:
+        raise ValueError(f"Unknown bot type: {bot_type}")
+
+    ensure_job_table()
+    facility_id = facility_for_auth(auth_id)
+    job = RpaJob(
+        job_id=str(uuid4()),
+        auth_id=str(auth_id),
+        bot_type=bot_type,
+        portal=BOT_PORTALS.get(bot_type),
+        facility_id=str(facility_id) if facility_id is not None else None,
+        status=JOB_QUEUED,
+        payload=json.dumps(payload, default=str),
+        attempts=0,
+        created_at=utcnow()
+    )
+    db.session.add(job)
+    record_event(job, "state", "Queued")
+    logger.info(f"Queued {bot_type} job {job.job_id} for auth_id {auth_id}")
+    return job
+
+
+def find_duplicate_job(auth_id, bot_type):
+    """Queued or running job for the same auth_id and bot, else one that succeeded within IDEMPOTENCY_WINDOW"""
+    in_flight = RpaJob.query.filter(
+        RpaJob.auth_id == str(auth_id),
+        RpaJob.bot_type == bot_type,
+        RpaJob.status.in_([JOB_QUEUED, JOB_RUNNING])
+    ).order_by(RpaJob.created_at.desc()).first()
+    if in_flight or IDEMPOTENCY_WINDOW <= 0:
+        return in_flight
+
+    return RpaJob.query.filter(
+        RpaJob.auth_id == str(auth_id),
+        RpaJob.bot_type == bot_type,
+        RpaJob.status == JOB_DONE,
+        RpaJob.finished_at >= utcnow() - timedelta(seconds=IDEMPOTENCY_WINDOW)
+    ).order_by(RpaJob.finished_at.desc()).first()
+
+
+def submit_job(auth_id, bot_type, payload):
+    """Queue a job unless the same request is already in flight or has just succeeded.
+
+    Returns (job, created). A duplicate (double click, second user on the same
+    row) gets the existing job, so it follows the same run and result.
+    """
+    if bot_type not in BOT_SCRIPTS:
+        raise ValueError(f"Unknown bot type: {bot_type}")
+
+    ensure_job_table()
+    db.session.commit()
+    # Serialize with other submissions for the portal so two concurrent
+    # requests cannot both miss each other and start two browsers
+    lock_portal(BOT_PORTALS[bot_type])
+
+    existing = find_duplicate_job(auth_id, bot_type)
+    if existing:
+        db.session.commit()
+        logger.info(f"Request for {bot_type} on auth_id {auth_id} attached to {existing.status} job {existing.job_id}")
+        return existing, False
+
+    # enqueue_job commits, which releases the portal lock
+    return enqueue_job(auth_id, bot_type, payload), True
+
+
+def get_job(job_id):
+    ensure_job_table()
+    return RpaJob.query.get(job_id)
+
+
+def claim_next_job(worker_id, skip_portals=()):
+    """Claim the next job whose portal has a free slot, oldest waiting portal first
+
+    Jobs for skip_portals are left to other workers.
+    """
+    # End the current transaction so the queue is read from a fresh snapshot
+    db.session.commit()
+    portals = db.session.query(RpaJob.portal, db.func.min(RpaJob.created_at)) \
+        .filter(RpaJob.status == JOB_QUEUED) \
+        .group_by(RpaJob.portal) \
+        .order_by(db.func.min(RpaJob.created_at)) \
+        .all()
+
+    for portal, _ in portals:
+        if portal in skip_portals:
+            continue
+        job = claim_portal_job(portal, worker_id)
+        if job:
+            return job
+    return None
+
+
+def lock_portal(portal):
+    """Lock the portal's row until the end of the transaction, creating it on first use"""
+    row = RpaPortal.query.filter_by(portal=portal).with_for_update().first()
+    if row is None:
+        try:
+            db.session.add(RpaPortal(portal=portal))
+            db.session.commit()
+        except IntegrityError:
+            # Another worker created it first
+            db.session.rollback()
+        row = RpaPortal.query.filter_by(portal=portal).with_for_update().first()
+    return row
+
+
+def claim_portal_job(portal, worker_id):
+    """Start a queued job for one portal if its concurrency and rate limits allow.
+
+    Claims for a portal are serialized on its rpa_portals row, so the limits
+    hold across all workers. Among the queued jobs, the facility with the
+    fewest running and recently started jobs goes first, so one facility's
+    backlog cannot starve the others.
+    """
+    db.session.commit()
+    lock_portal(portal)
+
+    concurrency, per_minute = portal_limits(portal)
+    now = utcnow()
+    running = RpaJob.query.filter_by(portal=portal, status=JOB_RUNNING).all()
+    started_last_minute = RpaJob.query.filter(
+        RpaJob.portal == portal,
+        RpaJob.started_at >= now - timedelta(seconds=60)
+    ).count()
+    if len(running) >= concurrency or started_last_minute >= per_minute:
+        db.session.rollback()
+        return None
+
+    queued = RpaJob.query.filter_by(portal=portal, status=JOB_QUEUED) \
+        .order_by(RpaJob.created_at) \
+        .limit(200) \
+        .all()
+    if not queued:
+        db.session.rollback()
+        return None
+
+    running_by_facility = Counter(job.facility_id for job in running)
+    recent_by_facility = Counter(
+        facility_id for (facility_id,) in db.session.query(RpaJob.facility_id).filter(
+            RpaJob.portal == portal,
+            RpaJob.started_at >= now - timedelta(seconds=FAIR_SHARE_WINDOW)
+        ).all()
+    )
+    candidate = min(queued, key=lambda job: (
+        running_by_facility[job.facility_id], recent_by_facility[job.facility_id], job.created_at
+    ))
+
+    # Conditional update so a job can never be claimed twice
+    claimed = RpaJob.query.filter_by(job_id=candidate.job_id, status=JOB_QUEUED).update({
+        "status": JOB_RUNNING,
+        "worker_id": worker_id,
+        "attempts": RpaJob.attempts + 1,
+        "started_at": now,
+        "heartbeat_at": now
+    }, synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        return None
+
+    job = RpaJob.query.get(candidate.job_id)
+    record_event(job, "state", f"Started by {worker_id} (attempt {job.attempts})")
+    return job
+
+
+def release_claim(job_id, reason):
+    """Put a claimed job that never started back in the queue, without using up an attempt"""
+    job = RpaJob.query.get(job_id)
+    if not job or job.status != JOB_RUNNING:
+        return None
+    job.status = JOB_QUEUED
+    job.worker_id = None
+    job.attempts = max(job.attempts - 1, 0)
+    job.started_at = None
+    job.heartbeat_at = None
+    record_event(job, "state", reason)
+    return job
+
+
+def record_progress(job_id, message):
+    """Store a step-level progress message reported by a running bot"""
+    job = RpaJob.query.get(job_id)
+    if job:
+        record_event(job, "progress", message)
+
+
+def heartbeat_job(job_id):
+    RpaJob.query.filter_by(job_id=job_id, status=JOB_RUNNING).update(
+        {"heartbeat_at": utcnow()}, synchronize_session=False
+    )
+    db.session.commit()
+
+
+def finish_job(job_id, success, result=None, error=None):
+    """Record the final state of a job and apply its result to prescrubbing"""
+    job = RpaJob.query.get(job_id)
+    if not job:
+        return None
+
+    job.status = JOB_DONE if success else JOB_FAILED
+    job.result = json.dumps(result, default=str) if result is not None else None
+    job.error = error
+    job.finished_at = utcnow()
+    record_event(job, "state", error or "Completed")
+
+    try:
+        record_run_history(job, result)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to record step timings of job {job_id}: {e}")
+
+    if success:
+        try:
+            apply_job_result(job, result or {})
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to apply result of job {job_id}: {e}")
+    return job
+
+
+def save_checkpoint(job_id, checkpoint):
+    RpaJob.query.filter_by(job_id=job_id).update(
+        {"checkpoint": json.dumps(checkpoint, default=str)}, synchronize_session=False
+    )
+    db.session.commit()
+
+
+def checkpoint_for_job(job):
+    """Checkpoint a job should resume from.
+
+    A re-queued job resumes from its own checkpoint. A new job resumes from
+    the latest checkpoint left by the failed jobs just before it for the same
+    auth_id and bot, when recent, so a retry after a late-stage failure skips
+    what already happened (and never repeats a Submit). A failed job that
+    saved no checkpoint does not hide an older one; a job that succeeded does.
+    """
+    if job.checkpoint:
+        return json.loads(job.checkpoint)
+
+    previous_jobs = RpaJob.query.filter(
+        RpaJob.auth_id == job.auth_id,
+        RpaJob.bot_type == job.bot_type,
+        RpaJob.job_id != job.job_id,
+        RpaJob.created_at <= job.created_at
+    ).order_by(RpaJob.created_at.desc())
+    cutoff = utcnow() - timedelta(seconds=CHECKPOINT_MAX_AGE)
+    for previous in previous_jobs:
+        if previous.status != JOB_FAILED or not previous.finished_at or previous.finished_at < cutoff:
+            return None
+        if previous.checkpoint:
+            return json.loads(previous.checkpoint)
+    return None
+
+
+def resolve_uncertain_submit(job_id, submitted, record=None):
+    """Record what a person found in Availity for records whose Submit outcome was unknown.
+
+    submitted=True marks them as in, so retries skip them; False lets the next
+    retry submit them again from the blank form. record limits this to one
+    record index. Returns the number of records resolved.
+    """
+    job = get_job(job_id)
+    checkpoint = checkpoint_for_job(job) if job else None
+    if not checkpoint:
+        return 0
+    resolved = 0
+    for key, state in checkpoint.get("records", {}).items():
+        if not state.get("submit_uncertain") or (record is not None and key != str(record)):
+            continue
+        state["submit_uncertain"] = False
+        state["submitted"] = bool(submitted)
+        if not submitted:
+            state["last_step"] = 0
+            state["url"] = None
+        resolved += 1
+    if resolved:
+        save_checkpoint(job.job_id, checkpoint)
+    return resolved
+
+
+def requeue_stale_jobs():
+    """Put jobs orphaned by a dead worker back in the queue, or fail them when out of attempts"""
+    cutoff = utcnow() - timedelta(seconds=JOB_STALE_AFTER)
+    stale_jobs = RpaJob.query.filter(
+        RpaJob.status == JOB_RUNNING,
+        RpaJob.heartbeat_at < cutoff
+    ).all()
+
+    for job in stale_jobs:
+        if job.attempts < JOB_MAX_ATTEMPTS:
+            logger.warning(f"Re-queueing stale job {job.job_id} (worker {job.worker_id})")
+            job.status = JOB_QUEUED
+            job.worker_id = None
+            record_event(job, "state", "Re-queued after worker stopped responding", commit=False)
+        else:
+            logger.warning(f"Failing stale job {job.job_id} after {job.attempts} attempts")
+            job.status = JOB_FAILED
+            job.error = "Worker stopped responding"
+            job.finished_at = utcnow()
+            record_event(job, "state", job.error, commit=False)
+    if stale_jobs:
+        db.session.commit()
+    return len(stale_jobs)
+
+
+def latest_jobs_for_auth_ids(auth_ids):
+    """Most recent job per auth_id, used to restore row state when the page loads"""
+    ensure_job_table()
+    jobs = RpaJob.query.filter(RpaJob.auth_id.in_([str(a) for a in auth_ids])) \
+        .order_by(RpaJob.created_at.desc()) \
+        .all()
+    latest = {}
+    for job in jobs:
+        latest.setdefault(job.auth_id, job)
+    return latest
+
+
+def events_since(last_event_id, job_ids=None, auth_ids=None, limit=200):
+    """Events newer than last_event_id for the given jobs and/or auth_ids"""
+    query = RpaJobEvent.query.filter(RpaJobEvent.event_id > last_event_id)
+    if job_ids and auth_ids:
+        query = query.filter(db.or_(
+            RpaJobEvent.job_id.in_(job_ids),
+            RpaJobEvent.auth_id.in_(auth_ids)
+        ))
+    elif job_ids:
+        query = query.filter(RpaJobEvent.job_id.in_(job_ids))
+    elif auth_ids:
+        query = query.filter(RpaJobEvent.auth_id.in_(auth_ids))
+    return query.order_by(RpaJobEvent.event_id).limit(limit).all()
+
+
+def last_event_id():
+    return db.session.query(db.func.max(RpaJobEvent.event_id)).scalar() or 0
+
+
+def queue_metrics():
+    """Queue depth, running jobs, limits and wait times per portal, plus queued jobs per facility"""
+    ensure_job_table()
+    now = utcnow()
+    metrics = {}
+
+    depth = dict(db.session.query(RpaJob.portal, db.func.count()).filter(RpaJob.status == JOB_QUEUED)
+                 .group_by(RpaJob.portal).all())
+    running = dict(db.session.query(RpaJob.portal, db.func.count()).filter(RpaJob.status == JOB_RUNNING)
+                   .group_by(RpaJob.portal).all())
+    oldest = dict(db.session.query(RpaJob.portal, db.func.min(RpaJob.created_at)).filter(RpaJob.status == JOB_QUEUED)
+                  .group_by(RpaJob.portal).all())
+    by_facility = db.session.query(RpaJob.portal, RpaJob.facility_id, db.func.count()) \
+        .filter(RpaJob.status == JOB_QUEUED) \
+        .group_by(RpaJob.portal, RpaJob.facility_id) \
+        .all()
+    recent = db.session.query(RpaJob.portal, RpaJob.created_at, RpaJob.started_at).filter(
+        RpaJob.started_at >= now - timedelta(hours=1)
+    ).limit(5000).all()
+
+    portals = set(depth) | set(running) | {portal for portal, _, _ in recent} | set(DEFAULT_PORTAL_LIMITS)
+    for portal in sorted(p for p in portals if p):
+        concurrency, per_minute = portal_limits(portal)
+        waits = [(started - created).total_seconds() for p, created, started in recent if p == portal]
+        metrics[portal] = {
+            "queued": depth.get(portal, 0),
+            "running": running.get(portal, 0),
+            "concurrency_limit": concurrency,
+            "starts_per_minute_limit": per_minute,
+            "oldest_queued_seconds": round((now - oldest[portal]).total_seconds(), 1) if oldest.get(portal) else 0,
+            "started_last_hour": len(waits),
+            "avg_wait_seconds": round(sum(waits) / len(waits), 1) if waits else None,
+            "max_wait_seconds": round(max(waits), 1) if waits else None,
+            "queued_by_facility": {str(f): n for p, f, n in by_facility if p == portal},
+        }
+    return metrics
+
+
+# ===============================
+# RUN HISTORY
+# ===============================
+STEP_NUMBER = re.compile(r"Step (\d+)")
+
+
+def record_run_history(job, document):
+    """Store the step durations of a finished run's result document.
+
+    "Step N: ..." progress steps are stored as step_N, so batches and member
+    IDs in the message do not split a step; function timings keep their name.
+    """
+    if not isinstance(document, dict):
+        return
+    now = utcnow()
+    rows = []
+    for step in document.get("steps") or []:
+        match = STEP_NUMBER.search(step.get("name") or "")
+        if match and step.get("seconds") is not None:
+            rows.append((f"step_{match.group(1)}", step["seconds"], True))
+    for timing in document.get("timings") or []:
+        rows.append((timing["name"], timing["seconds"], timing.get("ok", True)))
+    if document.get("seconds") is not None:
+        rows.append(("total", document["seconds"], document.get("status") == "success"))
+
+    for step, seconds, ok in rows:
+        db.session.add(RpaStepTiming(
+            job_id=job.job_id,
+            portal=job.portal,
+            bot_type=job.bot_type,
+            step=step[:100],
+            seconds=seconds,
+            ok=bool(ok),
+            created_at=now
+        ))
+    if rows:
+        db.session.commit()
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def step_metrics(days=7, portal=None, bot_type=None):
+    """p50/p95 duration per portal, bot and step over the last days.
+
+    p50_last_day next to the window's p50 makes a portal change that slowed a
+    step down stand out.
+    """
+    ensure_job_table()
+    now = utcnow()
+    query = db.session.query(
+        RpaStepTiming.portal, RpaStepTiming.bot_type, RpaStepTiming.step,
+        RpaStepTiming.seconds, RpaStepTiming.ok, RpaStepTiming.created_at
+    ).filter(RpaStepTiming.created_at >= now - timedelta(days=days))
+    if portal:
+        query = query.filter(RpaStepTiming.portal == portal)
+    if bot_type:
+        query = query.filter(RpaStepTiming.bot_type == bot_type)
+
+    grouped = defaultdict(list)
+    for row in query.limit(200000).all():
+        grouped[(row.portal, row.bot_type, row.step)].append(row)
+
+    last_day = now - timedelta(days=1)
+    metrics = []
+    for (row_portal, row_bot, step), rows in grouped.items():
+        durations = sorted(r.seconds for r in rows)
+        recent = sorted(r.seconds for r in rows if r.created_at >= last_day)
+        metrics.append({
+            "portal": row_portal,
+            "bot_type": row_bot,
+            "step": step,
+            "count": len(durations),
+            "failures": sum(1 for r in rows if not r.ok),
+            "p50": percentile(durations, 0.50),
+            "p95": percentile(durations, 0.95),
+            "max": durations[-1],
+            "p50_last_day": percentile(recent, 0.50),
+        })
+    return sorted(metrics, key=lambda m: (m["portal"] or "", m["bot_type"], m["step"]))
+
+
+# ===============================
+# ELIGIBILITY CACHE
+# ===============================
+def eligibility_ttl(status):
+    default = ELIGIBILITY_CACHE_TTLS.get(status)
+    value = os.getenv(f"RPA_ELIGIBILITY_TTL_{status}") if status else None
+    return int(value) if value else default
+
+
+def eligibility_key(data):
+    """(member_id, patient_dob, payer, service_type) of an eligibility request or result, normalized"""
+    dob = str(data.get("patient_dob") or "").strip()[:10]
+    return (
+        str(data.get("member_id") or "").strip().upper(),
+        dob,
+        str(data.get("payer") or "").strip().lower(),
+        str(data.get("service_type") or ELIGIBILITY_SERVICE_TYPE).strip().lower(),
+    )
+
+
+def cached_eligibility(data):
+    """Unexpired cache entry for the request, or None"""
+    ensure_job_table()
+    member_id, dob, payer, service_type = eligibility_key(data)
+    if not member_id or not dob:
+        return None
+    return EligibilityCacheEntry.query.filter(
+        EligibilityCacheEntry.member_id == member_id,
+        EligibilityCacheEntry.patient_dob == dob,
+        EligibilityCacheEntry.payer == payer,
+        EligibilityCacheEntry.service_type == service_type,
+        EligibilityCacheEntry.expires_at > utcnow(),
+    ).first()
+
+
+def store_eligibility(data, job_id=None):
+    """Cache the eligibility_result of one patient from the bot's result data"""
+    eligibility_result = data.get("eligibility_result") or {}
+    status = eligibility_result.get("status")
+    ttl = eligibility_ttl(status)
+    member_id, dob, payer, service_type = eligibility_key(data)
+    if not ttl or not member_id or not dob:
+        return None
+
+    now = utcnow()
+    entry = EligibilityCacheEntry.query.filter_by(
+        member_id=member_id, patient_dob=dob, payer=payer, service_type=service_type
+    ).first()
+    if entry is None:
+        entry = EligibilityCacheEntry(member_id=member_id, patient_dob=dob, payer=payer, service_type=service_type)
+        db.session.add(entry)
+    entry.status = status
+    entry.flag = eligibility_result.get("flag")
+    entry.result = json.dumps(eligibility_result, default=str)
+    entry.job_id = job_id
+    entry.checked_at = now
+    entry.expires_at = now + timedelta(seconds=ttl)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker cached the same key first; its answer is as fresh
+        db.session.rollback()
+    return entry
+
+
+def apply_eligibility_flag(auth_id, flag):
+    """Set insurance_validation_status from an eligibility flag (1 active, 0 inactive, -1 invalid)"""
+    patient_id = db.session.query(Prescrubbing.patient_id).filter_by(auth_id=auth_id).scalar()
+    if flag is None or not patient_id:
+        return False
+    ps_entry = db.session.query(Prescrubbing).filter_by(auth_id=auth_id, patient_id=patient_id).first()
+    if not ps_entry:
+        return False
+    if flag == 1:
+        ps_entry.insurance_validation_status = 'PASS'
+    elif flag in [-1, 0]:
+        ps_entry.insurance_validation_status = None
+    db.session.commit()
+    return True
+
+
+# ===============================
+# RESULT HANDLERS
+# ===============================
+def apply_job_result(job, result):
+    """Write a finished bot run (its result document) back to the prescrubbing table"""
+    if job.bot_type == BOT_AETNA_PRIOR_AUTH:
+        prescrub_record = Prescrubbing.query.filter_by(auth_id=job.auth_id).first()
+        if prescrub_record:
+            prescrub_record.auth_status = "In Progress"
+            db.session.commit()
+            logger.info(f"Auth status for {job.auth_id} set to In Progress after RPA job {job.job_id}")
+
+    elif job.bot_type == BOT_AVAILITY_ELIGIBILITY:
+        # Every patient answer feeds the cache, single inquiry or batch
+        data = result.get("data")
+        for patient in (data if isinstance(data, list) else [data]):
+            if patient and patient.get("success"):
+                store_eligibility(patient, job_id=job.job_id)
+
+        # Result document from rpa_result; flag is only set for a single inquiry
+        apply_eligibility_flag(job.auth_id, result.get("flag"))
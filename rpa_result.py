@@ -0,0 +1,220 @@
+"""
+Structured result document of a bot run
+
+Bots build the document with a ResultRecorder while they work and hand it back
+to the caller: returned from the in-process entry points, stored as the job
+result by the worker, or written to a JSON result file by the CLI scripts.
+Callers read fields instead of scraping stdout:
+
+    {
+        "bot": "availity_eligibility",
+        "status": "success" | "partial" | "failed" | "error",
+        "flag": 1,                      # eligibility flag, when there is one
+        "error_class": "LoginFailed",   # None on success
+        "error": "Availity login failed",
+        "started_at": "...", "finished_at": "...", "seconds": 41.2,
+        "steps": [{"name": "Step 2: Logging in to Availity", "seconds": 12.5}],
+        "timings": [{"name": "fill_payer", "seconds": 4.1, "ok": true}],
+        "waits": {"select2": {"count": 6, "seconds": 3.4, "timeouts": 0}},
+        "screenshots": ["screenshots/step_12_failed_20250717-101500.jpg"],
+        "data": {...}                   # bot-specific result, or a list for batches
+    }
+"""
+import functools
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+RESULT_SUCCESS = "success"
+RESULT_PARTIAL = "partial"    # batch where some records failed
+RESULT_FAILED = "failed"      # the bot ran but the portal step did not succeed
+RESULT_ERROR = "error"        # the bot could not run (driver, login, bad input)
+
+# Error classes for failures that are not Python exceptions
+ERROR_INVALID_INPUT = "InvalidInput"
+ERROR_DRIVER = "DriverStartFailed"
+ERROR_LOGIN = "LoginFailed"
+ERROR_STEP = "StepFailed"
+ERROR_TIMEOUT = "Timeout"
+
+# CLI scripts take the result file as their second argument or from this variable
+RESULT_FILE_ENV = 'RPA_RESULT_FILE'
+
+STEP_PATTERN = re.compile(r"Step \d+: .+")
+
+
+class BotError(Exception):
+    """A failure with a known error class, raised inside a bot and recorded in its result"""
+    def __init__(self, error_class, message):
+        super().__init__(message)
+        self.error_class = error_class
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class ResultRecorder:
+    """Collects step timings and screenshots of one bot run and builds its result document"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.started = time.time()
+        self.steps = []
+        self.timings = []
+        self.screenshots = []
+        self.waits = {}
+        self._step_started = None
+
+    def step(self, name):
+        """Close the running step and start timing the next one"""
+        self._close_step()
+        self.steps.append({"name": name, "seconds": None})
+        self._step_started = time.time()
+
+    def timing(self, name, seconds, ok=True):
+        """Duration of a named unit of work (a bot function) inside the run"""
+        self.timings.append({"name": name, "seconds": round(seconds, 2), "ok": ok})
+
+    def wait(self, name, seconds, ok=True):
+        """Add a condition wait to the per-name totals"""
+        totals = self.waits.setdefault(name, {"count": 0, "seconds": 0.0, "timeouts": 0})
+        totals["count"] += 1
+        totals["seconds"] = round(totals["seconds"] + seconds, 2)
+        if not ok:
+            totals["timeouts"] += 1
+
+    def screenshot(self, path):
+        if path:
+            self.screenshots.append(path)
+
+    def _close_step(self):
+        if self.steps and self._step_started is not None:
+            self.steps[-1]["seconds"] = round(time.time() - self._step_started, 2)
+        self._step_started = None
+
+    def finish(self, status, data=None, flag=None, error_class=None, error=None):
+        self._close_step()
+        finished = time.time()
+        return {
+            "bot": self.bot,
+            "status": status,
+            "flag": flag,
+            "error_class": error_class,
+            "error": error,
+            "started_at": _isoformat(self.started),
+            "finished_at": _isoformat(finished),
+            "seconds": round(finished - self.started, 2),
+            "steps": self.steps,
+            "timings": self.timings,
+            "waits": self.waits,
+            "screenshots": self.screenshots,
+            "data": data,
+        }
+
+    def fail(self, exc, data=None):
+        """Result document for a run that ended in an exception"""
+        error_class = getattr(exc, "error_class", None) or type(exc).__name__
+        return self.finish(RESULT_ERROR, data=data, error_class=error_class, error=str(exc))
+
+
+# ===============================
+# ACTIVE RECORDER
+# ===============================
+# Helpers deep inside a bot (take_screenshot, progress reporting) record into
+# whichever recorder the entry point activated on this thread
+_active = threading.local()
+
+
+@contextmanager
+def recording(recorder):
+    previous = getattr(_active, "recorder", None)
+    _active.recorder = recorder
+    try:
+        yield recorder
+    finally:
+        _active.recorder = previous
+
+
+def current_recorder():
+    return getattr(_active, "recorder", None)
+
+
+def note_step(message):
+    """Start timing a step when message is a "Step N: ..." progress line"""
+    recorder = current_recorder()
+    match = STEP_PATTERN.search(message or "")
+    if recorder and match:
+        recorder.step(match.group(0).strip())
+
+
+def note_screenshot(path):
+    recorder = current_recorder()
+    if recorder:
+        recorder.screenshot(path)
+
+
+@contextmanager
+def timed_step(name):
+    """Time a block into the active recorder; ok is False when the block raised"""
+    recorder = current_recorder()
+    started = time.time()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        if recorder:
+            recorder.timing(name, time.time() - started, ok)
+
+
+def timed(name=None):
+    """Decorator form of timed_step; a function returning False counts as not ok"""
+    def decorator(func):
+        step_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = current_recorder()
+            started = time.time()
+            result = False
+            try:
+                result = func(*args, **kwargs)
+                return result
+            finally:
+                if recorder:
+                    recorder.timing(step_name, time.time() - started, result is not False)
+        return wrapper
+    return decorator
+
+
+# ===============================
+# RESULT FILES
+# ===============================
+def result_file_from_args(argv):
+    """Result file path given to a CLI script, if any"""
+    if len(argv) > 2 and argv[2]:
+        return argv[2]
+    return os.getenv(RESULT_FILE_ENV) or None
+
+
+def write_result_file(document, path):
+    """Write the document atomically so a reader never sees a partial file"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(document, f, default=str)
+    os.replace(tmp_path, path)
+
+
+def read_result_file(path):
+    """Result document written by a bot, or None when the bot never wrote one"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
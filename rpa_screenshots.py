@@ -0,0 +1,175 @@
+"""
+Screenshot capture for the portal bots
+
+The bots ask for a screenshot before and after almost every action. Saving
+each one as a full PNG blocks the driver while Chrome encodes it, so capture
+here is tiered by RPA_SCREENSHOTS:
+
+    off         never capture
+    on-failure  (default) capture only the key steps of the run (dashboard,
+                form loaded, submission result, ...), keep the last
+                RPA_SCREENSHOT_FRAMES of them in memory and write them, plus
+                the failure shot, only when a step fails
+    key-steps   write the key steps of the run as they are taken
+    all         write every screenshot
+
+Below all, the other screenshots the bots ask for are not taken at all, so
+a run that succeeds spends no time grabbing frames nobody will look at.
+
+Frames are grabbed as JPEG through the DevTools protocol (PNG through
+WebDriver when that is not available) and written to disk by a background
+thread, so the bot goes on with its next action while the file is saved.
+"""
+import atexit
+import base64
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from rpa_result import current_recorder, note_screenshot
+
+logger = logging.getLogger("rpa_screenshots")
+
+POLICY_OFF = "off"
+POLICY_ON_FAILURE = "on-failure"
+POLICY_KEY_STEPS = "key-steps"
+POLICY_ALL = "all"
+
+KIND_FRAME = "frame"
+KIND_KEY = "key"
+KIND_FAILURE = "failure"
+
+SCREENSHOT_DIR = os.getenv('RPA_SCREENSHOT_DIR', 'screenshots')
+SCREENSHOT_POLICY = os.getenv('RPA_SCREENSHOTS', POLICY_ON_FAILURE)
+SCREENSHOT_FRAMES = int(os.getenv('RPA_SCREENSHOT_FRAMES', '10'))
+SCREENSHOT_QUALITY = int(os.getenv('RPA_SCREENSHOT_QUALITY', '60'))
+
+# Screenshot names that mark a failure or a key step of a run
+FAILURE_MARKERS = ("error", "failed", "not_found")
+KEY_SHOTS = {
+    "dashboard",
+    "auth_referrals_page",
+    "diagnosis_procedure_form_loaded",
+    "after_first_next_button_click",
+    "after_second_next_button_click",
+    "after_next_steps_button_click",
+    "after_submit_button_click",
+    "submission_result_message",
+    "after_new_request_button_click",
+}
+
+_writes = queue.Queue()
+# Filenames carry milliseconds and a sequence number, so two captures of one
+# step close together never overwrite each other
+_sequence = itertools.count(1)
+_writer = None
+_writer_lock = threading.Lock()
+
+# Ring buffer of the run recording on this thread
+_local = threading.local()
+
+
+def screenshot_kind(name):
+    if any(marker in name for marker in FAILURE_MARKERS):
+        return KIND_FAILURE
+    if name in KEY_SHOTS:
+        return KIND_KEY
+    return KIND_FRAME
+
+
+def _grab(driver):
+    """(bytes, extension) of the current viewport, JPEG when Chrome's DevTools are reachable"""
+    try:
+        shot = driver.execute_cdp_cmd("Page.captureScreenshot", {"format": "jpeg", "quality": SCREENSHOT_QUALITY})
+        return shot["data"], "jpg"
+    except Exception:
+        return driver.get_screenshot_as_base64(), "png"
+
+
+def _frames():
+    """Frames of the current run; a new recorder starts a new buffer"""
+    recorder = current_recorder()
+    if getattr(_local, "owner", None) is not recorder or not hasattr(_local, "frames"):
+        _local.owner = recorder
+        _local.frames = deque(maxlen=SCREENSHOT_FRAMES)
+    return _local.frames
+
+
+def _write_loop():
+    while True:
+        path, data = _writes.get()
+        try:
+            with open(path, "wb") as f:
+                f.write(base64.b64decode(data))
+        except Exception as e:
+            logger.error(f"Failed to write screenshot {path}: {str(e)}")
+        finally:
+            _writes.task_done()
+
+
+def _save(name, data, extension, taken):
+    """Queue a capture for the writer thread and attach its path to the run"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            os.makedirs(SCREENSHOT_DIR, exist_ok=True)
+            _writer = threading.Thread(target=_write_loop, name="screenshot-writer", daemon=True)
+            _writer.start()
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(taken))
+    millis = int(taken * 1000) % 1000
+    path = os.path.join(SCREENSHOT_DIR, f"{name}_{stamp}-{millis:03d}-{next(_sequence)}.{extension}")
+    _writes.put((path, data))
+    note_screenshot(path)
+    return path
+
+
+def flush_frames():
+    """Write the buffered frames of the current run; returns their paths"""
+    frames = _frames()
+    paths = [_save(name, data, extension, taken) for name, data, extension, taken in frames]
+    frames.clear()
+    return paths
+
+
+def capture_screenshot(driver, name, kind=None):
+    """
+    Capture a screenshot according to the policy
+
+    Returns the path the capture is written to, or None when it was only
+    buffered (or not taken at all).
+    """
+    if SCREENSHOT_POLICY == POLICY_OFF or not driver:
+        return None
+    kind = kind or screenshot_kind(name)
+    if kind == KIND_FRAME and SCREENSHOT_POLICY != POLICY_ALL:
+        return None
+    try:
+        data, extension = _grab(driver)
+    except Exception as e:
+        logger.error(f"Failed to take screenshot: {str(e)}")
+        return None
+    taken = time.time()
+
+    if SCREENSHOT_POLICY == POLICY_ALL:
+        return _save(name, data, extension, taken)
+    if kind == KIND_FAILURE:
+        flush_frames()
+        return _save(name, data, extension, taken)
+    if SCREENSHOT_POLICY == POLICY_KEY_STEPS:
+        return _save(name, data, extension, taken)
+    _frames().append((name, data, extension, taken))
+    return None
+
+
+def wait_for_writes(timeout=10):
+    """Block until queued screenshots are on disk, at most timeout seconds"""
+    deadline = time.time() + timeout
+    while _writes.unfinished_tasks and time.time() < deadline:
+        time.sleep(0.05)
+
+
+atexit.register(wait_for_writes)
@@ -0,0 +1,184 @@
+"""
+Select2 dropdown driver
+
+One routine for every Select2 field on the Availity forms (payer, request
+type, provider, diagnosis and procedure codes, place of service):
+
+    1. open the widget (through jQuery when the page has it, otherwise with
+       the mouse events Select2 listens to)
+    2. enter the query in its search box, if it has one
+    3. wait until the result list is for this query: no "Searching..." row and
+       either an option matching the query or a list that stopped changing
+    4. pick the best match and read back the chosen value in one JS call
+
+Works with Select2 3.x (.select2-chosen / .select2-drop-active) and 4.x
+(.select2-selection__rendered / .select2-container--open).
+"""
+import logging
+import time
+
+from selenium.webdriver.common.by import By
+
+from rpa_forms import fill_field
+from rpa_waits import wait_until, wait_for_select2_open, QUIET_PERIOD
+
+logger = logging.getLogger("rpa_select2")
+
+SEARCH_INPUT_CSS = (".select2-drop-active input.select2-input, "
+                    ".select2-container--open input.select2-search__field")
+
+# Container of the Select2 field for a label: the label's form group, the
+# select2-chosen span whose surrounding text mentions the label, or an id
+# built from the label ("Diagnosis Code" -> diagnosisCode)
+FIND_JS = """
+var label = arguments[0], idPattern = arguments[1];
+var labels = document.querySelectorAll('label');
+for (var i = 0; i < labels.length; i++) {
+    if (labels[i].textContent.indexOf(label) === -1) { continue; }
+    var group = labels[i].closest('.form-group') || labels[i].closest('div');
+    var container = group && group.querySelector('.select2-container');
+    if (container) { return container; }
+}
+var spans = document.querySelectorAll('span.select2-chosen, span.select2-selection__rendered');
+for (var j = 0; j < spans.length; j++) {
+    var around = spans[j].parentElement.parentElement.textContent || '';
+    if (around.indexOf(label) !== -1) { return spans[j].closest('.select2-container') || spans[j]; }
+}
+return document.querySelector("div.select2-container[id*='" + idPattern + "']");
+"""
+
+OPEN_JS = """
+var container = arguments[0].closest('.select2-container') || arguments[0];
+var id = (container.id || '').replace(/^s2id_/, '');
+var select = id && document.getElementById(id);
+if (window.jQuery && select && jQuery(select).data('select2')) {
+    jQuery(select).select2('open');
+    return true;
+}
+var handle = container.querySelector('.select2-choice, .select2-selection') || container;
+['mousedown', 'mouseup', 'click'].forEach(function(type) {
+    handle.dispatchEvent(new MouseEvent(type, {bubbles: true, cancelable: true, view: window}));
+});
+return true;
+"""
+
+# Texts of the visible options of the open dropdown, or null while it is
+# still searching
+RESULTS_JS = """
+var pending = document.querySelector(
+    '.select2-drop-active .select2-searching, .select2-container--open .loading-results');
+if (pending) { return null; }
+var options = document.querySelectorAll(
+    '.select2-drop-active .select2-result-selectable, .select2-container--open .select2-results__option[aria-selected]');
+var texts = [];
+for (var i = 0; i < options.length; i++) {
+    if (options[i].offsetParent !== null) { texts.push(options[i].textContent.trim()); }
+}
+return texts;
+"""
+
+# Pick the best option for the queries (in order of preference) and return
+# what the widget shows afterwards
+PICK_JS = """
+var container = arguments[0].closest('.select2-container') || arguments[0];
+var queries = arguments[1];
+var options = Array.prototype.filter.call(document.querySelectorAll(
+    '.select2-drop-active .select2-result-selectable, .select2-container--open .select2-results__option[aria-selected]'),
+    function(o) { return o.offsetParent !== null; });
+if (!options.length) { return null; }
+
+function score(text, query) {
+    text = text.toLowerCase(); query = query.toLowerCase();
+    if (!query) { return 0; }
+    if (text === query) { return 4; }
+    if (text.indexOf(query) === 0) { return 3; }
+    if (text.indexOf(query) !== -1) { return 2; }
+    if (query.indexOf(text) !== -1) { return 1; }
+    return 0;
+}
+var best = null;
+for (var q = 0; q < queries.length && !best; q++) {
+    var bestScore = 0;
+    for (var i = 0; i < options.length; i++) {
+        var s = score(options[i].textContent.trim(), queries[q]);
+        if (s > bestScore) { bestScore = s; best = options[i]; }
+    }
+}
+best = best || options[0];
+var label = best.querySelector('.select2-result-label') || best;
+['mouseover', 'mousemove', 'mousedown', 'mouseup'].forEach(function(type) {
+    label.dispatchEvent(new MouseEvent(type, {bubbles: true, cancelable: true, view: window}));
+});
+if (document.querySelector('.select2-drop-active, .select2-container--open .select2-dropdown')) {
+    label.click();
+}
+var chosen = container.querySelector('.select2-chosen, .select2-selection__rendered');
+return {picked: best.textContent.trim(), chosen: chosen ? chosen.textContent.trim() : ''};
+"""
+
+
+def find_select2(driver, field_label):
+    """Select2 container of the field with this label, or None"""
+    id_pattern = field_label.lower().replace(" ", "").replace("code", "Code")
+    return driver.execute_script(FIND_JS, field_label, id_pattern)
+
+
+def results_for(queries):
+    """Condition: option texts once the dropdown shows results for the query"""
+    state = {"texts": None, "since": time.time()}
+    wanted = [q.lower() for q in queries if q]
+
+    def condition(driver):
+        texts = driver.execute_script(RESULTS_JS)
+        if not texts:
+            return False
+        if any(w in text.lower() for text in texts for w in wanted):
+            return texts
+        now = time.time()
+        if texts != state["texts"]:
+            state["texts"] = texts
+            state["since"] = now
+            return False
+        return texts if now - state["since"] >= QUIET_PERIOD else False
+    return condition
+
+
+def select2_choose(driver, element, query, search=True, description=None):
+    """
+    Open the Select2 field holding element, search for query and pick the best match
+
+    query may be a list of preferred values, tried in order; when nothing
+    matches the first option is taken, as the form fillers always did.
+    search=False picks from the options the dropdown lists without typing.
+    Returns the text the widget shows afterwards, or None when nothing was picked.
+    """
+    queries = [query] if isinstance(query, str) else list(query)
+    description = description or queries[0]
+    started = time.time()
+
+    driver.execute_script(OPEN_JS, element)
+    if not wait_for_select2_open(driver):
+        logger.error(f" Select2 dropdown for {description} did not open")
+        return None
+
+    if search and queries[0]:
+        inputs = [i for i in driver.find_elements(By.CSS_SELECTOR, SEARCH_INPUT_CSS) if i.is_displayed()]
+        if inputs:
+            fill_field(driver, inputs[0], queries[0], "select2_search", verify=False)
+        else:
+            logger.info(f" No search box in the {description} dropdown, picking from the list")
+
+    if not wait_until(driver, results_for(queries), "select2", required=False):
+        logger.error(f" No results in the {description} dropdown")
+        return None
+
+    result = driver.execute_script(PICK_JS, element, queries)
+    if not result:
+        logger.error(f" Could not pick an option for {description}")
+        return None
+    logger.info(f" Selected '{result['picked']}' for {description} in {time.time() - started:.2f}s")
+    if result['picked'] and result['chosen'] and result['picked'].lower() not in result['chosen'].lower() \
+            and result['chosen'].lower() not in result['picked'].lower():
+        logger.warning(f" {description} shows '{result['chosen']}' after picking '{result['picked']}'")
+        return None
+    return result['chosen'] or result['picked']
@@ -0,0 +1,226 @@
+"""
+Condition-based waits for the portal bots
+
+Each wait polls a concrete condition (document ready, element present or
+clickable, Select2 results rendered, network idle, URL changed) and returns
+as soon as it holds, instead of sleeping a fixed time that is too long on a
+fast page and too short on a slow one. Every wait has a named timeout budget
+and records the time it actually spent into the active result document under
+"waits", so slow portal steps show up next to the step timings.
+
+Budgets are seconds and can be overridden per name with RPA_WAIT_BUDGET_<NAME>
+(e.g. RPA_WAIT_BUDGET_FORM_FRAME=40), or all at once with RPA_WAIT_SCALE.
+"""
+import logging
+import os
+import time
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from rpa_result import current_recorder
+
+logger = logging.getLogger("rpa_waits")
+
+WAIT_BUDGETS = {
+    "page_load": 30,     # document.readyState complete
+    "network_idle": 10,  # no XHR/fetch in flight and no new resources
+    "form_frame": 20,    # form iframe attached and loaded
+    "element": 15,       # element present / clickable
+    "select2": 10,       # Select2 dropdown open and results rendered
+    "dropdown": 5,       # autocomplete options of a typed-in field
+    "settle": 3,         # short quiet period after a click or selection
+    "next_page": 20,     # wizard page change after Next / Submit
+    "url_change": 30,    # navigation after a click
+    "mfa": 300,          # user entering an MFA code
+}
+
+WAIT_SCALE = float(os.getenv('RPA_WAIT_SCALE', '1'))
+POLL_INTERVAL = float(os.getenv('RPA_WAIT_POLL', '0.1'))
+
+# Network is idle when nothing is in flight and no resource finished for this long
+QUIET_PERIOD = float(os.getenv('RPA_WAIT_QUIET', '0.5'))
+
+SELECT2_OPEN_CSS = ".select2-drop-active, .select2-container--open .select2-dropdown"
+SELECT2_RESULT_CSS = (".select2-drop-active .select2-result-selectable, "
+                      ".select2-container--open .select2-results__option")
+SELECT2_PENDING_CSS = (".select2-drop-active .select2-searching, "
+                       ".select2-container--open .select2-results__option.loading-results")
+
+# Counts XHR/fetch calls in flight in the current document; installed on the
+# first network wait after every navigation
+NETWORK_TRACKER_JS = """
+if (!window.__rpaPending) {
+    window.__rpaPending = {count: 0};
+    var pending = window.__rpaPending;
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() {
+        pending.count++;
+        this.addEventListener('loadend', function() { pending.count--; });
+        return send.apply(this, arguments);
+    };
+    if (window.fetch) {
+        var fetch = window.fetch;
+        window.fetch = function() {
+            pending.count++;
+            return fetch.apply(this, arguments).finally(function() { pending.count--; });
+        };
+    }
+}
+var resources = window.performance && performance.getEntriesByType
+    ? performance.getEntriesByType('resource').length : 0;
+return [document.readyState, Math.max(window.__rpaPending.count, 0), resources];
+"""
+
+
+def budget(name):
+    """Timeout in seconds for a named wait"""
+    value = os.getenv(f"RPA_WAIT_BUDGET_{name.upper()}")
+    seconds = float(value) if value else WAIT_BUDGETS.get(name, WAIT_BUDGETS["element"])
+    return seconds * WAIT_SCALE
+
+
+def wait_until(driver, condition, name, timeout=None, required=True):
+    """
+    Poll condition(driver) until it returns something truthy and return that
+
+    When the budget runs out a TimeoutException is raised, or None is returned
+    when required is False. The time spent is logged and recorded either way.
+    """
+    timeout = budget(name) if timeout is None else timeout
+    started = time.time()
+    ok = False
+    try:
+        result = WebDriverWait(driver, timeout, poll_frequency=POLL_INTERVAL).until(condition)
+        ok = True
+        return result
+    except TimeoutException:
+        if required:
+            raise
+        return None
+    finally:
+        spent = time.time() - started
+        if ok:
+            logger.debug(f"wait {name}: {spent:.2f}s")
+        else:
+            logger.info(f"wait {name}: gave up after {spent:.2f}s")
+        recorder = current_recorder()
+        if recorder:
+            recorder.wait(name, spent, ok)
+
+
+# ===============================
+# CONDITIONS
+# ===============================
+def document_ready(driver):
+    return driver.execute_script("return document.readyState") == "complete"
+
+
+def network_idle(quiet=QUIET_PERIOD):
+    """Condition: page loaded, no XHR/fetch pending and no new resources for quiet seconds"""
+    state = {"resources": None, "since": time.time()}
+
+    def condition(driver):
+        try:
+            ready, pending, resources = driver.execute_script(NETWORK_TRACKER_JS)
+        except WebDriverException:
+            return False
+        now = time.time()
+        if ready != "complete" or pending or resources != state["resources"]:
+            state["resources"] = resources
+            state["since"] = now
+            return False
+        return now - state["since"] >= quiet
+    return condition
+
+
+def frames_loaded(count):
+    """Condition: at least count iframes attached and every one finished loading"""
+    def condition(driver):
+        return driver.execute_script("""
+            var frames = document.getElementsByTagName('iframe');
+            if (frames.length < arguments[0]) { return false; }
+            for (var i = 0; i < frames.length; i++) {
+                try {
+                    var doc = frames[i].contentDocument;
+                    if (doc && doc.readyState !== 'complete') { return false; }
+                } catch (e) {}
+            }
+            return true;
+        """, count)
+    return condition
+
+
+def url_changed(previous_url):
+    def condition(driver):
+        return driver.current_url != previous_url
+    return condition
+
+
+def select2_results_ready(driver):
+    """Condition: an open Select2 dropdown that has finished searching and shows results"""
+    if driver.find_elements(By.CSS_SELECTOR, SELECT2_PENDING_CSS):
+        return False
+    results = [r for r in driver.find_elements(By.CSS_SELECTOR, SELECT2_RESULT_CSS) if r.is_displayed()]
+    return results or False
+
+
+def select2_closed(driver):
+    return not any(d.is_displayed() for d in driver.find_elements(By.CSS_SELECTOR, SELECT2_OPEN_CSS))
+
+
+# ===============================
+# WAITS
+# ===============================
+def wait_for_ready(driver, name="page_load"):
+    """Document loaded and the network quiet; replaces a fixed buffer after readyState"""
+    wait_until(driver, document_ready, name)
+    wait_until(driver, network_idle(), "network_idle", required=False)
+
+
+def wait_for_network_idle(driver, name="network_idle", quiet=QUIET_PERIOD):
+    """Best effort: returns False instead of raising when the page never goes quiet"""
+    return wait_until(driver, network_idle(quiet), name, required=False) is not None
+
+
+def settle(driver, name="settle"):
+    """Short quiet period after a click or selection, bounded by the settle budget"""
+    return wait_for_network_idle(driver, name, quiet=min(QUIET_PERIOD, 0.3))
+
+
+def wait_for_frames(driver, count, name="form_frame"):
+    """At least count iframes in the current document, all loaded"""
+    return wait_until(driver, frames_loaded(count), name, required=False) is not None
+
+
+def wait_for_element(driver, locator, name="element", timeout=None, required=True):
+    return wait_until(driver, EC.presence_of_element_located(locator), name, timeout, required)
+
+
+def wait_for_clickable(driver, locator, name="element", timeout=None, required=True):
+    return wait_until(driver, EC.element_to_be_clickable(locator), name, timeout, required)
+
+
+def wait_for_visible(driver, element, name="element", timeout=None):
+    return wait_until(driver, EC.visibility_of(element), name, timeout, required=False)
+
+
+def wait_for_select2_open(driver, name="select2"):
+    return wait_until(driver, EC.presence_of_element_located((By.CSS_SELECTOR, SELECT2_OPEN_CSS)),
+                      name, required=False) is not None
+
+
+def wait_for_select2_results(driver, name="select2"):
+    """Visible result options of the open Select2 dropdown, or [] when none rendered in time"""
+    return wait_until(driver, select2_results_ready, name, required=False) or []
+
+
+def wait_for_select2_closed(driver, name="select2"):
+    return wait_until(driver, select2_closed, name, required=False) is not None
+
+
+def wait_for_url_change(driver, previous_url, name="url_change", timeout=None):
+    """True once the browser left previous_url"""
+    return wait_until(driver, url_changed(previous_url), name, timeout, required=False) is not None
@@ -0,0 +1,313 @@
+"""
+RPA worker pool
+
+Runs the browser bots for jobs queued by app.py. Start it next to the Flask app:
+
+    python rpa_worker.py --workers 3
+
+Each worker process imports the bots once, claims one queued job at a time
+from the rpa_jobs table, calls the bot in-process and records the outcome.
+Claims respect per-portal concurrency and rate limits shared by all workers
+(RPA_<PORTAL>_CONCURRENCY, RPA_<PORTAL>_PER_MINUTE, see rpa_jobs).
+Availity bots run on a warm, already logged-in browser from the worker's pool
+(AVAILITY_POOL_SIZE, 0 to disable). The pools of all workers together hold at
+most RPA_AVAILITY_CONCURRENCY logins, and with the pool enabled Availity jobs
+only ever run on a pooled session: a worker without a free one leaves them to
+the other workers, and a job whose checkout times out goes back to the queue.
+So the workers never have more Availity sessions open than the portal limit
+(with the pool disabled each running job opens its own, bounded by the same
+limit). Bots run outside the workers, e.g. by bench_bots, are not counted.
+Jobs left running by a crashed worker are picked up again once their
+heartbeat goes stale.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+from flask import Flask
+
+load_dotenv()
+
+from OncoAuth.models import db
+from rpa_jobs import (
+    BOT_AETNA_PRIOR_AUTH, BOT_AVAILITY_ELIGIBILITY, JOB_TIMEOUT, RPA_SCRIPT_DIR, PORTAL_AVAILITY,
+    portal_limits, checkpoint_for_job, claim_next_job, ensure_job_table, finish_job, heartbeat_job, record_progress,
+    release_claim, requeue_stale_jobs, save_checkpoint
+)
+
+# The bots and browser helpers live in RPA_SCRIPT_DIR; importing them once per
+# worker saves a fresh interpreter, selenium import and driver lookup per job
+sys.path.insert(0, os.path.abspath(RPA_SCRIPT_DIR))
+from availity_pool import AvailityBrowserPool, AVAILITY_POOL_SIZE
+from availity_session import release_driver
+from driver_factory import resolve_chromedriver
+import locator_registry
+from rpa_result import RESULT_SUCCESS, RESULT_ERROR, ERROR_TIMEOUT
+import aetnapriorauth
+import eligibilityrpafinal
+
+logger = logging.getLogger("rpa_worker")
+
+# ===============================
+# CONFIGURATION
+# ===============================
+WORKER_COUNT = int(os.getenv('RPA_WORKERS', '2'))
+POLL_INTERVAL = float(os.getenv('RPA_POLL_INTERVAL', '2'))
+HEARTBEAT_INTERVAL = int(os.getenv('RPA_HEARTBEAT_INTERVAL', '15'))
+
+# The job is already claimed and counts against the portal limit while it
+# waits, so a busy or unhealthy pool soon hands it back to the queue
+AVAILITY_CHECKOUT_TIMEOUT = int(os.getenv('AVAILITY_CHECKOUT_TIMEOUT', '20'))
+# How long a worker leaves Availity jobs alone after handing one back
+AVAILITY_CLAIM_BACKOFF = int(os.getenv('AVAILITY_CLAIM_BACKOFF', '30'))
+
+# Bots that log in to Availity and can run on a pooled browser session
+AVAILITY_BOTS = {BOT_AETNA_PRIOR_AUTH, BOT_AVAILITY_ELIGIBILITY}
+
+# Callable entry point for each bot type: fn(record, driver=None, progress=None) -> result
+BOT_FUNCTIONS = {
+    BOT_AETNA_PRIOR_AUTH: aetnapriorauth.submit_prior_auth,
+    BOT_AVAILITY_ELIGIBILITY: eligibilityrpafinal.check_eligibility,
+}
+
+# Bots that save checkpoints and can resume a failed or interrupted run
+CHECKPOINTED_BOTS = {BOT_AETNA_PRIOR_AUTH}
+
+
+def create_worker_app():
+    """Minimal Flask app so workers can use the same SQLAlchemy models as app.py"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI')
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {"pool_pre_ping": True}
+    db.init_app(app)
+    return app
+
+
+def start_driver(bot_type):
+    """Fresh browser for a job that has no pooled session"""
+    if bot_type == BOT_AVAILITY_ELIGIBILITY:
+        return eligibilityrpafinal.EligibilityBot().setup_driver()
+    return aetnapriorauth.setup_chrome_driver()
+
+
+def monitor_job(app, job_id, driver, progress, done):
+    """Send heartbeats and progress for a running job; quit its browser when it overruns.
+
+    Runs in its own thread with its own app context, and so its own
+    database session, while the bot works on the worker's main thread.
+    """
+    started = time.time()
+    last_heartbeat = started
+    timed_out = False
+    with app.app_context():
+        while not done.is_set() or not progress.empty():
+            try:
+                record_progress(job_id, progress.get(timeout=1))
+            except queue.Empty:
+                pass
+            now = time.time()
+            if not timed_out and not done.is_set() and now - started > JOB_TIMEOUT:
+                # Closing the browser makes the bot's next WebDriver call fail fast
+                logger.warning(f"Job {job_id} exceeded {JOB_TIMEOUT} seconds, closing its browser")
+                record_progress(job_id, f"Timed out after {JOB_TIMEOUT} seconds")
+                try:
+                    driver.quit()
+                except Exception:
+                    pass
+                timed_out = True
+            # Heartbeats go on until the bot returns, even past the timeout (a bot
+            # waiting outside WebDriver, e.g. for an MFA code, only notices later);
+            # a stale heartbeat would hand the job to a second worker meanwhile
+            if now - last_heartbeat >= HEARTBEAT_INTERVAL:
+                heartbeat_job(job_id)
+                last_heartbeat = now
+        db.session.remove()
+
+
+def run_bot(app, job, driver):
+    """Call the bot for a job on the given driver.
+
+    Returns (success, result_document, error).
+    """
+    progress = queue.Queue()
+    done = threading.Event()
+    monitor = threading.Thread(target=monitor_job, args=(app, job.job_id, driver, progress, done), daemon=True)
+    monitor.start()
+
+    kwargs = {}
+    if job.bot_type in CHECKPOINTED_BOTS:
+        checkpoint = checkpoint_for_job(job)
+        if checkpoint:
+            record_progress(job.job_id, "Resuming from the checkpoint of an earlier attempt")
+        kwargs = {
+            "checkpoint": checkpoint,
+            "on_checkpoint": lambda state: save_checkpoint(job.job_id, state),
+        }
+
+    started = time.time()
+    try:
+        document = BOT_FUNCTIONS[job.bot_type](json.loads(job.payload), driver=driver, progress=progress.put, **kwargs)
+    finally:
+        done.set()
+        monitor.join(timeout=30)
+        # Worker processes exit without atexit handlers, so keep what the run learned now
+        locator_registry.save()
+
+    if time.time() - started > JOB_TIMEOUT:
+        document.update(status=RESULT_ERROR, error_class=ERROR_TIMEOUT,
+                        error=f"RPA timed out after {JOB_TIMEOUT} seconds")
+    # Batches succeed only when every record did ("partial" counts as failed)
+    if document["status"] != RESULT_SUCCESS:
+        return False, document, document.get("error") or document["status"]
+    return True, document, None
+
+
+def run_job(app, job, browser_pool):
+    """Run a job, on a warm logged-in browser when the bot works against Availity
+
+    Returns None without running the job when it needs a pooled session and
+    none came free; a fresh login would exceed the Availity session limit.
+    """
+    if job.bot_type not in AVAILITY_BOTS or AVAILITY_POOL_SIZE <= 0:
+        driver = start_driver(job.bot_type)
+        try:
+            return run_bot(app, job, driver)
+        finally:
+            release_driver(driver)
+
+    session = browser_pool.checkout(timeout=AVAILITY_CHECKOUT_TIMEOUT) if browser_pool else None
+    if session is None:
+        return None
+
+    record_progress(job.job_id, f"Using pooled Availity session {session.index}")
+    success = False
+    try:
+        success, result, error = run_bot(app, job, session.driver)
+        return success, result, error
+    finally:
+        browser_pool.checkin(session, healthy=success)
+
+
+def pool_size_for(worker_index, worker_count):
+    """This worker's share of the Availity concurrency limit, capped by AVAILITY_POOL_SIZE"""
+    concurrency, _ = portal_limits(PORTAL_AVAILITY)
+    share = concurrency // worker_count + (1 if worker_index < concurrency % worker_count else 0)
+    return min(AVAILITY_POOL_SIZE, share)
+
+
+def worker_loop(worker_index, worker_count=WORKER_COUNT):
+    """Claim and run jobs until the process is told to stop"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s')
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stopping = False
+
+    def handle_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    browser_pool = None
+    availity_backoff_until = 0
+    pool_size = pool_size_for(worker_index, worker_count)
+    if pool_size > 0:
+        browser_pool = AvailityBrowserPool(size=pool_size).start()
+
+    app = create_worker_app()
+    with app.app_context():
+        ensure_job_table()
+        logger.info(f"Worker {worker_id} started with {pool_size} pooled Availity sessions")
+
+        while not stopping:
+            try:
+                # One worker is enough to sweep orphaned jobs
+                if worker_index == 0:
+                    requeue_stale_jobs()
+
+                # With the pool on, Availity jobs wait for a worker with a free pooled session
+                skip_portals = ()
+                if AVAILITY_POOL_SIZE > 0 and (browser_pool is None or time.time() < availity_backoff_until
+                                               or not browser_pool.has_idle_session()):
+                    skip_portals = (PORTAL_AVAILITY,)
+
+                job = claim_next_job(worker_id, skip_portals=skip_portals)
+                if not job:
+                    time.sleep(POLL_INTERVAL)
+                    continue
+
+                logger.info(f"Running {job.bot_type} job {job.job_id} (auth_id {job.auth_id}, attempt {job.attempts})")
+                try:
+                    outcome = run_job(app, job, browser_pool)
+                    if outcome is None:
+                        logger.warning(f"No pooled Availity session free for job {job.job_id}, handing it back")
+                        release_claim(job.job_id, "Re-queued: no logged-in Availity session was free")
+                        availity_backoff_until = time.time() + AVAILITY_CLAIM_BACKOFF
+                        continue
+                    success, result, error = outcome
+                except Exception as e:
+                    success, result, error = False, None, f"Worker error: {e}"
+
+                finish_job(job.job_id, success, result, error)
+                logger.info(f"Job {job.job_id} {'done' if success else 'failed'}{': ' + error if error else ''}")
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Worker loop error: {e}")
+                time.sleep(POLL_INTERVAL)
+
+        if browser_pool:
+            browser_pool.close()
+        locator_registry.save()
+        logger.info(f"Worker {worker_id} stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the RPA job worker pool")
+    parser.add_argument("--workers", type=int, default=WORKER_COUNT, help="number of worker processes")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    processes = {}
+    stopping = False
+
+    def handle_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    # Resolve ChromeDriver once up front; the workers read the cached result
+    versions = resolve_chromedriver()
+    logger.info(f"ChromeDriver {versions['driver_version']} ({versions['source']}), Chrome {versions['browser_version']}")
+
+    logger.info(f"Starting {args.workers} RPA workers")
+    while not stopping:
+        # Start missing workers and replace any that died
+        for index in range(args.workers):
+            process = processes.get(index)
+            if process is None or not process.is_alive():
+                if process is not None:
+                    logger.warning(f"Worker {index} exited with code {process.exitcode}, restarting")
+                process = multiprocessing.Process(target=worker_loop, args=(index, args.workers), name=f"rpa-worker-{index}")
+                process.start()
+                processes[index] = process
+        time.sleep(1)
+
+    for process in processes.values():
+        process.terminate()
+    for process in processes.values():
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Shared fixtures for the RPA tests
+
+The modules live at the repository root, so it is put on sys.path. Tests
+that touch the job, cache or MFA tables get the `app` fixture: an app context
+on an in-memory SQLite database with the RPA tables created, which needs
+Flask-SQLAlchemy. Without the OncoAuth package, oncoauth_models stands in for
+OncoAuth.models.
+"""
+import importlib
+import json
+import os
+import sys
+import types
+from datetime import timedelta
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+sys.path.insert(0, TESTS_DIR)
+
+
+def _install_models_stand_in():
+    try:
+        importlib.import_module("OncoAuth.models")
+        return
+    except ImportError:
+        pass
+    try:
+        import oncoauth_models
+    except ImportError:
+        # No Flask-SQLAlchemy either; the database tests skip themselves
+        return
+    package = types.ModuleType("OncoAuth")
+    package.models = oncoauth_models
+    sys.modules["OncoAuth"] = package
+    sys.modules["OncoAuth.models"] = oncoauth_models
+
+
+_install_models_stand_in()
+
+
+@pytest.fixture
+def app():
+    flask = pytest.importorskip("flask")
+    pytest.importorskip("flask_sqlalchemy")
+    import rpa_jobs
+    from OncoAuth.models import db, Prescrubbing, PatientDetails
+
+    app = flask.Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        rpa_jobs._table_ready = False
+        rpa_jobs.ensure_job_table()
+        PatientDetails.__table__.create(bind=db.engine, checkfirst=True)
+        Prescrubbing.__table__.create(bind=db.engine, checkfirst=True)
+        yield app
+        db.session.remove()
+        db.drop_all()
+        rpa_jobs._table_ready = False
+
+
+def _ago(now, seconds):
+    return now - timedelta(seconds=seconds) if seconds is not None else None
+
+
+@pytest.fixture
+def make_job(app):
+    """Insert an RpaJob; created/started/finished are given as seconds ago"""
+    import rpa_jobs
+    from OncoAuth.models import db
+
+    counter = [0]
+
+    def make(auth_id="A1", status=rpa_jobs.JOB_QUEUED, bot_type=rpa_jobs.BOT_AETNA_PRIOR_AUTH,
+             facility_id="F1", created=None, started=None, finished=None, checkpoint=None):
+        counter[0] += 1
+        now = rpa_jobs.utcnow()
+        job = rpa_jobs.RpaJob(
+            job_id=f"job-{counter[0]}",
+            auth_id=auth_id,
+            bot_type=bot_type,
+            portal=rpa_jobs.BOT_PORTALS[bot_type],
+            facility_id=facility_id,
+            status=status,
+            checkpoint=json.dumps(checkpoint) if checkpoint is not None else None,
+            attempts=0,
+            # Later jobs are newer unless told otherwise
+            created_at=_ago(now, 1000 - counter[0] if created is None else created),
+            started_at=_ago(now, started),
+            finished_at=_ago(now, finished),
+        )
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    return make
@@ -0,0 +1,29 @@
+"""
+Stand-in for OncoAuth.models, used when the OncoAuth package is not installed
+
+Provides the shared Flask-SQLAlchemy db object and the columns of the
+prescrubbing and patient tables that rpa_jobs reads and writes, so the queue,
+cache and MFA tests run on a plain checkout. conftest.py registers it as
+OncoAuth.models only when the real package cannot be imported.
+"""
+from flask_sqlalchemy import SQLAlchemy
+
+db = SQLAlchemy()
+
+
+class PatientDetails(db.Model):
+    __tablename__ = 'patient_details'
+
+    patient_id = db.Column(db.Integer, primary_key=True)
+    facility_id = db.Column(db.Integer)
+    provider_id = db.Column(db.Integer)
+
+
+class Prescrubbing(db.Model):
+    __tablename__ = 'prescrubbing'
+
+    auth_id = db.Column(db.String(64), primary_key=True)
+    patient_id = db.Column(db.Integer)
+    auth_status = db.Column(db.String(50))
+    insurance_validation_status = db.Column(db.String(50))
+    npi_validation_status = db.Column(db.String(50))
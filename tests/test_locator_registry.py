@@ -0,0 +1,134 @@
+import json
+
+import pytest
+
+pytest.importorskip("selenium")
+
+import locator_registry  # noqa: E402
+from locator_registry import locate, winner  # noqa: E402
+
+STRATEGIES = [
+    ("id", ("css selector", "#member")),
+    ("aria", ("xpath", "//input[@aria-label='Member']")),
+    ("nearby_text", ("xpath", "//label[text()='Member']/following::input")),
+]
+
+
+class FakeDriver:
+    """Answers find_elements from a {value: [elements]} map and records the lookups"""
+
+    def __init__(self, matches):
+        self.matches = matches
+        self.lookups = []
+
+    def find_elements(self, by, value):
+        self.lookups.append(value)
+        return list(self.matches.get(value, []))
+
+
+@pytest.fixture(autouse=True)
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(locator_registry, "LOCATOR_FILE", str(tmp_path / "locators.json"))
+    monkeypatch.setattr(locator_registry, "_stats", None)
+    monkeypatch.setattr(locator_registry, "_touched", set())
+    monkeypatch.setattr(locator_registry, "MIN_HITS", 3)
+    monkeypatch.setattr(locator_registry, "RECHECK_EVERY", 20)
+
+
+ARIA_ONLY = {"//input[@aria-label='Member']": ["aria-element"]}
+TEXT_ONLY = {"//label[text()='Member']/following::input": ["text-element"]}
+
+
+def learn(matches, times=3):
+    for _ in range(times):
+        locate(FakeDriver(matches), "member_id", STRATEGIES, probe=0)
+
+
+def test_first_strategy_is_learned_at_once():
+    driver = FakeDriver({"#member": ["id-element"]})
+
+    assert locate(driver, "member_id", STRATEGIES) == "id-element"
+    assert winner("member_id") == "id"
+
+
+def test_lower_strategy_is_learned_after_hits_in_a_row():
+    driver = FakeDriver(ARIA_ONLY)
+
+    assert locate(driver, "member_id", STRATEGIES) == "aria-element"
+    assert driver.lookups == ["#member", "//input[@aria-label='Member']"]
+    assert winner("member_id") is None
+
+    learn(ARIA_ONLY, times=2)
+    assert winner("member_id") == "aria"
+
+
+def test_winner_is_tried_first_next_time():
+    learn(ARIA_ONLY)
+    driver = FakeDriver({"#member": ["id-element"], "//input[@aria-label='Member']": ["aria-element"]})
+
+    assert locate(driver, "member_id", STRATEGIES, probe=0) == "aria-element"
+    assert driver.lookups == ["//input[@aria-label='Member']"]
+
+
+def test_falls_back_when_the_winner_stops_matching():
+    learn(ARIA_ONLY)
+    driver = FakeDriver(TEXT_ONLY)
+
+    assert locate(driver, "member_id", STRATEGIES, probe=0) == "text-element"
+    assert winner("member_id") == "aria"
+
+    learn(TEXT_ONLY, times=2)
+    assert winner("member_id") == "nearby_text"
+    # The new winner is saved for the other bot processes
+    with open(locator_registry.LOCATOR_FILE) as f:
+        saved = json.load(f)["member_id"]
+    assert saved["winner"] == "nearby_text"
+    assert (saved["strategies"]["aria"]["hits"], saved["strategies"]["aria"]["misses"]) == (3, 3)
+
+
+def test_broad_fallback_matching_an_unrendered_page_does_not_take_over():
+    # The specific locator misses once while the form renders; the catch-all matches any button
+    rendering = {"//label[text()='Member']/following::input": ["some-other-button"]}
+    rendered = {"#member": ["id-element"], "//label[text()='Member']/following::input": ["some-other-button"]}
+
+    assert locate(FakeDriver(rendering), "member_id", STRATEGIES) == "some-other-button"
+    assert winner("member_id") is None
+    assert locate(FakeDriver(rendered), "member_id", STRATEGIES) == "id-element"
+    assert winner("member_id") == "id"
+
+
+def test_more_specific_strategy_reclaims_first_place_on_recheck(monkeypatch):
+    monkeypatch.setattr(locator_registry, "RECHECK_EVERY", 2)
+    learn(TEXT_ONLY)
+    both = {"#member": ["id-element"], "//label[text()='Member']/following::input": ["some-other-button"]}
+
+    # The winner keeps its head start until it has had RECHECK_EVERY hits
+    assert locate(FakeDriver(both), "member_id", STRATEGIES, probe=0) == "some-other-button"
+    assert locate(FakeDriver(both), "member_id", STRATEGIES, probe=0) == "some-other-button"
+    assert locate(FakeDriver(both), "member_id", STRATEGIES, probe=0) == "id-element"
+    assert winner("member_id") == "id"
+
+
+def test_accept_filters_the_matched_elements():
+    driver = FakeDriver({"#member": ["hidden"], "//input[@aria-label='Member']": ["visible"]})
+
+    assert locate(driver, "member_id", STRATEGIES, accept=lambda element: element == "visible") == "visible"
+    assert driver.lookups == ["#member", "//input[@aria-label='Member']"]
+
+
+def test_no_match_returns_none_and_keeps_the_winner():
+    locate(FakeDriver({"#member": ["id-element"]}), "member_id", STRATEGIES)
+
+    assert locate(FakeDriver({}), "member_id", STRATEGIES, probe=0) is None
+    assert winner("member_id") == "id"
+
+
+def test_counts_are_saved_without_a_winner_change(monkeypatch):
+    driver = FakeDriver({"#member": ["id-element"]})
+    locate(driver, "member_id", STRATEGIES)
+    monkeypatch.setattr(locator_registry, "SAVE_INTERVAL", 0)
+
+    locate(driver, "member_id", STRATEGIES, probe=0)
+
+    with open(locator_registry.LOCATOR_FILE) as f:
+        assert json.load(f)["member_id"]["strategies"]["id"]["hits"] == 2
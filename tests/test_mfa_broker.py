@@ -0,0 +1,92 @@
+from datetime import timedelta
+
+import pytest
+
+mfa_broker = pytest.importorskip("mfa_broker")
+
+from mfa_broker import MfaSession, MFA_COMPLETED, MFA_PENDING, create_session, get_session, submit_code  # noqa: E402
+from OncoAuth.models import db  # noqa: E402
+from rpa_jobs import utcnow  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def broker(app, monkeypatch):
+    monkeypatch.setattr(mfa_broker, "_table_ready", False)
+    monkeypatch.setattr(mfa_broker, "_sessions", {})
+    monkeypatch.setattr(mfa_broker, "MFA_CODE_REUSE_SECONDS", 120)
+
+
+def test_code_completes_the_named_session():
+    first = create_session("aetna")
+    second = create_session("eligibility")
+
+    session, error = submit_code(" 123 456 ", second["session_id"])
+
+    assert error is None
+    assert session["status"] == MFA_COMPLETED
+    assert session["code"] == "123456"
+    assert get_session(first["session_id"])["status"] == MFA_PENDING
+
+
+@pytest.mark.parametrize("code, session_id, error", [
+    ("123456", None, "session_id is required"),
+    ("12345", "any", "The code must be 6 to 8 digits"),
+    ("12a456", "any", "The code must be 6 to 8 digits"),
+    ("123456", "missing", "Unknown session_id"),
+])
+def test_rejected_submits(code, session_id, error):
+    assert submit_code(code, session_id) == (None, error)
+
+
+def test_a_code_is_used_once():
+    first = create_session("aetna")
+    second = create_session("aetna")
+    submit_code("123456", first["session_id"])
+
+    session, error = submit_code("123456", second["session_id"])
+
+    assert session is None
+    assert "already used" in error
+    assert get_session(second["session_id"])["status"] == MFA_PENDING
+
+
+def test_reuse_window_ends():
+    first = create_session("aetna")
+    submit_code("123456", first["session_id"])
+    MfaSession.query.filter_by(session_id=first["session_id"]).update(
+        {"completed_at": utcnow() - timedelta(seconds=300)}, synchronize_session=False)
+    db.session.commit()
+
+    _, error = submit_code("123456", create_session("aetna")["session_id"])
+
+    assert error is None
+
+
+def test_a_session_takes_one_code():
+    mfa_session = create_session("aetna")
+    submit_code("111111", mfa_session["session_id"])
+
+    assert submit_code("222222", mfa_session["session_id"]) == (None, "The session is already completed")
+    assert get_session(mfa_session["session_id"])["code"] == "111111"
+
+
+def test_submit_racing_another_process_loses():
+    mfa_session = create_session("aetna")
+    # Another app process completed the session; this one still holds it as pending
+    MfaSession.query.filter_by(session_id=mfa_session["session_id"]).update(
+        {"status": MFA_COMPLETED, "code": "111111", "completed_at": utcnow()}, synchronize_session=False)
+    db.session.commit()
+    assert mfa_broker._sessions[mfa_session["session_id"]]["status"] == MFA_PENDING
+
+    assert submit_code("222222", mfa_session["session_id"]) == (None, "The session is already completed")
+    assert get_session(mfa_session["session_id"])["code"] == "111111"
+
+
+def test_expired_session_takes_no_code():
+    mfa_session = create_session("aetna")
+    MfaSession.query.filter_by(session_id=mfa_session["session_id"]).update(
+        {"expires_at": utcnow() - timedelta(seconds=1)}, synchronize_session=False)
+    db.session.commit()
+    mfa_broker._sessions.clear()
+
+    assert submit_code("123456", mfa_session["session_id"]) == (None, "The session is already expired")
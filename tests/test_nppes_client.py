@@ -0,0 +1,72 @@
+import pytest
+
+nppes_client = pytest.importorskip("nppes_client")
+
+import fixture_server  # noqa: E402
+from nppes_client import provider_summary, lookup_provider, search_providers  # noqa: E402
+
+
+def test_summary_of_an_individual():
+    result = {
+        "number": 1234567893,
+        "basic": {"first_name": "ANURADHA", "middle_name": "K", "last_name": "KOLLIPARA",
+                  "credential": "MD", "status": "A"},
+        "taxonomies": [
+            {"desc": "Family Medicine", "primary": False},
+            {"desc": "Internal Medicine", "primary": True},
+        ],
+    }
+
+    assert provider_summary(result) == {
+        "npi": "1234567893",
+        "provider_name": "ANURADHA K KOLLIPARA, MD",
+        "status": "Active",
+        "taxonomy": "Internal Medicine",
+    }
+
+
+def test_summary_of_an_organization_without_a_primary_taxonomy():
+    result = {
+        "number": "1992999999",
+        "basic": {"organization_name": "CITY ONCOLOGY GROUP", "status": "D"},
+        "taxonomies": [{"desc": "Clinic/Center", "primary": False}],
+    }
+
+    summary = provider_summary(result)
+
+    assert summary["provider_name"] == "CITY ONCOLOGY GROUP"
+    assert summary["status"] == "Inactive"
+    assert summary["taxonomy"] == "Clinic/Center"
+
+
+def test_summary_of_a_sparse_result():
+    assert provider_summary({}) == {"npi": "", "provider_name": None, "status": "Unknown", "taxonomy": None}
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    server = fixture_server.start()
+    monkeypatch.setattr(nppes_client, "NPPES_API_URL", f"{server.base_url}/nppes/api/")
+    yield server
+    server.shutdown()
+
+
+def test_lookup_against_the_fixture_registry(registry):
+    assert lookup_provider(" Anuradha ", "kollipara") == ({
+        "npi": "1234567893",
+        "provider_name": "ANURADHA KOLLIPARA, MD",
+        "status": "Active",
+        "taxonomy": "Internal Medicine",
+    }, None)
+    assert lookup_provider("Nobody", "Known") == (None, None)
+    assert [r["number"] for r in search_providers(first_name="J*")] == ["1316943756", "1407852270"]
+
+
+def test_unreachable_registry_is_none(monkeypatch):
+    monkeypatch.setattr(nppes_client, "NPPES_API_URL", "http://127.0.0.1:9/nppes/api/")
+    monkeypatch.setattr(nppes_client, "NPPES_TIMEOUT", (0.5, 0.5))
+    monkeypatch.setattr(nppes_client, "_http", None)
+    monkeypatch.setattr(nppes_client, "NPPES_RETRIES", 0)
+
+    assert search_providers(first_name="Anuradha") is None
+    assert lookup_provider("Anuradha", "Kollipara") == (None, "NPPES registry lookup failed")
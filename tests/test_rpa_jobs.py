@@ -0,0 +1,275 @@
+import pytest
+
+rpa_jobs = pytest.importorskip("rpa_jobs")
+
+from rpa_jobs import (  # noqa: E402
+    JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, PORTAL_AVAILITY, BOT_AVAILITY_ELIGIBILITY,
+    claim_portal_job, claim_next_job, release_claim, find_duplicate_job, submit_job, BOT_AETNA_PRIOR_AUTH, checkpoint_for_job, resolve_uncertain_submit,
+    eligibility_key, eligibility_ttl, cached_eligibility, store_eligibility
+)
+
+
+# ===============================
+# PORTAL LIMITS AND FAIR SHARE
+# ===============================
+@pytest.fixture
+def limits(monkeypatch):
+    def set_limits(concurrency, per_minute):
+        monkeypatch.setenv("RPA_AVAILITY_CONCURRENCY", str(concurrency))
+        monkeypatch.setenv("RPA_AVAILITY_PER_MINUTE", str(per_minute))
+    set_limits(2, 20)
+    return set_limits
+
+
+def test_claim_takes_the_oldest_queued_job(make_job, limits):
+    make_job(auth_id="A1")
+    make_job(auth_id="A2")
+
+    job = claim_portal_job(PORTAL_AVAILITY, "w1")
+
+    assert job.auth_id == "A1"
+    assert job.status == JOB_RUNNING
+    assert job.worker_id == "w1"
+    assert job.attempts == 1
+
+
+def test_claim_respects_the_concurrency_limit(make_job, limits):
+    limits(2, 20)
+    make_job(status=JOB_RUNNING, started=300)
+    make_job(status=JOB_RUNNING, started=300)
+    queued = make_job()
+
+    assert claim_portal_job(PORTAL_AVAILITY, "w1") is None
+    assert rpa_jobs.get_job(queued.job_id).status == JOB_QUEUED
+
+
+def test_claim_respects_the_per_minute_limit(make_job, limits):
+    limits(5, 2)
+    make_job(status=JOB_DONE, started=20, finished=10)
+    make_job(status=JOB_DONE, started=40, finished=30)
+    make_job()
+
+    assert claim_portal_job(PORTAL_AVAILITY, "w1") is None
+
+    limits(5, 3)
+    assert claim_portal_job(PORTAL_AVAILITY, "w1") is not None
+
+
+def test_facility_with_a_running_job_waits_for_the_others(make_job, limits):
+    make_job(facility_id="F1", status=JOB_RUNNING, started=30)
+    make_job(auth_id="older", facility_id="F1")
+    make_job(auth_id="newer", facility_id="F2")
+
+    assert claim_portal_job(PORTAL_AVAILITY, "w1").auth_id == "newer"
+
+
+def test_recent_starts_count_towards_the_fair_share(make_job, limits):
+    for _ in range(3):
+        make_job(facility_id="F1", status=JOB_DONE, started=600, finished=500)
+    make_job(facility_id="F2", status=JOB_DONE, started=600, finished=500)
+    make_job(auth_id="busy", facility_id="F1")
+    make_job(auth_id="quiet", facility_id="F2")
+
+    assert claim_portal_job(PORTAL_AVAILITY, "w1").auth_id == "quiet"
+    assert claim_portal_job(PORTAL_AVAILITY, "w2").auth_id == "busy"
+
+
+def test_a_job_is_claimed_once(make_job, limits):
+    make_job()
+
+    assert claim_portal_job(PORTAL_AVAILITY, "w1") is not None
+    assert claim_portal_job(PORTAL_AVAILITY, "w2") is None
+
+
+def test_skipped_portals_are_left_to_other_workers(make_job, limits):
+    make_job()
+
+    assert claim_next_job("w1", skip_portals=(PORTAL_AVAILITY,)) is None
+    assert claim_next_job("w2").worker_id == "w2"
+
+
+def test_released_claim_goes_back_to_the_queue_without_using_an_attempt(make_job, limits):
+    make_job()
+    job = claim_portal_job(PORTAL_AVAILITY, "w1")
+
+    release_claim(job.job_id, "Re-queued")
+
+    job = rpa_jobs.get_job(job.job_id)
+    assert (job.status, job.worker_id, job.attempts, job.started_at) == (JOB_QUEUED, None, 0, None)
+    assert claim_portal_job(PORTAL_AVAILITY, "w2").attempts == 1
+
+
+# ===============================
+# DUPLICATE REQUESTS
+# ===============================
+@pytest.mark.parametrize("status", [JOB_QUEUED, JOB_RUNNING])
+def test_in_flight_job_is_a_duplicate(make_job, status):
+    job = make_job(status=status)
+
+    assert find_duplicate_job("A1", job.bot_type).job_id == job.job_id
+
+
+def test_recent_success_is_a_duplicate_within_the_window(make_job, monkeypatch):
+    monkeypatch.setattr(rpa_jobs, "IDEMPOTENCY_WINDOW", 300)
+    job = make_job(status=JOB_DONE, finished=60)
+
+    assert find_duplicate_job("A1", job.bot_type).job_id == job.job_id
+
+
+def test_old_success_and_failures_are_not_duplicates(make_job, monkeypatch):
+    monkeypatch.setattr(rpa_jobs, "IDEMPOTENCY_WINDOW", 300)
+    job = make_job(status=JOB_DONE, finished=600)
+    make_job(status=JOB_FAILED, finished=10)
+
+    assert find_duplicate_job("A1", job.bot_type) is None
+
+
+def test_duplicates_are_per_auth_id_and_bot(make_job):
+    job = make_job(status=JOB_QUEUED)
+
+    assert find_duplicate_job("A2", job.bot_type) is None
+    assert find_duplicate_job("A1", BOT_AVAILITY_ELIGIBILITY) is None
+
+
+def test_submit_coalesces_repeat_requests(app):
+    from OncoAuth.models import db, Prescrubbing, PatientDetails
+    db.session.add(PatientDetails(patient_id=7, facility_id=3))
+    db.session.add(Prescrubbing(auth_id="A1", patient_id=7))
+    db.session.commit()
+
+    job, created = submit_job("A1", BOT_AETNA_PRIOR_AUTH, {"member_id": "W1"})
+    again, created_again = submit_job("A1", BOT_AETNA_PRIOR_AUTH, {"member_id": "W1"})
+
+    assert (created, created_again) == (True, False)
+    assert again.job_id == job.job_id
+    assert job.facility_id == "3"
+
+
+# ===============================
+# CHECKPOINTS
+# ===============================
+CHECKPOINT = {"records": {"0": {"last_step": 12, "submitted": False}}}
+
+
+def test_requeued_job_resumes_from_its_own_checkpoint(make_job):
+    make_job(status=JOB_FAILED, finished=60, checkpoint={"records": {}})
+    job = make_job(checkpoint=CHECKPOINT)
+
+    assert checkpoint_for_job(job) == CHECKPOINT
+
+
+def test_new_job_inherits_the_checkpoint_of_the_failed_job_before_it(make_job):
+    make_job(status=JOB_FAILED, finished=60, checkpoint=CHECKPOINT)
+    job = make_job()
+
+    assert checkpoint_for_job(job) == CHECKPOINT
+
+
+def test_failed_job_without_checkpoint_does_not_hide_an_older_one(make_job):
+    make_job(status=JOB_FAILED, finished=120, checkpoint=CHECKPOINT)
+    make_job(status=JOB_FAILED, finished=60)
+    job = make_job()
+
+    assert checkpoint_for_job(job) == CHECKPOINT
+
+
+def test_success_in_between_drops_the_checkpoint(make_job):
+    make_job(status=JOB_FAILED, finished=120, checkpoint=CHECKPOINT)
+    make_job(status=JOB_DONE, finished=60)
+    job = make_job()
+
+    assert checkpoint_for_job(job) is None
+
+
+def test_old_checkpoint_is_not_resumed(make_job, monkeypatch):
+    monkeypatch.setattr(rpa_jobs, "CHECKPOINT_MAX_AGE", 3600)
+    make_job(status=JOB_FAILED, finished=7200, checkpoint=CHECKPOINT)
+    job = make_job()
+
+    assert checkpoint_for_job(job) is None
+
+
+def test_checkpoints_are_per_auth_id(make_job):
+    make_job(auth_id="A2", status=JOB_FAILED, finished=60, checkpoint=CHECKPOINT)
+    job = make_job(auth_id="A1")
+
+    assert checkpoint_for_job(job) is None
+
+
+def test_resolving_an_unknown_submit(make_job):
+    uncertain = {"records": {
+        "0": {"last_step": 17, "submit_uncertain": True, "url": "https://portal/form"},
+        "1": {"last_step": 17, "submit_uncertain": True, "url": "https://portal/form"},
+    }}
+    failed = make_job(status=JOB_FAILED, finished=60, checkpoint=uncertain)
+
+    assert resolve_uncertain_submit(failed.job_id, True, record=0) == 1
+    assert resolve_uncertain_submit(failed.job_id, False) == 1
+    assert resolve_uncertain_submit(failed.job_id, False) == 0
+
+    records = checkpoint_for_job(make_job())["records"]
+    assert records["0"] == {"last_step": 17, "submit_uncertain": False, "submitted": True,
+                            "url": "https://portal/form"}
+    assert records["1"] == {"last_step": 0, "submit_uncertain": False, "submitted": False, "url": None}
+
+
+# ===============================
+# ELIGIBILITY CACHE
+# ===============================
+ELIGIBILITY_REQUEST = {"member_id": " w123456781 ", "patient_dob": "1980-01-15", "payer": "AETNA "}
+
+
+def test_eligibility_key_is_normalized():
+    assert eligibility_key(ELIGIBILITY_REQUEST) == (
+        "W123456781", "1980-01-15", "aetna", "health benefit plan coverage"
+    )
+    assert eligibility_key({"member_id": "W123456781", "patient_dob": "1980-01-15 00:00:00",
+                            "payer": "aetna", "service_type": " Health Benefit Plan Coverage"}) \
+        == eligibility_key(ELIGIBILITY_REQUEST)
+
+
+def test_eligibility_key_separates_service_types():
+    other = dict(ELIGIBILITY_REQUEST, service_type="Physical Therapy")
+
+    assert eligibility_key(other) != eligibility_key(ELIGIBILITY_REQUEST)
+
+
+def test_eligibility_ttl_per_status(monkeypatch):
+    assert eligibility_ttl("ACTIVE_COVERAGE") == 24 * 3600
+    assert eligibility_ttl("INVALID") == 3600
+    assert eligibility_ttl("ERROR") is None
+    assert eligibility_ttl(None) is None
+
+    monkeypatch.setenv("RPA_ELIGIBILITY_TTL_ACTIVE_COVERAGE", "600")
+    assert eligibility_ttl("ACTIVE_COVERAGE") == 600
+
+
+def _result(status, flag=1):
+    return dict(ELIGIBILITY_REQUEST, eligibility_result={"status": status, "flag": flag})
+
+
+def test_cached_answer_is_reused_until_it_expires(app):
+    store_eligibility(_result("ACTIVE_COVERAGE"), job_id="job-1")
+
+    entry = cached_eligibility({"member_id": "W123456781", "patient_dob": "1980-01-15", "payer": "aetna"})
+    assert entry.status == "ACTIVE_COVERAGE"
+    assert entry.job_id == "job-1"
+
+    entry.expires_at = rpa_jobs.utcnow()
+    rpa_jobs.db.session.commit()
+    assert cached_eligibility(ELIGIBILITY_REQUEST) is None
+
+
+def test_a_newer_answer_replaces_the_cached_one(app):
+    store_eligibility(_result("ACTIVE_COVERAGE"))
+    store_eligibility(_result("MEMBER_INACTIVE", flag=0))
+
+    entry = cached_eligibility(ELIGIBILITY_REQUEST)
+    assert entry.status == "MEMBER_INACTIVE"
+    assert rpa_jobs.EligibilityCacheEntry.query.count() == 1
+
+
+def test_uncertain_answers_are_not_cached(app):
+    assert store_eligibility(_result("ERROR", flag=None)) is None
+    assert store_eligibility(dict(_result("ACTIVE_COVERAGE"), member_id="")) is None
+    assert cached_eligibility(ELIGIBILITY_REQUEST) is None